@@ -0,0 +1,116 @@
+# analysis.py
+import os
+import csv
+import logging
+import datetime
+from typing import Optional, Dict
+
+from sqlalchemy import and_, bindparam, func, select, text
+
+import store
+from models import Bonus, SiteRun
+from processing import CONTENT_FIELDS
+
+NEW = "New"
+USED = "Used"
+CHANGED = "Persistent (Changed)"
+UNCHANGED = "Persistent (Unchanged)"
+
+REPORT_FIELDS = ["status", "url", "merchant_name", "id", "name", "amount", "changed_fields"]
+
+# Only sites whose bonus list was fetched on both days are compared: a site
+# that failed or was skipped this run has not lost its bonuses. New and
+# changed rows come off ix_bonuses_run_date_changed (store.upsert_bonuses
+# flags each row against the site's previous run when writing it), so their
+# cost follows the number of such rows; Used rows are the previous day's rows
+# of this run's sites with no match today, probed through
+# uq_bonuses_run_date_url_id.
+_bonuses, _runs = Bonus.__table__, SiteRun.__table__
+_cur, _prev = _bonuses.alias("c"), _bonuses.alias("p")
+_PERSISTENT = _cur.join(_prev, and_(_prev.c.run_date == bindparam("prev"), _prev.c.url == _cur.c.url, _prev.c.id == _cur.c.id))
+
+def _report_columns(t):
+    return [t.c.url, t.c.merchant_name, t.c.id, t.c.name, t.c.amount]
+
+def _fetched_on(conn, day_param: str, day: str, url):
+    """Condition: url's bonus list was fetched on day (for days from before site runs were recorded: url had rows)."""
+    tracked = conn.execute(select(_runs.c.url).where(_runs.c.run_date == day).limit(1)).first() is not None
+    source = _runs.alias("s") if tracked else _bonuses.alias("s")
+    return select(source.c.url).where(source.c.run_date == bindparam(day_param), source.c.url == url).exists()
+
+def _queries(conn, cur: str, prev: str):
+    """(new, used, changed, unchanged rows, unchanged count) for cur against prev."""
+    new = select(*_report_columns(_cur)).where(_cur.c.run_date == bindparam("cur"), _cur.c.changed.is_(None),
+                                               _fetched_on(conn, "prev", prev, _cur.c.url))
+    in_cur = select(_cur.c.id).where(_cur.c.run_date == bindparam("cur"), _cur.c.url == _prev.c.url, _cur.c.id == _prev.c.id).exists()
+    used = select(*_report_columns(_prev)).where(_prev.c.run_date == bindparam("prev"), _fetched_on(conn, "cur", cur, _prev.c.url), ~in_cur)
+    changed = (
+        select(*_report_columns(_cur), *[_cur.c[f].label(f"cur_{f}") for f in CONTENT_FIELDS],
+               *[_prev.c[f].label(f"prev_{f}") for f in CONTENT_FIELDS])
+        .select_from(_PERSISTENT).where(_cur.c.run_date == bindparam("cur"), _cur.c.changed.is_(True))
+    )
+    unchanged = select(*_report_columns(_cur)).select_from(_PERSISTENT).where(_cur.c.run_date == bindparam("cur"), _cur.c.changed.is_(False))
+    # Counted per site off the index, then kept for the sites fetched on prev.
+    per_site = (select(_cur.c.url, func.count().label("n")).where(_cur.c.run_date == bindparam("cur"), _cur.c.changed.is_(False))
+                .group_by(_cur.c.url).subquery())
+    unchanged_count = select(func.coalesce(func.sum(per_site.c.n), 0)).where(_fetched_on(conn, "prev", prev, per_site.c.url))
+    return new, used, changed, unchanged, unchanged_count
+
+def previous_run_date(db_url: str, run_date: str) -> Optional[str]:
+    """Returns the most recent run date stored before run_date, if any."""
+    with store.get_engine(db_url).connect() as conn:
+        return conn.execute(text("SELECT MAX(d) FROM (SELECT MAX(run_date) AS d FROM bonuses WHERE run_date < :d "
+                                 "UNION ALL SELECT MAX(run_date) FROM site_runs WHERE run_date < :d)"), {"d": run_date}).scalar()
+
+def generate_comparison_report(db_url: str, report_dir: str, logger: logging.Logger, run_date: Optional[datetime.date] = None,
+                               include_unchanged: bool = False) -> Optional[str]:
+    """
+    Classifies the bonuses of run_date against the previous stored run as New,
+    Used (gone since the previous run) or Persistent (changed/unchanged), for
+    the sites whose bonus list was fetched on both days, and
+    writes comparison_report_[YYYY-MM-DD].csv. Only New, Used and changed rows
+    are materialized unless include_unchanged is set; unchanged rows are counted.
+    Returns the report path, or None if there was nothing to compare.
+    """
+    cur = (run_date or datetime.date.today()).isoformat()
+    try:
+        prev = previous_run_date(db_url, cur)
+        if prev is None:
+            logger.info("comparison_report_skip", extra={"run_date": cur, "reason": "no previous run"})
+            return None
+
+        os.makedirs(report_dir, exist_ok=True)
+        report_path = os.path.join(report_dir, f"comparison_report_{cur}.csv")
+        counts: Dict[str, int] = {NEW: 0, USED: 0, CHANGED: 0, UNCHANGED: 0}
+        params = {"cur": cur, "prev": prev}
+
+        with store.get_engine(db_url).connect() as conn, open(report_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+
+            new, used, changed, unchanged, unchanged_count = _queries(conn, cur, prev)
+            for status, query in ((NEW, new), (USED, used)):
+                for row in conn.execute(query, params).mappings():
+                    writer.writerow({"status": status, "changed_fields": "", **row})
+                    counts[status] += 1
+
+            for row in conn.execute(changed, params).mappings():
+                fields = [f for f in CONTENT_FIELDS if row[f"cur_{f}"] != row[f"prev_{f}"]]
+                writer.writerow({"status": CHANGED, "changed_fields": ";".join(fields), **{f: row[f] for f in REPORT_FIELDS[1:-1]}})
+                counts[CHANGED] += 1
+
+            if include_unchanged:
+                for row in conn.execute(unchanged, params).mappings():
+                    writer.writerow({"status": UNCHANGED, "changed_fields": "", **row})
+                    counts[UNCHANGED] += 1
+            else:
+                counts[UNCHANGED] = conn.execute(unchanged_count, params).scalar()
+
+        logger.info("comparison_report_done", extra={
+            "path": report_path, "run_date": cur, "previous": prev,
+            "new": counts[NEW], "used": counts[USED], "changed": counts[CHANGED], "unchanged": counts[UNCHANGED],
+        })
+        return report_path
+    except Exception as e:
+        logger.error("comparison_report_fail", extra={"run_date": cur, "err": str(e)})
+        return None
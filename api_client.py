@@ -1,19 +1,73 @@
 import aiohttp, logging, asyncio
-from typing import Optional, List, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from models import AuthData
+import json_codec
+import metrics
 
-async def get_bonuses(auth: AuthData, session: aiohttp.ClientSession, logger: logging.Logger) -> Optional[List[Dict[str, Any]]]:
+# The only parts of a syncData response the pipeline reads; the rest (user
+# profile, banners, ...) is skipped without being decoded.
+SYNC_SPEC = {"status": None, "data": {"bonus": None, "promotions": None}}
+
+async def get_bonuses(auth: AuthData, session: aiohttp.ClientSession, logger: logging.Logger,
+                      max_bytes: int = json_codec.DEFAULT_MAX_BYTES, incremental: bool = False,
+                      proxy: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
     payload = {"module": "/users/syncData", "merchantId": auth.merchant_id, "accessId": auth.access_id, "accessToken": auth.token}
-    try:
-        async with session.post(auth.api_url, data=payload, proxy=None, timeout=15, ssl=False) as response:
-            response.raise_for_status()
-            res_json = await response.json()
+    with metrics.registry.stage("sync_data") as stage:
+        try:
+            async with session.post(auth.api_url, data=payload, proxy=proxy, timeout=15, ssl=False) as response:
+                response.raise_for_status()
+                body = await json_codec.read_body(response, max_bytes)
+                res_json = json_codec.select(body, SYNC_SPEC) if incremental else json_codec.loads(body)
+                if res_json.get("status") != "SUCCESS":
+                    if incremental:
+                        res_json = json_codec.loads(body)  # full payload for the failure reason and log
+                    stage.outcome = metrics.status_outcome(res_json)
+                    logger.warning("bonus_api_status_fail", extra={"url": auth.api_url, "response": res_json})
+                    return None
+                bonus_l = res_json.get("data", {}).get("bonus", [])
+                promo_l = res_json.get("data", {}).get("promotions", [])
+                return (bonus_l if isinstance(bonus_l, list) else []) + (promo_l if isinstance(promo_l, list) else [])
+        except Exception as e:
+            stage.outcome = metrics.exception_outcome(e)
+            logger.error("bonus_fetch_fail", extra={"url": auth.api_url, "err": str(e)})
+            return None
+
+async def get_downlines(auth: AuthData, session: aiohttp.ClientSession, logger: logging.Logger,
+                        max_bytes: int = json_codec.DEFAULT_MAX_BYTES, page_delay: float = 0.5, max_pages: int = 200,
+                        throttle: Optional[Callable[[], Awaitable[None]]] = None, proxy: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Pages /referrer/getDownline (level 1) under an existing login until a page
+    is empty or only repeats rows already seen. None if the first page fails;
+    a later failure keeps the pages fetched so far. throttle is awaited before
+    each page (the account's request budget).
+    """
+    items: List[Dict[str, Any]] = []
+    seen = set()
+    for page in range(max_pages):
+        if page:
+            await asyncio.sleep(page_delay)
+        if throttle:
+            await throttle()
+        payload = {"level": "1", "pageIndex": str(page), "module": "/referrer/getDownline", "merchantId": auth.merchant_id,
+                   "domainId": "0", "accessId": auth.access_id, "accessToken": auth.token, "walletIsAdmin": "True"}
+        with metrics.registry.stage("downline_page") as stage:
+            try:
+                async with session.post(auth.api_url, data=payload, proxy=proxy, timeout=15, ssl=False) as response:
+                    response.raise_for_status()
+                    res_json = await json_codec.read_json(response, max_bytes)
+            except Exception as e:
+                stage.outcome = metrics.exception_outcome(e)
+                logger.error("downline_fetch_fail", extra={"url": auth.api_url, "page": page, "err": str(e)})
+                return items if page else None
             if res_json.get("status") != "SUCCESS":
-                logger.warning("bonus_api_status_fail", extra={"url": auth.api_url, "response": res_json})
-                return None
-            bonus_l = res_json.get("data", {}).get("bonus", [])
-            promo_l = res_json.get("data", {}).get("promotions", [])
-            return (bonus_l if isinstance(bonus_l, list) else []) + (promo_l if isinstance(promo_l, list) else [])
-    except Exception as e:
-        logger.error("bonus_fetch_fail", extra={"url": auth.api_url, "err": str(e)})
-        return None
\ No newline at end of file
+                stage.outcome = metrics.status_outcome(res_json)
+                logger.warning("downline_api_status_fail", extra={"url": auth.api_url, "page": page, "response": res_json})
+                return items if page else None
+            rows = (res_json.get("data") or {}).get("downlines", [])
+            new = [d for d in rows if isinstance(d, dict) and (d.get("id"), d.get("registerDateTime")) not in seen] if isinstance(rows, list) else []
+            if not new:
+                stage.outcome = "empty"
+                return items
+            seen.update((d.get("id"), d.get("registerDateTime")) for d in new)
+            items += new
+    return items
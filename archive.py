@@ -0,0 +1,231 @@
+# archive.py
+import argparse
+import datetime
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Index, ForeignKey, create_engine, inspect, select, delete, text
+from sqlalchemy.engine import Engine, Connection
+
+import store
+from models import Bonus, REPEATED_STRING_FIELDS
+
+# Excel caps a sheet at 1,048,576 rows; one is taken by the header.
+XLSX_MAX_ROWS = 1_048_575
+CHUNK_SIZE = 5000
+
+# SQLite caps bound parameters per statement; stay well under it for IN lists.
+IN_CHUNK = 500
+
+archive_metadata = MetaData()
+# Dictionary for the repeated free-text columns: each distinct value is stored
+# once and bonus_archive rows hold its string_id in <column>_sid.
+archive_strings = Table(
+    "archive_strings", archive_metadata,
+    Column("string_id", Integer, primary_key=True, autoincrement=True),
+    Column("value", String, nullable=False, unique=True),
+)
+
+def _archive_column(column: Column) -> Column:
+    if column.name in REPEATED_STRING_FIELDS:
+        return Column(f"{column.name}_sid", Integer, ForeignKey("archive_strings.string_id"))
+    return Column(column.name, column.type)
+
+bonus_archive = Table(
+    "bonus_archive", archive_metadata,
+    Column("archive_id", Integer, primary_key=True, autoincrement=True),
+    *[_archive_column(c) for c in Bonus.__table__.columns if c.name != "db_id"],
+)
+Index("ix_bonus_archive_run_date", bonus_archive.c.run_date)
+Index("ix_bonus_archive_merchant_id", bonus_archive.c.merchant_name, bonus_archive.c.id)
+
+# Logical (decoded) archive columns: the Bonus columns minus db_id.
+ARCHIVE_FIELDS = [c.name for c in Bonus.__table__.columns if c.name != "db_id"]
+
+_engines: Dict[str, Engine] = {}
+
+def _archive_engine(archive_url: str) -> Engine:
+    engine = _engines.get(archive_url)
+    if engine is None:
+        engine = create_engine(archive_url)
+        _migrate_plain_archive(engine)
+        archive_metadata.create_all(engine)
+        _add_missing_columns(engine)
+        _engines[archive_url] = engine
+    return engine
+
+def _add_missing_columns(engine: Engine):
+    """Adds bonus_archive columns that Bonus gained after the archive was created; rows already archived keep NULL."""
+    existing = {c["name"] for c in inspect(engine).get_columns("bonus_archive")}
+    missing = [c for c in bonus_archive.columns if c.name not in existing]
+    with engine.begin() as conn:
+        for column in missing:
+            col_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE bonus_archive ADD COLUMN {column.name} {col_type}"))
+            logging.getLogger("slapdotred_scraper").info("archive_migrate_add_column", extra={"column": column.name})
+
+class StringDictionary:
+    """value <-> string_id mapping for archive_strings, cached for the life of one archive/export call."""
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.ids: Dict[str, int] = {}
+
+    def _lookup(self, values):
+        values = list(values)
+        for i in range(0, len(values), IN_CHUNK):
+            chunk = values[i:i + IN_CHUNK]
+            self.ids.update(self.conn.execute(
+                select(archive_strings.c.value, archive_strings.c.string_id).where(archive_strings.c.value.in_(chunk))
+            ).all())
+
+    def encode(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replaces repeated string fields with <field>_sid ids, adding unseen values to the dictionary."""
+        missing = {str(r[f]) for r in rows for f in REPEATED_STRING_FIELDS if r.get(f) is not None} - self.ids.keys()
+        if missing:
+            self._lookup(missing)
+            new = missing - self.ids.keys()
+            if new:
+                self.conn.execute(archive_strings.insert(), [{"value": v} for v in sorted(new)])
+                self._lookup(new)
+        encoded = []
+        for r in rows:
+            row = {k: v for k, v in r.items() if k not in REPEATED_STRING_FIELDS}
+            for f in REPEATED_STRING_FIELDS:
+                row[f"{f}_sid"] = None if r.get(f) is None else self.ids[str(r[f])]
+            encoded.append(row)
+        return encoded
+
+def decoded_select():
+    """SELECT over bonus_archive yielding ARCHIVE_FIELDS, with dictionary ids joined back to their strings."""
+    columns, source = [], bonus_archive
+    for name in ARCHIVE_FIELDS:
+        if name in REPEATED_STRING_FIELDS:
+            strings = archive_strings.alias(f"s_{name}")
+            source = source.outerjoin(strings, strings.c.string_id == bonus_archive.c[f"{name}_sid"])
+            columns.append(strings.c.value.label(name))
+        else:
+            columns.append(bonus_archive.c[name])
+    return select(*columns).select_from(source)
+
+def _migrate_plain_archive(engine: Engine):
+    """
+    Re-encodes an archive written before dictionary encoding (plain text
+    columns), in chunks. Only the columns the plain table has are copied; later
+    Bonus columns stay NULL for its rows. The rename, copy and drop are one
+    transaction, so a failed migration leaves the plain archive as it was.
+    """
+    inspector = inspect(engine)
+    if "bonus_archive" not in inspector.get_table_names():
+        return
+    existing = {c["name"] for c in inspector.get_columns("bonus_archive")}
+    if "raw_claim_config" not in existing:
+        return
+    legacy = Table("bonus_archive_plain", MetaData(), Column("archive_id", Integer, primary_key=True),
+                   *[Column(name, Bonus.__table__.c[name].type) for name in ARCHIVE_FIELDS if name in existing])
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # pysqlite only opens a transaction before DML; without this the DDL below autocommits.
+            conn.exec_driver_sql("BEGIN")
+        for ix in inspector.get_indexes("bonus_archive"):
+            conn.execute(text(f"DROP INDEX {ix['name']}"))
+        conn.execute(text("ALTER TABLE bonus_archive RENAME TO bonus_archive_plain"))
+        archive_metadata.create_all(conn)
+        strings, last_id, copied = StringDictionary(conn), 0, 0
+        while True:
+            rows = conn.execute(
+                select(legacy).where(legacy.c.archive_id > last_id).order_by(legacy.c.archive_id).limit(CHUNK_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            conn.execute(bonus_archive.insert(), strings.encode([dict(r) for r in rows]))
+            last_id = rows[-1]["archive_id"]
+            copied += len(rows)
+        conn.execute(text("DROP TABLE bonus_archive_plain"))
+    logging.getLogger("slapdotred_scraper").info("archive_migrate_dictionary", extra={"rows": copied})
+
+def archive_run(db_url: str, archive_url: str, logger: logging.Logger, run_date: Optional[datetime.date] = None) -> int:
+    """
+    Appends one day's bonuses to the archive table.
+    Re-archiving the same day replaces only that day's partition; earlier days
+    are never touched. Rows are copied in chunks. Returns the number archived.
+    """
+    day = (run_date or datetime.date.today()).isoformat()
+    src = Bonus.__table__
+    query = select(*[src.c[name] for name in ARCHIVE_FIELDS]).where(src.c.run_date == day).order_by(src.c.db_id)
+
+    archived = 0
+    try:
+        target = _archive_engine(archive_url)
+        with store.get_engine(db_url).connect() as src_conn, target.begin() as dst_conn:
+            dst_conn.execute(delete(bonus_archive).where(bonus_archive.c.run_date == day))
+            strings = StringDictionary(dst_conn)
+            result = src_conn.execution_options(stream_results=True).execute(query)
+            while True:
+                rows = result.mappings().fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                dst_conn.execute(bonus_archive.insert(), strings.encode([dict(r) for r in rows]))
+                archived += len(rows)
+        logger.info("archive_run_done", extra={"run_date": day, "rows": archived, "archive": archive_url})
+    except Exception as e:
+        logger.error("archive_run_fail", extra={"run_date": day, "err": str(e)})
+    return archived
+
+def export_xlsx(archive_url: str, start: datetime.date, end: datetime.date, out_path: str, logger: logging.Logger) -> int:
+    """
+    Streams archived days in [start, end] to an xlsx workbook with one sheet per
+    day named MM-DD. Uses openpyxl's write-only mode and chunked cursors, so
+    memory stays flat regardless of range size. Days over Excel's row limit
+    continue on 'MM-DD (2)', etc. Returns the number of rows exported.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    exported = 0
+    query = (
+        decoded_select()
+        .where(bonus_archive.c.run_date >= start.isoformat(), bonus_archive.c.run_date <= end.isoformat())
+        .order_by(bonus_archive.c.run_date, bonus_archive.c.archive_id)
+    )
+    with _archive_engine(archive_url).connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(query)
+        ws, day, part, rows_in_sheet = None, None, 0, 0
+        while True:
+            rows = result.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                row_day = row.run_date
+                if row_day != day or rows_in_sheet >= XLSX_MAX_ROWS:
+                    part = part + 1 if row_day == day else 1
+                    day = row_day
+                    title = day[5:] if part == 1 else f"{day[5:]} ({part})"
+                    if start.year != end.year:
+                        title = f"{day[2:4]}-{title}"
+                    ws = wb.create_sheet(title=title)
+                    ws.append(ARCHIVE_FIELDS)
+                    rows_in_sheet = 0
+                ws.append(list(row))
+                rows_in_sheet += 1
+                exported += 1
+
+    if ws is None:
+        wb.create_sheet(title="empty").append(ARCHIVE_FIELDS)
+    wb.save(out_path)
+    logger.info("archive_export_done", extra={"path": out_path, "rows": exported, "start": start.isoformat(), "end": end.isoformat()})
+    return exported
+
+if __name__ == "__main__":
+    import config
+
+    parser = argparse.ArgumentParser(description="Export the historical bonus archive to xlsx.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True, help="First day, YYYY-MM-DD.")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, help="Last day, YYYY-MM-DD (default: --start).")
+    parser.add_argument("--out", default="data/historical_bonuses.xlsx", help="Output workbook path.")
+    args = parser.parse_args()
+
+    app_config = config.get_config()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    archive_url = app_config.get("archive", "archive_connection_string", fallback="sqlite:///data/historical_bonuses.db")
+    count = export_xlsx(archive_url, args.start, args.end or args.start, args.out, logging.getLogger(__name__))
+    print(f"Exported {count} rows to {args.out}")
@@ -1,49 +1,80 @@
-# auth.py 
+# auth.py
 import configparser, logging, re, time, asyncio
-from typing import Optional, Deque
+from typing import Optional, Deque, Tuple
 from pydantic import ValidationError
 import aiohttp
 from models import AuthData
+import json_codec
+import metrics
 
-async def get_auth(url: str, config: configparser.ConfigParser, logger: logging.Logger, session: aiohttp.ClientSession, request_tracker: Deque[float]) -> Optional[AuthData]:
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+async def fetch_landing(url: str, logger: logging.Logger, session: aiohttp.ClientSession, request_tracker: Deque[float],
+                        proxy: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """Fetches the landing page and returns (merchant_id, merchant_name), or None."""
     request_tracker.append(time.time())
-    
-    try:
-        async with session.get(url, headers=headers, proxy=None, timeout=15, ssl=False) as response:
-            response.raise_for_status()
-            html = await response.text()
-            if not html:
-                logger.warning("auth_html_empty", extra={"url": url})
-                return None
-            match = re.search(r'var MERCHANTID = (\d+);', html, re.IGNORECASE)
-            if not match:
-                logger.warning("auth_merch_id_fail", extra={"url": url})
-                return None
-            merchant_id = match.group(1)
-            merchant_name_match = re.search(r'var MERCHANTNAME = ["\'](.*?)["\'];', html, re.IGNORECASE)
-            merchant_name = merchant_name_match.group(1) if merchant_name_match else ""
-    except Exception as e:
-        logger.error("auth_html_fetch_fail", extra={"url": url, "err": str(e)})
-        return None
 
+    with metrics.registry.stage("landing_fetch") as stage:
+        try:
+            async with session.get(url, headers=HEADERS, proxy=proxy, timeout=15, ssl=False) as response:
+                response.raise_for_status()
+                html = await response.text()
+                if not html:
+                    stage.outcome = "empty"
+                    logger.warning("auth_html_empty", extra={"url": url})
+                    return None
+                match = re.search(r'var MERCHANTID = (\d+);', html, re.IGNORECASE)
+                if not match:
+                    stage.outcome = "no_merchant_id"
+                    logger.warning("auth_merch_id_fail", extra={"url": url})
+                    return None
+                merchant_id = match.group(1)
+                merchant_name_match = re.search(r'var MERCHANTNAME = ["\'](.*?)["\'];', html, re.IGNORECASE)
+                return merchant_id, (merchant_name_match.group(1) if merchant_name_match else "")
+        except Exception as e:
+            stage.outcome = metrics.exception_outcome(e)
+            logger.error("auth_html_fetch_fail", extra={"url": url, "err": str(e)})
+            return None
+
+async def login(url: str, merchant_id: str, merchant_name: str, config: configparser.ConfigParser, logger: logging.Logger,
+                session: aiohttp.ClientSession, credentials: Optional[Tuple[str, str]] = None, proxy: Optional[str] = None) -> Optional[AuthData]:
+    """Logs in to url's API for merchant_id, as credentials (username, password) or the [auth] account."""
+    auth_data, _ = await login_with_outcome(url, merchant_id, merchant_name, config, logger, session, credentials, proxy)
+    return auth_data
+
+async def login_with_outcome(url: str, merchant_id: str, merchant_name: str, config: configparser.ConfigParser, logger: logging.Logger,
+                             session: aiohttp.ClientSession, credentials: Optional[Tuple[str, str]] = None,
+                             proxy: Optional[str] = None) -> Tuple[Optional[AuthData], str]:
+    """login, plus the stage outcome (ok, captcha, invalid_login, timeout, ...) so callers can judge the account."""
     api_url = f"{url}/api/v1/index.php"
-    payload = {"module": "/users/login", "mobile": config.get('auth', 'username'), "password": config.get('auth', 'password'), "merchantId": merchant_id}
-    
-    try:
-        async with session.post(api_url, data=payload, headers=headers, proxy=None, timeout=15, ssl=False) as response:
-            response.raise_for_status()
-            res_json = await response.json()
-            if res_json.get("status") != "SUCCESS":
-                logger.warning("auth_api_status_fail", extra={"url": api_url, "response": res_json})
-                return None
-            auth_payload = {
-                "merchant_id": merchant_id, "merchant_name": merchant_name,
-                "access_id": res_json.get("data", {}).get("id"),
-                "token": res_json.get("data", {}).get("token"),
-                "api_url": api_url
-            }
-            return AuthData.model_validate(auth_payload)
-    except Exception as e:
-        logger.error("auth_api_request_fail", extra={"url": api_url, "err": str(e)})
-        return None
\ No newline at end of file
+    max_bytes = config.getint('scraper', 'max_response_bytes', fallback=json_codec.DEFAULT_MAX_BYTES)
+    username, password = credentials or (config.get('auth', 'username'), config.get('auth', 'password'))
+    payload = {"module": "/users/login", "mobile": username, "password": password, "merchantId": merchant_id}
+
+    with metrics.registry.stage("login") as stage:
+        try:
+            async with session.post(api_url, data=payload, headers=HEADERS, proxy=proxy, timeout=15, ssl=False) as response:
+                response.raise_for_status()
+                res_json = await json_codec.read_json(response, max_bytes)
+                if res_json.get("status") != "SUCCESS":
+                    stage.outcome = metrics.status_outcome(res_json)
+                    logger.warning("auth_api_status_fail", extra={"url": api_url, "response": res_json})
+                    return None, stage.outcome
+                auth_payload = {
+                    "merchant_id": merchant_id, "merchant_name": merchant_name,
+                    "access_id": res_json.get("data", {}).get("id"),
+                    "token": res_json.get("data", {}).get("token"),
+                    "api_url": api_url
+                }
+                return AuthData.model_validate(auth_payload), stage.outcome
+        except Exception as e:
+            stage.outcome = metrics.exception_outcome(e)
+            logger.error("auth_api_request_fail", extra={"url": api_url, "err": str(e)})
+            return None, stage.outcome
+
+async def get_auth(url: str, config: configparser.ConfigParser, logger: logging.Logger, session: aiohttp.ClientSession, request_tracker: Deque[float],
+                   proxy: Optional[str] = None) -> Optional[AuthData]:
+    landing = await fetch_landing(url, logger, session, request_tracker, proxy)
+    if not landing:
+        return None
+    return await login(url, *landing, config, logger, session, proxy=proxy)
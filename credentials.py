@@ -0,0 +1,159 @@
+# credentials.py
+"""
+Pool of login accounts. Merchants are assigned to accounts by consistent
+hashing, so each merchant keeps logging in with the same account (and its
+cached token) and adding or removing an account only moves ~1/N of them.
+Every account has its own request budget (token bucket) and is put on
+cooldown after repeated credential rejections; the next account on the ring
+takes over meanwhile. Captchas, rate limits and other IP-level refusals are
+the proxy pool's to judge (proxies.PROXY_FAULTS), not the account's.
+
+The accounts come from a secrets file kept out of config.ini:
+
+    [account:main]
+    username = 0400000000
+    password = secret
+    requests_per_minute = 60   ; 0 = unlimited
+
+Without one, the pool is the single [auth] account.
+"""
+import asyncio
+import bisect
+import configparser
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+
+# Login outcomes that say something about the account rather than the site or the exit IP.
+ACCOUNT_FAULTS = frozenset({"invalid_login"})
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], "big")
+
+class Account:
+    def __init__(self, name: str, username: str, password: str, requests_per_minute: float = 0.0,
+                 clock=time.monotonic):
+        self.name, self.username, self.password = name, username, password
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(requests_per_minute, 1.0)
+        self.tokens = self.capacity
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.clock = clock
+        self._updated = clock()
+
+    @property
+    def credentials(self) -> Tuple[str, str]:
+        return self.username, self.password
+
+    def cooling_down(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else self.clock()) < self.cooldown_until
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def spend(self, n: float = 1.0):
+        """Waits until the account's budget allows n more requests, then takes them."""
+        if not self.rate:
+            return
+        while True:
+            now = self.clock()
+            self._refill(now)
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            await asyncio.sleep((n - self.tokens) / self.rate)
+
+class CredentialPool:
+    """
+    Consistent-hash ring of accounts (replicas virtual nodes each) plus a
+    token cache keyed by (account, merchant_id, proxy route), valid for token_ttl
+    seconds of clock. Cooldowns run on each account's own clock.
+    """
+    def __init__(self, accounts: List[Account], replicas: int = 64, cooldown: float = 300.0,
+                 failures_before_cooldown: int = 3, token_ttl: float = 1800.0, registry: Optional[metrics.Registry] = None,
+                 clock=time.monotonic):
+        if not accounts:
+            raise ValueError("Credential pool needs at least one account")
+        self.accounts = {a.name: a for a in accounts}
+        self.cooldown, self.failures_before_cooldown, self.token_ttl = cooldown, failures_before_cooldown, token_ttl
+        self.clock = clock
+        self._ring = sorted((_hash(f"{a.name}#{i}"), a.name) for a in accounts for i in range(replicas))
+        self._points = [point for point, _ in self._ring]
+        self._tokens: Dict[Tuple[str, str, Optional[str]], Tuple[object, float]] = {}
+        registry = registry or metrics.registry
+        self._logins = registry.counter("scraper_account_logins_total", "Logins per pool account by outcome.")
+        self._cached = registry.counter("scraper_account_token_reuse_total", "Logins avoided by the per-(account, merchant) token cache.")
+
+    def candidates(self, key: str) -> Iterator[Account]:
+        """Distinct accounts clockwise from key's ring position: the owner first, then its fallbacks."""
+        start = bisect.bisect(self._points, _hash(key))
+        seen = set()
+        for i in range(len(self._ring)):
+            name = self._ring[(start + i) % len(self._ring)][1]
+            if name not in seen:
+                seen.add(name)
+                yield self.accounts[name]
+                if len(seen) == len(self.accounts):
+                    return
+
+    def available(self, key: str) -> List[Account]:
+        return [a for a in self.candidates(key) if not a.cooling_down()]
+
+    def cached_token(self, account: Account, merchant_id: str, route: Optional[str] = None):
+        """route: the proxy the token was issued through; a token is only reused from the same exit IP."""
+        entry = self._tokens.get((account.name, merchant_id, route))
+        if entry and self.clock() - entry[1] < self.token_ttl:
+            self._cached.inc(account=account.name)
+            return entry[0]
+        return None
+
+    def store_token(self, account: Account, merchant_id: str, auth_data, route: Optional[str] = None):
+        self._tokens[(account.name, merchant_id, route)] = (auth_data, self.clock())
+
+    def drop_token(self, account: Account, merchant_id: str, route: Optional[str] = None):
+        self._tokens.pop((account.name, merchant_id, route), None)
+
+    def report_login(self, account: Account, outcome: str, logger: logging.Logger):
+        self._logins.inc(account=account.name, outcome=outcome)
+        if outcome == metrics.OK:
+            account.failures = 0
+            return
+        if outcome not in ACCOUNT_FAULTS:
+            return
+        account.failures += 1
+        if account.failures >= self.failures_before_cooldown:
+            account.cooldown_until = account.clock() + self.cooldown
+            account.failures = 0
+            logger.warning("account_cooldown", extra={"account": account.name, "outcome": outcome, "seconds": self.cooldown})
+
+def load_pool(config: configparser.ConfigParser, logger: logging.Logger) -> CredentialPool:
+    """Accounts from [auth] accounts_file when set (and readable), else the single [auth] account."""
+    rpm = config.getfloat('auth', 'requests_per_minute', fallback=0.0)
+    accounts: List[Account] = []
+    path = config.get('auth', 'accounts_file', fallback='').strip()
+    if path:
+        secrets = configparser.ConfigParser(inline_comment_prefixes=(';', '#'))
+        if not os.path.exists(path) or not secrets.read(path):
+            logger.error(f"Accounts file not found or unreadable: {path}; using the [auth] account.")
+        for section in secrets.sections():
+            if not section.startswith("account:"):
+                continue
+            try:
+                accounts.append(Account(section[len("account:"):], secrets.get(section, 'username'), secrets.get(section, 'password'),
+                                        secrets.getfloat(section, 'requests_per_minute', fallback=rpm)))
+            except (configparser.Error, ValueError) as e:
+                logger.error(f"Skipping account [{section}] in {path}: {e}")
+    if not accounts:
+        accounts.append(Account("default", config.get('auth', 'username'), config.get('auth', 'password'), rpm))
+    return CredentialPool(
+        accounts,
+        cooldown=config.getfloat('auth', 'login_cooldown', fallback=300.0),
+        failures_before_cooldown=config.getint('auth', 'failures_before_cooldown', fallback=3),
+        token_ttl=config.getfloat('auth', 'token_ttl', fallback=1800.0),
+    )
@@ -0,0 +1,163 @@
+# daemon.py
+"""
+Continuous mode (`main.py --daemon`): instead of one pass over urls.txt, every
+site is re-scraped when it falls due, on an interval that follows its own
+rate of change (scheduler.update_interval). Due times live in a min-heap;
+the URL list is re-read when the file changes; SIGINT/SIGTERM stop new work
+and let in-flight sites finish.
+"""
+import asyncio
+import datetime
+import heapq
+import logging
+import os
+import signal
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import io_handler
+
+def install_signal_handlers(stop: asyncio.Event, logger: logging.Logger):
+    loop = asyncio.get_running_loop()
+
+    def request_stop(sig):
+        if not stop.is_set():
+            logger.info("daemon_stop_requested", extra={"signal": sig.name})
+        stop.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, request_stop, sig)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows / not the main thread: Ctrl+C still raises KeyboardInterrupt.
+
+class SiteDaemon:
+    """
+    Keeps (next_due, rank, url) in a min-heap and starts each site's task when
+    it is due; concurrency is left to the site limiter. A site is back in the
+    heap only once its task has finished, so it never runs twice at once.
+    Due times persist in the run cache ("next_due", epoch seconds), so a
+    restart resumes the schedule instead of re-scraping everything.
+    """
+    def __init__(self, url_path: str, run_site: Callable[[str], Awaitable[None]], cache: dict, logger: logging.Logger,
+                 order: Callable[[List[str]], List[str]] = list, initial_interval: float = 3600.0,
+                 reload_interval: float = 30.0, checkpoint_interval: float = 300.0, grace: float = 30.0,
+                 on_checkpoint: Optional[Callable[[], None]] = None,
+                 on_day_end: Optional[Callable[[datetime.date], Awaitable[None]]] = None,
+                 clock: Callable[[], float] = time.time):
+        self.url_path, self.run_site, self.cache, self.logger = url_path, run_site, cache, logger
+        self.order, self.initial_interval = order, initial_interval
+        self.reload_interval, self.checkpoint_interval, self.grace = reload_interval, checkpoint_interval, grace
+        self.on_checkpoint, self.on_day_end, self.clock = on_checkpoint, on_day_end, clock
+        self.urls: Set[str] = set()
+        self.heap: List[Tuple[float, int, str]] = []
+        self.running: Dict[asyncio.Task, str] = {}
+        self.completed = 0
+        self._mtime: Optional[float] = None
+        self._rank = 0
+        self._wakeup = asyncio.Event()
+
+    def _entry(self, url: str) -> dict:
+        return self.cache.setdefault("sites", {}).get(url) or {}
+
+    def _push(self, url: str, due: float):
+        heapq.heappush(self.heap, (due, self._rank, url))
+        self._rank += 1
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-reads the URL list if the file changed; returns True when it did."""
+        try:
+            mtime = os.stat(self.url_path).st_mtime
+        except OSError:
+            mtime = None
+        if not force and mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        urls = self.order([u.strip() for u in io_handler.load_urls(self.url_path, self.logger)])
+        added = [u for u in urls if u not in self.urls]
+        removed = self.urls - set(urls)
+        self.urls = set(urls)
+        now = self.clock()
+        for url in added:
+            if url not in self.running.values():
+                self._push(url, self._entry(url).get("next_due", now))
+        if removed:
+            # Heap entries of removed sites are dropped lazily when popped.
+            self.heap = [item for item in self.heap if item[2] in self.urls]
+            heapq.heapify(self.heap)
+        if added or removed:
+            self.logger.info("daemon_urls_loaded", extra={"total": len(self.urls), "added": len(added), "removed": len(removed)})
+        return True
+
+    def _finished(self, task: asyncio.Task):
+        url = self.running.pop(task)
+        self.completed += 1
+        if url in self.urls:
+            entry = self._entry(url)
+            due = self.clock() + entry.get("interval", self.initial_interval)
+            if entry:
+                entry["next_due"] = round(due, 1)
+            self._push(url, due)
+            # The loop may be sleeping on an empty heap; let it see the new due time.
+            self._wakeup.set()
+
+    def _dispatch(self, now: float) -> int:
+        started = 0
+        while self.heap and self.heap[0][0] <= now:
+            _, _, url = heapq.heappop(self.heap)
+            if url not in self.urls:
+                continue
+            task = asyncio.get_running_loop().create_task(self.run_site(url), name=f"site:{url}")
+            self.running[task] = url
+            task.add_done_callback(self._finished)
+            started += 1
+        return started
+
+    async def run(self, stop: asyncio.Event, deadline: Optional[float] = None):
+        """Runs until stop is set (or the monotonic deadline passes), then drains in-flight sites."""
+        self.reload(force=True)
+        next_reload = next_checkpoint = time.monotonic()
+        next_checkpoint += self.checkpoint_interval
+        day = datetime.date.today()
+        while not stop.is_set():
+            mono = time.monotonic()
+            if deadline is not None and mono >= deadline:
+                self.logger.warning("time_budget_reached", extra={"completed": self.completed})
+                break
+            if mono >= next_reload:
+                self.reload()
+                next_reload = mono + self.reload_interval
+            if mono >= next_checkpoint:
+                if self.on_checkpoint:
+                    self.on_checkpoint()
+                next_checkpoint = mono + self.checkpoint_interval
+            today = datetime.date.today()
+            if today != day:
+                if self.on_day_end:
+                    await self.on_day_end(day)
+                day = today
+
+            now = self.clock()
+            self._dispatch(now)
+            wake = min(next_reload, next_checkpoint) - time.monotonic()
+            if self.heap:
+                wake = min(wake, self.heap[0][0] - now)
+            if deadline is not None:
+                wake = min(wake, deadline - time.monotonic())
+            self._wakeup.clear()
+            waiters = [asyncio.ensure_future(stop.wait()), asyncio.ensure_future(self._wakeup.wait())]
+            await asyncio.wait(waiters, timeout=max(wake, 0.01), return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+        await self.drain()
+
+    async def drain(self):
+        """Waits up to grace seconds for in-flight sites, then cancels the rest."""
+        if not self.running:
+            return
+        self.logger.info("daemon_draining", extra={"in_flight": len(self.running), "grace_seconds": self.grace})
+        tasks = list(self.running)
+        _, pending = await asyncio.wait(tasks, timeout=self.grace)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,201 @@
+# events.py
+"""
+Change events for downstream consumers, so they need not poll the CSV/SQLite
+output and diff it themselves. After each site's bonuses are processed they
+are diffed against that site's previous bonus set:
+
+  added    a bonus id not seen on the site before ("bonus": its fields)
+  changed  same id, different content ("changes": {field: [old, new]})
+  removed  an id that is gone from a successful scrape ("bonus": last fields)
+
+Events are appended to a JSONL changelog. Every line carries "offset", the
+byte position it starts at, which is also the consumer's cursor: reading
+resumes with a seek, not a scan. The same lines are pushed live to clients of
+a Unix socket. A client sends one JSON line first: {"since": <offset>} to
+replay everything after that event (-1: from the beginning) and then follow
+live, or {} to follow live only. A client that falls behind by more than
+queue_size events is disconnected and resumes from its cursor.
+
+The per-site bonus sets are saved with the run cache checkpoints; a crash in
+between re-emits those events on the next run (at-least-once).
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import socket
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from processing import CONTENT_FIELDS
+
+def resume_position(path: str, since: Optional[int] = None) -> int:
+    """Byte position just past the event at offset since (0 for None or -1)."""
+    if since is None or since < 0:
+        return 0
+    with open(path, "rb") as f:
+        f.seek(since)
+        line = f.readline()
+    try:
+        valid = line.endswith(b"\n") and json.loads(line).get("offset") == since
+    except ValueError:
+        valid = False
+    if not valid:
+        raise ValueError(f"{since} is not an event offset in {path}")
+    return since + len(line)
+
+def tail(path: str, position: int) -> Iterator[Tuple[int, bytes]]:
+    """(offset, line) of each complete event from byte position on."""
+    with open(path, "rb") as f:
+        f.seek(position)
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                return  # end of file, or a line still being written
+            yield offset, line
+
+def read_events(path: str, since: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """(offset, line) of each complete event after the one at offset since (all of them for None or -1)."""
+    return tail(path, resume_position(path, since))
+
+def diff(previous: Dict[str, dict], current: Dict[str, dict]) -> List[dict]:
+    """Events turning previous into current; both map bonus id -> {"hash", "fields"}."""
+    out = []
+    for bonus_id, entry in current.items():
+        old = previous.get(bonus_id)
+        if old is None:
+            out.append({"type": "added", "id": bonus_id, "bonus": entry["fields"]})
+        elif old["hash"] != entry["hash"]:
+            changes = {f: [old["fields"].get(f), v] for f, v in entry["fields"].items() if old["fields"].get(f) != v}
+            out.append({"type": "changed", "id": bonus_id, "name": entry["fields"].get("name"), "changes": changes})
+    for bonus_id, old in previous.items():
+        if bonus_id not in current:
+            out.append({"type": "removed", "id": bonus_id, "bonus": old["fields"]})
+    return out
+
+class _Subscriber:
+    def __init__(self, writer: asyncio.StreamWriter, queue_size: int):
+        self.writer = writer
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.task = asyncio.current_task()
+
+class ChangeFeed:
+    def __init__(self, changelog_path: str, state_path: str, logger: logging.Logger, queue_size: int = 1000,
+                 registry: Optional[metrics.Registry] = None):
+        self.changelog_path, self.state_path, self.logger = changelog_path, state_path, logger
+        self.queue_size = queue_size
+        self.sites: Dict[str, Dict[str, dict]] = {}
+        self.dirty = False
+        self._file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._socket_path: Optional[str] = None
+        self._subscribers: Set[_Subscriber] = set()
+        self._events = (registry or metrics.registry).counter("scraper_change_events_total", "Bonus change events by type.")
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self.sites = json.load(f)["sites"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Without the previous sets every bonus is re-announced as added, never lost.
+            self.logger.warning("events_state_load_fail", extra={"path": self.state_path, "err": str(e)})
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f"{self.state_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"sites": self.sites}, f)
+            os.replace(tmp, self.state_path)
+            self.dirty = False
+        except OSError as e:
+            self.logger.error("events_state_save_fail", extra={"path": self.state_path, "err": str(e)})
+
+    def publish(self, url: str, bonuses, run_date: datetime.date) -> List[dict]:
+        """Diffs a successful scrape of url against its previous bonus set, appends and pushes the events."""
+        current = {str(b.id): {"hash": b.content_hash, "fields": {f: getattr(b, f) for f in CONTENT_FIELDS}} for b in bonuses}
+        merchant = next((b.merchant_name for b in bonuses), None)
+        events = diff(self.sites.get(url, {}), current)
+        if not events:
+            return []
+        self.sites[url] = current
+        self.dirty = True
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.changelog_path) or ".", exist_ok=True)
+            self._file = open(self.changelog_path, "ab")
+        ts = datetime.datetime.now().isoformat(timespec="seconds")
+        lines = []
+        for event in events:
+            event.update(offset=self._file.tell(), ts=ts, run_date=run_date.isoformat(), url=url, merchant_name=merchant)
+            line = (json.dumps(event, default=str) + "\n").encode("utf-8")
+            self._file.write(line)
+            lines.append((event["offset"], line))
+            self._events.inc(type=event["type"])
+        self._file.flush()
+        for sub in list(self._subscribers):
+            for item in lines:
+                try:
+                    sub.queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    self.logger.warning("events_subscriber_lagging", extra={"queue_size": self.queue_size})
+                    self._subscribers.discard(sub)
+                    sub.task.cancel()
+                    break
+        return events
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        sub = _Subscriber(writer, self.queue_size)
+        try:
+            request = json.loads(await asyncio.wait_for(reader.readline(), 10) or b"{}")
+            since = request.get("since")
+            # Subscribe before replaying so nothing appended meanwhile is missed.
+            self._subscribers.add(sub)
+            last = -1
+            if since is not None and os.path.exists(self.changelog_path):
+                for offset, line in read_events(self.changelog_path, since):
+                    writer.write(line)
+                    await writer.drain()
+                    last = offset
+            while True:
+                offset, line = await sub.queue.get()
+                if offset > last:
+                    writer.write(line)
+                    await writer.drain()
+        except (ValueError, AttributeError) as e:
+            writer.write((json.dumps({"error": str(e)}) + "\n").encode("utf-8"))
+        except (asyncio.TimeoutError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._subscribers.discard(sub)
+            writer.close()
+
+    async def serve(self, socket_path: str):
+        if not hasattr(socket, "AF_UNIX"):
+            self.logger.warning("events_socket_unsupported", extra={"path": socket_path})
+            return
+        os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left over from a run that did not shut down
+        self._server = await asyncio.start_unix_server(self._client, path=socket_path)
+        self._socket_path = socket_path
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            for sub in list(self._subscribers):
+                sub.task.cancel()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+        if self._file:
+            self._file.close()
+            self._file = None
+        self.save()
@@ -1,13 +1,18 @@
 import os
 import csv
+import json
+import uuid
+import time
 import logging
-from typing import List
+import datetime
+import operator
+import functools
+from typing import TYPE_CHECKING, List, Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
-
-from models import Bonus, Base
+# SQLAlchemy (via models) and pyarrow are imported inside the writers that need
+# them, so load_urls and a run with nothing to write stay cheap to start.
+if TYPE_CHECKING:
+    from models import Bonus
 
 def load_urls(file_path: str, logger: logging.Logger) -> List[str]:
     """Loads URLs from a text file."""
@@ -21,68 +26,366 @@ def load_urls(file_path: str, logger: logging.Logger) -> List[str]:
         logger.error(f"Failed to read URL file: {e}")
         return []
 
-def write_bonuses_to_csv(bonuses: List[Bonus], csv_path: str, logger: logging.Logger):
+class CsvSink:
     """
-    Correctly serializes detached SQLAlchemy objects and writes them to a CSV file.
+    Run-long CSV writer: the file is opened once with a large buffer, the
+    header and row getter are computed once per file, and buffered rows are
+    flushed every flush_interval seconds and fsynced on close.
+
+    With roll_daily, rows for day D go to <dir>/D_<name> (data/bonuses.csv ->
+    data/2025-06-17_bonuses.csv, the legacy bonus.py naming) and the sink
+    switches files when the date changes. An existing file keeps its header,
+    even from an older schema, and rows are appended in that layout.
     """
-    if not bonuses:
-        logger.info("No bonuses to write to CSV.")
-        return
+    def __init__(self, csv_path: str, logger: logging.Logger, roll_daily: bool = True,
+                 buffer_size: int = 1 << 20, flush_interval: float = 5.0, clock=datetime.date.today):
+        self.csv_path, self.logger, self.roll_daily = csv_path, logger, roll_daily
+        self.buffer_size, self.flush_interval, self.clock = buffer_size, flush_interval, clock
+        self.path: Optional[str] = None
+        self._file = None
+        self._writer = None
+        self._getter = None
+        self._day: Optional[datetime.date] = None
+        self._last_flush = 0.0
+        self.rows_written = 0
 
-    try:
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-        
-        # Get headers from the SQLAlchemy model's table columns
+    def path_for(self, day: datetime.date) -> str:
+        if not self.roll_daily:
+            return self.csv_path
+        directory, name = os.path.split(self.csv_path)
+        return os.path.join(directory, f"{day.isoformat()}_{name}")
+
+    def _open(self, day: datetime.date):
+        from models import Bonus
+        self.close()
+        self.path, self._day = self.path_for(day), day
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
         field_names = [c.name for c in Bonus.__table__.columns]
-        file_exists = os.path.isfile(csv_path) and os.path.getsize(csv_path) > 0
-        
-        # Create a list of clean dictionaries from the detached objects
-        rows_to_write = []
-        for bonus in bonuses:
-            row_dict = bonus.__dict__.copy()
-            # Remove the internal SQLAlchemy state key before writing
-            row_dict.pop('_sa_instance_state', None)
-            rows_to_write.append(row_dict)
-
-        with open(csv_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=field_names, extrasaction='ignore')
-            if not file_exists:
-                writer.writeheader()
-            writer.writerows(rows_to_write)
-        
-        logger.info(f"Successfully wrote {len(bonuses)} bonuses to {csv_path}")
+        file_exists = os.path.isfile(self.path) and os.path.getsize(self.path) > 0
+        if file_exists:
+            with open(self.path, 'r', newline='', encoding='utf-8') as f:
+                field_names = next(csv.reader(f), None) or field_names
+        known = set(Bonus.__table__.columns.keys())
+        if all(name in known for name in field_names):
+            self._getter = operator.attrgetter(*field_names)
+        else:
+            self._getter = lambda b: tuple(getattr(b, name, None) for name in field_names)
+        self._file = open(self.path, 'a', newline='', encoding='utf-8', buffering=self.buffer_size)
+        self._writer = csv.writer(self._file)
+        if not file_exists:
+            self._writer.writerow(field_names)
+        self._last_flush = time.monotonic()
 
-    except Exception as e:
-        logger.error(f"CSV write failed: {e}")
+    def write(self, bonuses: List["Bonus"]) -> bool:
+        if not bonuses:
+            return True
+        try:
+            day = self.clock()
+            if self._file is None or (self.roll_daily and day != self._day):
+                self._open(day)
+            getter = self._getter
+            self._writer.writerows(getter(b) for b in bonuses)
+            self.rows_written += len(bonuses)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+            return True
+        except Exception as e:
+            self.logger.error(f"CSV write failed: {e}")
+            return False
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flushes and fsyncs the current file."""
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.logger.info(f"Successfully wrote {self.rows_written} bonuses to {self.path}")
+        finally:
+            self._file.close()
+            self._file = self._writer = None
+            self.rows_written = 0
 
-def write_bonuses_to_db(bonuses: List[Bonus], db_url: str, logger: logging.Logger):
-    """Writes a list of Bonus model objects to the database."""
+def write_bonuses_to_csv(bonuses: List["Bonus"], csv_path: str, logger: logging.Logger) -> bool:
+    """
+    One-shot append of a batch to csv_path (no daily roll). Long runs should
+    keep a CsvSink open instead.
+    """
     if not bonuses:
+        logger.info("No bonuses to write to CSV.")
+        return True
+    sink = CsvSink(csv_path, logger, roll_daily=False)
+    ok = sink.write(bonuses)
+    try:
+        sink.close()
+    except OSError as e:
+        logger.error(f"CSV write failed: {e}")
+        return False
+    return ok
+
+DOWNLINE_FIELDS = ["url", "id", "name", "count", "amount", "register_date_time"]
+
+class DownlineSink:
+    """
+    Appends downline rows to one CSV in the legacy downline.py layout. Rows
+    already in the file are skipped; their keys are read once, when the sink
+    first writes, rather than on every site.
+    """
+    def __init__(self, csv_path: str, logger: logging.Logger):
+        self.path, self.logger = csv_path, logger
+        self._file = self._writer = None
+        self._keys = set()
+        self.rows_written = 0
+
+    @staticmethod
+    def _key(row) -> tuple:
+        try:
+            amount = f"{float(row['amount'] or 0.0):.2f}"
+        except ValueError:
+            amount = "0.00"
+        return (row['url'], str(row['id']), row['name'], str(row['count']), amount, row['register_date_time'])
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                self._keys = {self._key(row) for row in csv.DictReader(f) if all(k in row for k in DOWNLINE_FIELDS)}
+            new_file = False
+        else:
+            new_file = True
+        self._file = open(self.path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=DOWNLINE_FIELDS)
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, rows: List[dict]) -> bool:
+        try:
+            if self._file is None:
+                self._open()
+            new = []
+            for row in rows:
+                key = self._key(row)
+                if key not in self._keys:
+                    self._keys.add(key)
+                    new.append(row)
+            self._writer.writerows(new)
+            self.rows_written += len(new)
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.error(f"Downline CSV write failed: {e}")
+            return False
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.logger.info(f"Successfully wrote {self.rows_written} downlines to {self.path}")
+        finally:
+            self._file.close()
+            self._file = self._writer = None
+
+def write_bonuses_to_db(bonuses: List["Bonus"], db_url: str, logger: logging.Logger, run_date: Optional[datetime.date] = None,
+                        site_url: Optional[str] = None) -> bool:
+    """
+    Upserts a list of Bonus model objects into the database, keyed on
+    (run_date, url, id) so repeated runs on the same day don't duplicate rows.
+    With site_url, the list is that site's complete fetch, possibly empty, and
+    is recorded as a site run in the same transaction.
+    """
+    if not bonuses and site_url is None:
         logger.info("No bonuses to write to database.")
-        return
+        return True
     
     try:
-        engine = create_engine(db_url)
-        Base.metadata.create_all(engine)
-        Session = sessionmaker(bind=engine)
-        session = Session()
+        from sqlalchemy.exc import SQLAlchemyError
+        import store
+        engine = store.get_engine(db_url)
     except Exception as e:
-        logger.error(f"DB engine/session creation failed: {e}")
-        return
+        logger.error(f"DB engine creation failed: {e}")
+        return False
+
+    run_date_str = (run_date or datetime.date.today()).isoformat()
+    now = datetime.datetime.utcnow()
+    rows = {}
+    for bonus in bonuses:
+        if bonus.run_date is None:
+            bonus.run_date = run_date_str
+        row = store.bonus_row(bonus, now)
+        # The API occasionally lists a bonus twice; the last copy wins.
+        rows[(row["url"], row["id"])] = row
 
     try:
-        # Use merge to prevent errors with objects that might already exist
-        # in the session from a different context.
-        for bonus in bonuses:
-            session.merge(bonus)
-        session.commit()
-        logger.info(f"Wrote {len(bonuses)} bonuses to database.")
+        with engine.begin() as conn:
+            if rows:
+                store.upsert_bonuses(conn, list(rows.values()))
+            if site_url is not None:
+                store.record_site_run(conn, site_url, run_date_str, len(rows), now)
+        logger.info(f"Wrote {len(rows)} bonuses to database.")
+        return True
     except SQLAlchemyError as e:
         logger.error(f"DB write failed: {e}")
-        session.rollback()
-    finally:
-        session.close()
+        return False
+
+@functools.lru_cache(maxsize=None)
+def _bonus_arrow_schema():
+    """
+    Builds the Parquet schema from the Bonus model's table columns. Repeated
+    free-text columns are Arrow dictionary columns, so they stay
+    dictionary-encoded in memory when read back, not only on disk.
+    """
+    import pyarrow as pa
+    from sqlalchemy import Integer, Float, Boolean, DateTime
+    from models import Bonus, REPEATED_STRING_FIELDS
+
+    fields = []
+    for c in Bonus.__table__.columns:
+        if c.name == 'db_id':
+            continue
+        if isinstance(c.type, Boolean): pa_type = pa.bool_()
+        elif isinstance(c.type, Integer): pa_type = pa.int64()
+        elif isinstance(c.type, Float): pa_type = pa.float64()
+        elif isinstance(c.type, DateTime): pa_type = pa.timestamp('us')
+        elif c.name in REPEATED_STRING_FIELDS: pa_type = pa.dictionary(pa.int32(), pa.string())
+        else: pa_type = pa.string()
+        fields.append(pa.field(c.name, pa_type, nullable=True))
+    return pa.schema(fields)
+
+# Partition value for bonuses without a merchant name, rather than an empty merchant_name= directory.
+UNKNOWN_MERCHANT = "__unknown__"
+
+class ParquetSink:
+    """
+    Run-long Parquet writer for a dataset partitioned by run date and merchant
+    (hive layout: run_date=YYYY-MM-DD/merchant_name=NAME/part-*.parquet).
+    Rows are buffered column-wise and written on close, one file per partition
+    per run, so daily scrapes of hundreds of sites do not leave a small file
+    per site in every partition. A daemon hands each day's rows to detach()
+    and keeps writing.
+    """
+    def __init__(self, parquet_path: str, logger: logging.Logger):
+        self.parquet_path, self.logger = parquet_path, logger
+        self._columns = None
+        self.rows_buffered = 0
+
+    def write(self, bonuses: List["Bonus"], run_date: Optional[datetime.date] = None) -> bool:
+        if not bonuses:
+            return True
+        try:
+            if self._columns is None:
+                self._columns = {f.name: [] for f in _bonus_arrow_schema()}
+            day = (run_date or datetime.date.today()).isoformat()
+            now = datetime.datetime.utcnow()
+            for name, values in self._columns.items():
+                if name == 'run_date':
+                    values.extend([day] * len(bonuses))
+                elif name == 'merchant_name':
+                    values.extend(b.merchant_name or UNKNOWN_MERCHANT for b in bonuses)
+                elif name in ('created_at', 'updated_at'):
+                    values.extend(getattr(b, name) or now for b in bonuses)
+                else:
+                    values.extend(getattr(b, name) for b in bonuses)
+            self.rows_buffered += len(bonuses)
+            return True
+        except ImportError:
+            self.logger.error("Parquet output enabled but pyarrow is not installed.")
+            return False
+
+    def detach(self) -> "ParquetSink":
+        """Moves the buffered rows to a new sink (to be closed off the event loop) and starts over empty."""
+        other = ParquetSink(self.parquet_path, self.logger)
+        other._columns, other.rows_buffered = self._columns, self.rows_buffered
+        self._columns, self.rows_buffered = None, 0
+        return other
+
+    def close(self) -> bool:
+        """Writes the buffered rows, one file per (run_date, merchant_name) partition."""
+        if self._columns is None:
+            return True
+        columns, rows, self._columns, self.rows_buffered = self._columns, self.rows_buffered, None, 0
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pydict(columns, schema=_bonus_arrow_schema())
+            # Sorted, each partition's rows arrive together and its file is opened once.
+            table = table.sort_by([('run_date', 'ascending'), ('merchant_name', 'ascending')])
+            pq.write_to_dataset(
+                table, root_path=self.parquet_path, partition_cols=['run_date', 'merchant_name'],
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore',
+            )
+            self.logger.info(f"Wrote {rows} bonuses to Parquet dataset {self.parquet_path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Parquet write failed: {e}")
+            return False
 
-# Dummy cache functions for compatibility
-def load_run_cache(logger: logging.Logger): return {}
-def save_run_cache(data: dict, logger: logging.Logger): pass
\ No newline at end of file
+def write_bonuses_to_parquet(bonuses: List["Bonus"], parquet_path: str, logger: logging.Logger, run_date: Optional[datetime.date] = None) -> bool:
+    """
+    One-shot write of a batch to the Parquet dataset at parquet_path. Long runs
+    should keep a ParquetSink open instead.
+    """
+    if not bonuses:
+        logger.info("No bonuses to write to Parquet.")
+        return True
+    sink = ParquetSink(parquet_path, logger)
+    return sink.write(bonuses, run_date) and sink.close()
+
+def read_bonuses_from_parquet(parquet_path: str, columns: Optional[List[str]] = None, filters=None):
+    """
+    Reads the Parquet dataset as a pyarrow Table. Only the requested columns are
+    decoded, and filters on run_date/merchant_name prune whole partitions, e.g.
+    filters=[('run_date', '>=', '2025-06-01'), ('merchant_name', '=', 'ACME')].
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = _bonus_arrow_schema()
+    partitioning = ds.partitioning(pa.schema([schema.field('run_date'), schema.field('merchant_name')]), flavor='hive')
+    dataset = ds.dataset(parquet_path, format='parquet', partitioning=partitioning)
+    expression = None
+    for column, op, value in filters or []:
+        field = ds.field(column)
+        term = {'=': field == value, '==': field == value, '!=': field != value, '<': field < value,
+                '<=': field <= value, '>': field > value, '>=': field >= value, 'in': field.isin(value)}[op]
+        expression = term if expression is None else expression & term
+    return dataset.to_table(columns=columns, filter=expression)
+
+CACHE_FILE_PATH = "data/run_metrics_cache.json"
+
+def load_run_cache(logger: logging.Logger, path: str = CACHE_FILE_PATH) -> dict:
+    """Loads the per-site run history (bonus.py's run_metrics_cache.json layout); empty when missing or malformed."""
+    default_cache = {"total_script_runs": 0, "sites": {}}
+    if not os.path.exists(path):
+        return default_cache
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data.get("sites"), dict):
+            logger.warning(f"Run cache {path} is malformed; starting a new one.")
+            return default_cache
+        data.setdefault("total_script_runs", 0)
+        return data
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to load run cache {path}: {e}")
+        return default_cache
+
+def save_run_cache(data: dict, logger: logging.Logger, path: str = CACHE_FILE_PATH) -> bool:
+    """Writes the run cache atomically (temp file + rename)."""
+    tmp = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp, path)
+        return True
+    except OSError as e:
+        logger.error(f"Failed to save run cache {path}: {e}")
+        return False
\ No newline at end of file
@@ -0,0 +1,145 @@
+# json_codec.py
+"""
+JSON decoding for API responses: orjson on raw bytes when installed (stdlib
+json otherwise), a size-capped body reader, and a selective decoder that only
+materializes the keys it is asked for. dumps is the matching encoder for the
+read API's responses.
+"""
+import json
+import re
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+    loads = orjson.loads
+    BACKEND = "orjson"
+except ImportError:
+    orjson = None
+    loads = json.loads
+    BACKEND = "json"
+
+def _default(value: Any) -> Any:
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON as bytes; dates and datetimes as ISO 8601 with either backend."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+
+# Syncs with large promotion lists (embedded HTML) run to a few MB; anything
+# past this is a broken or hostile endpoint.
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+class BodyTooLarge(ValueError):
+    outcome = "too_large"
+
+    def __init__(self, limit: int, seen: int):
+        super().__init__(f"Response body exceeds {limit} bytes (got at least {seen})")
+        self.limit, self.seen = limit, seen
+
+async def read_body(response, max_bytes: int = DEFAULT_MAX_BYTES) -> bytes:
+    """Reads an aiohttp response body as bytes, aborting once it passes max_bytes."""
+    if response.content_length is not None and response.content_length > max_bytes:
+        raise BodyTooLarge(max_bytes, response.content_length)
+    buf = bytearray()
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise BodyTooLarge(max_bytes, len(buf))
+    return bytes(buf)
+
+async def read_json(response, max_bytes: int = DEFAULT_MAX_BYTES, spec: Optional[Dict[str, Any]] = None) -> Any:
+    """Size-capped body read plus decode; with spec, only the selected keys are decoded (see select)."""
+    body = await read_body(response, max_bytes)
+    return select(body, spec) if spec is not None else loads(body)
+
+# The next quote or bracket. Strings are crossed with bytes.find and brackets
+# counted in a plain loop: no pattern can backtrack, so a truncated or
+# malformed body fails in time linear in its length.
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_SCALAR = re.compile(rb'[^,\]}\s]*')
+_WS = re.compile(rb'\s*')
+
+def _string_end(buf: bytes, pos: int) -> int:
+    """End offset of the JSON string whose opening quote is at pos."""
+    end = pos
+    while True:
+        end = buf.find(b'"', end + 1)
+        if end < 0:
+            raise ValueError(f"Unterminated JSON string at offset {pos}")
+        escape = end
+        while buf[escape - 1] == 0x5C:  # backslash
+            escape -= 1
+        if (end - escape) % 2 == 0:
+            return end + 1
+
+def _skip_value(buf: bytes, pos: int) -> int:
+    """End offset of the JSON value starting at pos, without decoding it."""
+    first = buf[pos:pos + 1]
+    if first == b'"':
+        return _string_end(buf, pos)
+    if first not in (b"{", b"["):
+        return _SCALAR.match(buf, pos).end()
+    depth = 0
+    while True:
+        m = _STRUCTURAL.search(buf, pos)
+        if not m:
+            raise ValueError(f"Unterminated JSON value at offset {pos}")
+        tok = m.group()
+        if tok == b'"':
+            pos = _string_end(buf, m.start())
+            continue
+        depth += 1 if tok in (b"{", b"[") else -1
+        if not depth:
+            return m.end()
+        pos = m.end()
+
+def _select_object(buf: bytes, pos: int, spec: Dict[str, Any], out: Dict[str, Any]) -> int:
+    if buf[pos:pos + 1] != b"{":
+        return _skip_value(buf, pos)
+    pos = _WS.match(buf, pos + 1).end()
+    if buf[pos:pos + 1] == b"}":
+        return pos + 1
+    while True:
+        if buf[pos:pos + 1] != b'"':
+            raise ValueError(f"Expected object key at offset {pos}")
+        end = _string_end(buf, pos)
+        key = loads(buf[pos:end])
+        pos = _WS.match(buf, end).end()
+        if buf[pos:pos + 1] != b":":
+            raise ValueError(f"Expected ':' at offset {pos}")
+        pos = _WS.match(buf, pos + 1).end()
+        sub = spec.get(key, False)
+        if sub is False:
+            pos = _skip_value(buf, pos)
+        elif isinstance(sub, dict) and buf[pos:pos + 1] == b"{":
+            out[key] = {}
+            pos = _select_object(buf, pos, sub, out[key])
+        else:
+            end = _skip_value(buf, pos)
+            out[key] = loads(buf[pos:end])
+            pos = end
+        pos = _WS.match(buf, pos).end()
+        sep = buf[pos:pos + 1]
+        if sep == b"}":
+            return pos + 1
+        if sep != b",":
+            raise ValueError(f"Expected ',' or '}}' at offset {pos}")
+        pos = _WS.match(buf, pos + 1).end()
+
+def select(buf: bytes, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decodes only the parts of a JSON object named in spec, e.g.
+      select(body, {"status": None, "data": {"bonus": None, "promotions": None}})
+    A None leaf decodes that value whole; a dict descends into an object.
+    Unselected values are skipped by offset and never turned into Python
+    objects. Missing keys are simply absent from the result.
+    """
+    out: Dict[str, Any] = {}
+    pos = _WS.match(buf, 0).end()
+    if buf[pos:pos + 1] != b"{":
+        raise ValueError("Expected a JSON object")
+    _select_object(buf, pos, spec, out)
+    return out
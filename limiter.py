@@ -0,0 +1,153 @@
+# limiter.py
+import asyncio
+import collections
+import contextlib
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+import metrics
+
+# Stages that are one HTTP round trip; their latency and outcome drive the limit.
+REQUEST_STAGES = frozenset({"landing_fetch", "login", "sync_data", "downline_page"})
+# Outcomes that mean "too much load": back off at once.
+BACKOFF_OUTCOMES = frozenset({"timeout", "captcha"})
+
+def _is_backoff(outcome: str) -> bool:
+    return outcome in BACKOFF_OUTCOMES or (outcome.startswith("http_5") and len(outcome) == 8)
+
+class AIMDLimiter:
+    """
+    Concurrency limit for site tasks, tuned like TCP congestion control:
+    additive increase (+1) after each window of requests whose p95 latency
+    and error rate are on target, multiplicative decrease (x decrease) on a
+    timeout, 5xx or captcha, followed by a cooldown so one congestion episode
+    cuts only once. A per-host cap applies alongside the global limit.
+
+    Waiters are served in arrival order (so a prioritized task order holds),
+    except that a waiter whose host is at its cap lets later ones pass.
+    Installed as a metrics stage listener; the current limit is the
+    scraper_concurrency_limit gauge and every change is kept in history.
+    """
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 20, per_host: int = 2,
+                 latency_target: float = 5.0, error_target: float = 0.1, decrease: float = 0.5,
+                 cooldown: Optional[float] = None, adaptive: bool = True, registry: Optional[metrics.Registry] = None):
+        self.min_limit, self.max_limit = max(1, min_limit), max(1, min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.per_host = max(1, per_host)
+        self.latency_target, self.error_target, self.decrease = latency_target, error_target, decrease
+        # After a cut, feedback is ignored this long (default: the latency target).
+        self.cooldown = latency_target if cooldown is None else cooldown
+        self.adaptive = adaptive
+        self._hold_until = 0.0
+        self.in_flight = 0
+        self.host_in_flight: Dict[str, int] = collections.Counter()
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = collections.deque()
+        self._latencies: List[float] = []
+        self._errors = 0
+        self._started = time.monotonic()
+        self.history: List[Tuple[float, int, str]] = []
+        self.registry = registry or metrics.registry
+        self._gauge = self.registry.gauge("scraper_concurrency_limit", "Current in-flight site limit chosen by the autotuner.")
+        self._changes = self.registry.counter("scraper_concurrency_changes_total", "Concurrency limit changes by direction.")
+        self._record("initial")
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def _record(self, reason: str):
+        self._gauge.set(self.current)
+        self.history.append((round(time.monotonic() - self._started, 3), self.current, reason))
+
+    def _can_run(self, host: str) -> bool:
+        return self.in_flight < self.current and self.host_in_flight[host] < self.per_host
+
+    def _take(self, host: str):
+        self.in_flight += 1
+        self.host_in_flight[host] += 1
+
+    def _wake(self):
+        for entry in list(self._waiters):
+            if self.in_flight >= self.current:
+                break
+            host, fut = entry
+            if fut.done():
+                self._waiters.remove(entry)
+            elif self.host_in_flight[host] < self.per_host:
+                self._waiters.remove(entry)
+                self._take(host)
+                fut.set_result(None)
+
+    async def acquire(self, host: str):
+        if not self._waiters and self._can_run(host):
+            self._take(host)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        entry = (host, fut)
+        self._waiters.append(entry)
+        # Earlier waiters may be held only by their host cap; let this one pass them.
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            elif fut.done() and not fut.cancelled():
+                self.release(host)
+            raise
+
+    def release(self, host: str):
+        self.in_flight -= 1
+        self.host_in_flight[host] -= 1
+        if not self.host_in_flight[host]:
+            del self.host_in_flight[host]
+        self._wake()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, host: str):
+        await self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def __call__(self, result: metrics.StageResult, start: float, end: float):
+        """Stage listener: feeds request latencies/outcomes into the control loop."""
+        if not self.adaptive or result.stage not in REQUEST_STAGES:
+            return
+        now = time.monotonic()
+        if now < self._hold_until:
+            # Requests already in flight when the limit dropped report the same
+            # congestion again; they neither cut twice nor count toward growth.
+            return
+        if _is_backoff(result.outcome):
+            self._cut(result.outcome, now)
+            return
+        self._latencies.append(result.seconds)
+        self._errors += result.outcome != metrics.OK
+        if len(self._latencies) < self.current:
+            return
+        # One full window (a request per slot) observed: judge it, then start the next.
+        ordered = sorted(self._latencies)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        error_rate = self._errors / len(ordered)
+        self._latencies, self._errors = [], 0
+        if p95 <= self.latency_target and error_rate <= self.error_target and self.current < self.max_limit:
+            self.limit += 1
+            self._changes.inc(direction="increase")
+            self._record("increase")
+            self._wake()
+
+    def _cut(self, reason: str, now: float):
+        self._latencies, self._errors = [], 0
+        self._hold_until = now + self.cooldown
+        new = max(self.min_limit, int(self.limit * self.decrease))
+        if new < self.current:
+            self.limit = float(new)
+            self._changes.inc(direction="decrease")
+            self._record(reason)
+
+    def summary(self) -> dict:
+        limits = [limit for _, limit, _ in self.history]
+        return {"final": self.current, "min": min(limits), "max": max(limits), "changes": len(self.history) - 1,
+                "history": self.history[-50:]}
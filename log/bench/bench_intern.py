@@ -0,0 +1,121 @@
+# bench/bench_intern.py
+# Before/after numbers for string interning and dictionary encoding of the
+# repeated bonus text fields (models.REPEATED_STRING_FIELDS):
+#   - Python memory held by N processed Bonus objects, with and without interning
+#   - archive SQLite size, plain text columns vs archive_strings dictionary
+#   - Arrow memory of the read-back Parquet columns, plain vs dictionary type
+# Run from the project root:
+#   python log/bench/bench_intern.py --bonuses 100000
+import argparse
+import datetime
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from sqlalchemy import MetaData, Table, Column, Integer, create_engine
+
+import archive
+import json_codec
+import processing
+import store
+from models import Bonus, REPEATED_STRING_FIELDS
+
+CONFIGS = [json.dumps(c) for c in (
+    ["DEPOSIT", "AUTO_CLAIM"], ["RESCUE", "LOSS_50%"], ["REBATE"], ["DEPOSIT", "TOPUP_100", "VIP"], ["DEPOSIT", "DAILY_CLAIM"],
+)]
+CONDITIONS = [json.dumps([{"claimType": t, "minDeposit": d, "games": ["SLOT", "FISH", "LIVE"]}]) for t in ("TOPUP", "LOSS", "FREE") for d in (10, 20, 50)]
+NAMES = [f"{p} {n}% Bonus" for p in ("Welcome", "Daily", "Weekend", "Rescue", "Rebate", "Birthday") for n in (10, 20, 50, 100)]
+
+def payloads(bonuses: int, per_site: int = 60):
+    """Raw JSON bodies per site, as returned by syncData; platform templates repeat across sites."""
+    rng = random.Random(7)
+    for site in range(0, bonuses, per_site):
+        items = [{
+            "id": site + n, "name": rng.choice(NAMES), "amount": rng.choice([5, 10, 20]), "rollover": rng.choice([1, 3, 5]),
+            "bonusFixed": rng.choice([0, 10]), "minWithdraw": 50, "maxWithdraw": 200, "minTopup": 10, "maxTopup": 0,
+            "transactionType": rng.choice(["DEPOSIT", "PROMOTION"]), "balance": "0", "bonus": "", "bonusRandom": "",
+            "reset": rng.choice(["DAILY", "WEEKLY", "NONE"]), "referLink": "",
+            "claimConfig": rng.choice(CONFIGS), "claimCondition": rng.choice(CONDITIONS),
+        } for n in range(min(per_site, bonuses - site))]
+        yield f"https://site{site // per_site}.com", json.dumps(items).encode()
+
+def process_all(bonuses: int, intern: bool):
+    logger = processing.logging.getLogger("bench")
+    if not intern:
+        processing.sys = types.SimpleNamespace(intern=lambda s: s)
+    try:
+        out = []
+        for url, body in payloads(bonuses):
+            out += processing.process_bonuses(json_codec.loads(body), url, "Merchant", logger)
+        return out
+    finally:
+        processing.sys = sys
+
+def retained_bytes(bonuses: int, intern: bool):
+    gc.collect()
+    tracemalloc.start()
+    kept = process_all(bonuses, intern)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, used
+
+def archive_sizes(rows, tmp: str):
+    plain_meta = MetaData()
+    plain = Table("bonus_archive", plain_meta, Column("archive_id", Integer, primary_key=True),
+                  *[Column(name, Bonus.__table__.c[name].type) for name in archive.ARCHIVE_FIELDS])
+    plain_path, dict_path = os.path.join(tmp, "plain.db"), os.path.join(tmp, "dict.db")
+    engine = create_engine(f"sqlite:///{plain_path}")
+    plain_meta.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(plain.insert(), rows)
+    engine.dispose()
+    engine = archive._archive_engine(f"sqlite:///{dict_path}")
+    with engine.begin() as conn:
+        conn.execute(archive.bonus_archive.insert(), archive.StringDictionary(conn).encode(rows))
+    engine.dispose()
+    return os.path.getsize(plain_path), os.path.getsize(dict_path)
+
+def arrow_sizes(rows):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    columns = {f: [r[f] for r in rows] for f in REPEATED_STRING_FIELDS}
+    plain = pa.table({f: pa.array(v, pa.string()) for f, v in columns.items()})
+    encoded = pa.table({f: pa.array(v, pa.dictionary(pa.int32(), pa.string())) for f, v in columns.items()})
+    return plain.nbytes, encoded.nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description="String interning / dictionary encoding benchmark")
+    parser.add_argument("--bonuses", type=int, default=100_000)
+    args = parser.parse_args()
+    mib = 1024 * 1024
+
+    _, plain_mem = retained_bytes(args.bonuses, intern=False)
+    kept, interned_mem = retained_bytes(args.bonuses, intern=True)
+    print(f"{len(kept)} bonuses in memory:   plain {plain_mem / mib:7.1f} MiB   interned {interned_mem / mib:7.1f} MiB")
+
+    now = datetime.datetime(2025, 6, 17)
+    rows = []
+    for b in kept:
+        b.run_date = "2025-06-17"
+        row = store.bonus_row(b, now)
+        rows.append({name: row[name] for name in archive.ARCHIVE_FIELDS})
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_db, dict_db = archive_sizes(rows, tmp)
+    print(f"archive SQLite on disk:     plain {plain_db / mib:7.1f} MiB   dictionary {dict_db / mib:7.1f} MiB")
+
+    sizes = arrow_sizes(rows)
+    if sizes:
+        print(f"Arrow text columns:         plain {sizes[0] / mib:7.1f} MiB   dictionary {sizes[1] / mib:7.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench/bench_json.py
+# Compares ways to parse a syncData response: stdlib json on text (what
+# response.json() did), orjson on bytes, and json_codec.select, which decodes
+# only status/data.bonus/data.promotions. Run from the project root:
+#   python log/bench/bench_json.py --bonuses 200 --promotions 60
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import json_codec
+from api_client import SYNC_SPEC
+
+HTML = "<div class=\"promo\"><p>Deposit {n} and get {n}% bonus!</p><img src=\"/img/{n}.png\"/><br/>" * 40
+
+def bonus(rng: random.Random, n: int) -> dict:
+    return {
+        "id": n, "name": f"Bonus {n}", "amount": rng.choice([5, 10, 20, 50]), "rollover": rng.choice([1, 3, 5, 15]),
+        "bonusFixed": rng.choice([0, 5, 10]), "minWithdraw": 50, "maxWithdraw": 200, "minTopup": 10, "maxTopup": 0,
+        "transactionType": "DEPOSIT", "balance": "0", "bonus": "", "bonusRandom": "", "reset": "", "referLink": "",
+        "claimConfig": "[{'dailyClaim': True}, {'autoClaim': False}]",
+        "claimCondition": "[{'claimType': 'TOPUP_AMOUNT_10'}]",
+    }
+
+def payload(bonuses: int, promotions: int, filler: int) -> bytes:
+    rng = random.Random(1)
+    doc = {
+        "status": "SUCCESS",
+        "data": {
+            # Fields the pipeline never reads; typically the bulk of the body.
+            "user": {"id": 42, "mobile": "0400000000", "wallets": [{"game": f"g{i}", "balance": i * 1.5} for i in range(filler)]},
+            "banners": [{"id": i, "html": HTML.format(n=i)} for i in range(filler)],
+            "bonus": [bonus(rng, n) for n in range(bonuses)],
+            "promotions": [dict(bonus(rng, 10_000 + n), content=HTML.format(n=n)) for n in range(promotions)],
+            "notices": [{"title": f"Notice {i}", "body": HTML.format(n=i)} for i in range(filler)],
+        },
+    }
+    return json.dumps(doc).encode()
+
+def timed(label: str, fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<36} {best * 1000:8.2f} ms   peak {peak / 1024:8.0f} KiB")
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON decode benchmark for syncData payloads")
+    parser.add_argument("--bonuses", type=int, default=200)
+    parser.add_argument("--promotions", type=int, default=60)
+    parser.add_argument("--filler", type=int, default=150, help="Unused banners/notices/wallets in the payload.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    body = payload(args.bonuses, args.promotions, args.filler)
+    print(f"payload {len(body) / 1024:.0f} KiB, backend {json_codec.BACKEND}")
+    expected = json.loads(body)
+    assert json_codec.select(body, SYNC_SPEC)["data"]["promotions"] == expected["data"]["promotions"]
+
+    timed("json.loads(text)  [old path]", lambda: json.loads(body.decode("utf-8")), args.repeat)
+    timed("json.loads(bytes)", lambda: json.loads(body), args.repeat)
+    if json_codec.BACKEND == "orjson":
+        timed("orjson.loads(bytes)", lambda: json_codec.loads(body), args.repeat)
+    timed(f"select(SYNC_SPEC) [{json_codec.BACKEND}]", lambda: json_codec.select(body, SYNC_SPEC), args.repeat)
+
+if __name__ == "__main__":
+    main()
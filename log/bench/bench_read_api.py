@@ -0,0 +1,154 @@
+# bench/bench_read_api.py
+# Load test for read_api: serves a synthetic bonuses DB (bench_store.populate)
+# while client processes hammer a mix of hot, conditional (If-None-Match) and
+# cold paginated queries, and a writer process keeps upserting like a running
+# scrape. Reports reads/s, read latency, cache stats, the server's CPU time
+# per read and writer commit latency. Run from the project root:
+#   python log/bench/bench_read_api.py --rows 200000 --seconds 8
+# Clients, server and writer are separate processes; on a machine with fewer
+# cores than processes they compete for CPU and reads/s is a lower bound. The
+# server's CPU per read gives its own ceiling: reads/s one core could serve.
+import argparse
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+
+from bench_store import CLAIM_TYPES, populate
+
+HOT = (["/bonuses?limit=50", "/bonuses?claim_type=RESCUE&min_amount=100", "/bonuses?claim_type=DEPOSIT&max_amount=10"]
+       + [f"/merchants/Merchant%20{m}/bonuses?limit=20" for m in range(20)])
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+def client(port: int, seconds: float, concurrency: int, cold_share: float, seed: int, out):
+    async def run():
+        rng = random.Random(seed)
+        etags, latencies, statuses = {}, [], {}
+        deadline = time.perf_counter() + seconds
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as http:
+            async def worker():
+                while time.perf_counter() < deadline:
+                    if rng.random() < cold_share:
+                        path = f"/bonuses?claim_type={rng.choice(CLAIM_TYPES[:3])}&offset={rng.randrange(0, 5000)}&limit=20"
+                    else:
+                        path = rng.choice(HOT)
+                    headers = {"If-None-Match": etags[path]} if path in etags and rng.random() < 0.5 else {}
+                    t0 = time.perf_counter()
+                    async with http.get(f"http://127.0.0.1:{port}{path}", headers=headers) as r:
+                        await r.read()
+                        latencies.append(time.perf_counter() - t0)
+                        statuses[r.status] = statuses.get(r.status, 0) + 1
+                        if r.status == 200:
+                            etags[path] = r.headers["ETag"]
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        out.put((latencies, statuses))
+    asyncio.run(run())
+
+def writer(db_url: str, sites: int, seconds: float, interval: float, out):
+    import io_handler
+    import processing
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    rng = random.Random(7)
+    commits, failed = [], 0
+    day = datetime.date(2025, 12, 31)
+    deadline = time.perf_counter() + seconds
+    site = 0
+    while time.perf_counter() < deadline:
+        # One site per commit, in order, like a scrape run.
+        raw = [{"id": i, "name": f"Live {i}", "amount": rng.choice([5, 10, 50])} for i in range(20)]
+        bonuses = processing.process_bonuses(raw, f"https://site{site % sites}.com", f"Merchant {site % (sites // 2 or 1)}", logger)
+        t0 = time.perf_counter()
+        failed += not io_handler.write_bonuses_to_db(bonuses, db_url, logger, day)
+        commits.append(time.perf_counter() - t0)
+        site += 1
+        time.sleep(interval)
+    out.put((commits, failed))
+
+def serve(db_url: str, ready, stop, out):
+    import read_api
+
+    async def run():
+        logger = logging.getLogger("bench")
+        logger.propagate = False
+        api = read_api.ReadApi(db_url, logger)
+        await api.start(port=0)
+        ready.put(api.port)
+        cpu = time.process_time()
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+        out.put((api.cache.stats(), time.process_time() - cpu))
+        await api.stop()
+    asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--sites", type=int, default=340)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--clients", type=int, default=1, help="Client processes (0: writer only, for its baseline).")
+    parser.add_argument("--concurrency", type=int, default=32, help="In-flight requests per client process.")
+    parser.add_argument("--cold-share", type=float, default=0.05, help="Share of requests for uncached random pages.")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--write-interval", type=float, default=0.2, help="Seconds between writer commits (0 = no writer).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        written = populate(db_path, args.rows, args.sites, args.days)
+        print(f"populated {written} rows in {time.perf_counter() - t0:.1f}s")
+        db_url = f"sqlite:///{db_path}"
+        import store
+        store.get_engine(db_url)  # WAL on before any reader or writer starts
+
+        ctx = multiprocessing.get_context("spawn")
+        ready, results, stats, stop = ctx.Queue(), ctx.Queue(), ctx.Queue(), ctx.Event()
+        server = ctx.Process(target=serve, args=(db_url, ready, stop, stats))
+        server.start()
+        port = ready.get(timeout=60)
+        procs = [ctx.Process(target=client, args=(port, args.seconds, args.concurrency, args.cold_share, i, results))
+                 for i in range(args.clients)]
+        writes = ctx.Queue()
+        if args.write_interval > 0:
+            procs.append(ctx.Process(target=writer, args=(db_url, args.sites, args.seconds, args.write_interval, writes)))
+        for p in procs:
+            p.start()
+        latencies, statuses = [], {}
+        for _ in range(args.clients):
+            lat, st = results.get()
+            latencies += lat
+            for k, v in st.items():
+                statuses[k] = statuses.get(k, 0) + v
+        commits, failed = writes.get() if args.write_interval > 0 else ([], 0)
+        for p in procs:
+            p.join()
+        stop.set()
+        cache, server_cpu = stats.get(timeout=30)
+        server.join()
+
+    print(f"reads: {len(latencies)} in {args.seconds:.0f}s = {len(latencies) / args.seconds:,.0f}/s  statuses {statuses}")
+    print(f"  latency p50 {percentile(latencies, 0.5) * 1000:.2f} ms  p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"  cache {cache}")
+    if latencies:
+        per_read = server_cpu / len(latencies)
+        print(f"server: {server_cpu:.2f}s CPU = {per_read * 1e6:.0f} us/read, ~{1 / per_read:,.0f} reads/s per core")
+    if commits:
+        print(f"writer: {len(commits)} commits ({failed} failed)  p50 {percentile(commits, 0.5) * 1000:.2f} ms  max {max(commits) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
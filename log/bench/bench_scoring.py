@@ -0,0 +1,82 @@
+# bench/bench_scoring.py
+# Times scoring on a synthetic bonuses table (bench_store.populate): a full
+# rescore_all with numpy and with the pure-Python fallback, then top_bonuses
+# for the latest run and for random earlier runs. Run from the project root:
+#   python log/bench/bench_scoring.py --rows 1000000 --k 50
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import scoring
+import store
+from bench_store import populate
+
+def rescore(engine, numpy: bool) -> float:
+    hidden = sys.modules.get("numpy")
+    if not numpy:
+        sys.modules["numpy"] = None  # import numpy raises ImportError
+    try:
+        t0 = time.perf_counter()
+        rows = scoring.rescore_all(engine)
+        elapsed = time.perf_counter() - t0
+    finally:
+        if not numpy:
+            if hidden is None:
+                del sys.modules["numpy"]
+            else:
+                sys.modules["numpy"] = hidden
+    print(f"  rescore_all [{'numpy' if numpy else 'python'}]  {rows} rows in {elapsed:.2f}s = {rows / elapsed:,.0f} rows/s")
+    return elapsed
+
+def timed_top(label: str, db_url: str, k: int, days, repeat: int):
+    times = []
+    for _ in range(repeat):
+        day = random.choice(days) if days else None
+        t0 = time.perf_counter()
+        got = scoring.top_bonuses(db_url, k, day)
+        times.append(time.perf_counter() - t0)
+        assert len(got) == k
+    print(f"  {label:<28} median {statistics.median(times) * 1000:7.2f} ms   max {max(times) * 1000:7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Scoring and top-K benchmark")
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--sites", type=int, default=340)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        written = populate(db_path, args.rows, args.sites, args.days)
+        db_url = f"sqlite:///{db_path}"
+        engine = store.get_engine(db_url)
+        print(f"{written} rows, {args.days} runs")
+        try:
+            import numpy  # noqa: F401
+            rescore(engine, numpy=True)
+        except ImportError:
+            print("  numpy not installed")
+        rescore(engine, numpy=False)
+
+        earlier = [datetime.date(2025, 1, 1) + datetime.timedelta(days=d) for d in range(args.days - 1)]
+        timed_top(f"top_bonuses(k={args.k}) latest", db_url, args.k, None, args.repeat)
+        timed_top(f"top_bonuses(k={args.k}) by date", db_url, args.k, earlier, args.repeat)
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT * FROM bonuses WHERE run_date = '2025-01-01' AND value_score IS NOT NULL "
+                f"ORDER BY value_score DESC LIMIT {args.k}").all()
+        print("  plan: " + "; ".join(row[-1] for row in plan))
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/bench_store.py
+# Benchmarks store.query_bonuses on a synthetic bonuses table, with and without
+# the secondary indexes. Run from the project root:
+#   python log/bench/bench_store.py --rows 1000000
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import store
+from models import Bonus
+
+CLAIM_TYPES = ["DEPOSIT", "RESCUE", "REBATE", None]
+CLAIM_WEIGHTS = [40, 5, 15, 40]
+AMOUNTS = [0, 5, 10, 20, 50, 100, 500]
+AMOUNT_WEIGHTS = [30, 25, 20, 12, 8, 4, 1]
+SECONDARY_INDEXES = ["ix_bonuses_run_date_created_at", "ix_bonuses_url_run_date", "ix_bonuses_merchant_run_date",
+                     "ix_bonuses_claim_type_run_date", "ix_bonuses_updated_at"]
+
+def populate(db_path: str, rows: int, sites: int, days: int):
+    # Schema via the store, then a bulk load on a connection of our own.
+    store.get_engine(f"sqlite:///{db_path}").dispose()
+    columns = [c.name for c in Bonus.__table__.columns if c.name != "db_id"]
+    rng = random.Random(42)
+    start = datetime.datetime(2025, 1, 1)
+    per_site_day = max(1, rows // (sites * days))
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    sql = f"INSERT INTO bonuses ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    written = 0
+    for day in range(days):
+        ts = start + datetime.timedelta(days=day)
+        batch = []
+        for site in range(sites):
+            for n in range(per_site_day):
+                if written + len(batch) >= rows:
+                    break
+                values = dict.fromkeys(columns)
+                values.update(
+                    url=f"https://site{site}.com", merchant_name=f"Merchant {site % (sites // 2 or 1)}",
+                    id=str(n), name=f"Bonus {n}", amount=rng.choices(AMOUNTS, AMOUNT_WEIGHTS)[0],
+                    claim_type=rng.choices(CLAIM_TYPES, CLAIM_WEIGHTS)[0], created_at=ts + datetime.timedelta(seconds=site),
+                    updated_at=ts + datetime.timedelta(seconds=site),
+                    run_date=ts.date().isoformat(), content_hash=f"{rng.getrandbits(64):016x}",
+                    is_auto_claim=0, is_vip_only=0, has_loss_requirement=0, has_topup_requirement=0,
+                )
+                batch.append([values[c] for c in columns])
+        conn.executemany(sql, batch)
+        written += len(batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode=WAL")  # back to the store's mode
+    conn.close()
+    return written
+
+def timed(label: str, fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<40} {best * 1000:9.2f} ms  ({len(result)} rows)")
+
+def run_queries(db_url: str, sites: int, days: int, repeat: int):
+    last_day = datetime.date(2025, 1, 1) + datetime.timedelta(days=days - 1)
+    since = datetime.datetime.combine(last_day, datetime.time())
+    mid_day = datetime.date(2025, 1, 1) + datetime.timedelta(days=days // 2)
+    timed("merchant + run_date", lambda: store.query_bonuses(db_url, merchant="Merchant 7", run_date=last_day, limit=100), repeat)
+    timed("url (all days)", lambda: store.query_bonuses(db_url, url=f"https://site{sites - 1}.com", limit=100), repeat)
+    timed("claim_type + min_amount", lambda: store.query_bonuses(db_url, claim_type="RESCUE", min_amount=500, limit=100), repeat)
+    timed("since (last day)", lambda: store.query_bonuses(db_url, since=since, limit=100), repeat)
+    timed("run_date (middle of range)", lambda: store.query_bonuses(db_url, run_date=mid_day, limit=100), repeat)
+    timed("merchant (all days)", lambda: store.query_bonuses(db_url, merchant="Merchant 7", limit=100), repeat)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sites", type=int, default=340)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        written = populate(db_path, args.rows, args.sites, args.days)
+        print(f"populated {written} rows in {time.perf_counter() - t0:.1f}s")
+
+        db_url = f"sqlite:///{db_path}"
+        print("with indexes:")
+        run_queries(db_url, args.sites, args.days, args.repeat)
+
+        conn = sqlite3.connect(db_path)
+        for name in SECONDARY_INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+        conn.commit()
+        conn.close()
+        store._engines.clear()
+        # Keep get_engine from recreating the dropped indexes.
+        migrate, store.migrate = store.migrate, lambda engine, logger=None: None
+        try:
+            print("without secondary indexes:")
+            run_queries(db_url, args.sites, args.days, args.repeat)
+        finally:
+            store.migrate = migrate
+
+if __name__ == "__main__":
+    main()
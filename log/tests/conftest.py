@@ -0,0 +1,137 @@
+# tests/conftest.py
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+CONFIG_TEMPLATE = """[auth]
+username = 0400000000
+password = secret
+
+[scraper]
+url_list_path = urls.txt
+max_concurrent_requests = 5
+min_request_delay = 0
+max_request_delay = 0
+
+[output]
+enable_csv_output = true
+csv_output_path = data/bonuses.csv
+enable_db_output = true
+db_connection_string = sqlite:///data/bonuses.db
+
+[analysis]
+enable_comparison_report = false
+
+[archive]
+enable_archive = false
+
+[logging]
+log_level = INFO
+log_file_path = log/test.log
+"""
+
+class FakeSite:
+    """A local stand-in for one merchant site: landing page plus /api/v1/index.php."""
+    def __init__(self, merchant_id="1001", merchant_name="ACME", bonuses=None, login_status="SUCCESS", login_message=None, downline_pages=(), rejected_mobiles=()):
+        self.merchant_id, self.merchant_name = merchant_id, merchant_name
+        self.rejected_mobiles, self.login_mobiles = set(rejected_mobiles), []
+        self.downline_pages = list(downline_pages)
+        self.bonuses = bonuses if bonuses is not None else [{"id": 1, "name": "Welcome", "amount": 10, "bonusFixed": 10}]
+        self.login_status, self.login_message = login_status, login_message
+        self.calls = []
+        self.runner = None
+        self.url = None
+
+    async def _index(self, request):
+        self.calls.append("landing")
+        return web.Response(text=f"<script>var MERCHANTID = {self.merchant_id}; var MERCHANTNAME = '{self.merchant_name}';</script>", content_type="text/html")
+
+    async def _api(self, request):
+        form = await request.post()
+        module = form.get("module")
+        self.calls.append(module)
+        if module == "/users/login":
+            self.login_mobiles.append(form.get("mobile"))
+            if form.get("mobile") in self.rejected_mobiles:
+                return web.json_response({"status": "ERROR", "data": {"message": "Invalid login"}})
+            if self.login_status != "SUCCESS":
+                return web.json_response({"status": "ERROR", "data": {"message": self.login_message}})
+            return web.json_response({"status": "SUCCESS", "data": {"id": "42", "token": "tok"}})
+        if module == "/users/syncData":
+            return web.json_response({"status": "SUCCESS", "data": {"bonus": self.bonuses, "promotions": []}})
+        if module == "/referrer/getDownline":
+            page = int(form.get("pageIndex", 0))
+            rows = self.downline_pages[page] if page < len(self.downline_pages) else []
+            return web.json_response({"status": "SUCCESS", "data": {"downlines": rows}})
+        return web.json_response({"status": "ERROR", "data": {"message": "Unknown module"}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self._index)
+        app.router.add_post("/api/v1/index.php", self._api)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+def write_workspace(path, urls, extra_config=""):
+    """Writes config.ini and urls.txt into path; tests chdir there before running main."""
+    (path / "config.ini").write_text(CONFIG_TEMPLATE + extra_config)
+    (path / "urls.txt").write_text("\n".join(urls) + "\n")
+
+class StandInProxy:
+    """A local forward proxy for plain-HTTP targets (absolute-form requests, no CONNECT); records the targets it relayed to."""
+    def __init__(self):
+        self.targets = []
+        self.paths = []
+        self.server = None
+        self.url = None
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        method, uri, rest = head.split(b" ", 2)
+        target = urlsplit(uri.decode())
+        self.targets.append(target.netloc)
+        self.paths.append((target.netloc, target.path or "/"))
+        up_reader, up_writer = await asyncio.open_connection(target.hostname, target.port or 80)
+        # Origin-form upstream, as a real proxy sends it; one request per connection.
+        path = (target.path or "/") + (f"?{target.query}" if target.query else "")
+        lines = [line for line in rest.split(b"\r\n") if not line.lower().startswith((b"connection:", b"proxy-connection:"))]
+        lines.insert(1, b"Connection: close")
+        up_writer.write(b" ".join([method, path.encode(), b"\r\n".join(lines)]))
+        await asyncio.gather(self._pipe(reader, up_writer), self._pipe(up_reader, writer))
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
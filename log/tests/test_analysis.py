@@ -0,0 +1,89 @@
+# tests/test_analysis.py
+import csv
+import datetime
+import logging
+
+from sqlalchemy import event
+
+import analysis
+import io_handler
+import processing
+import store
+
+def _write_day(db_url, day, items, url="https://example.com", site_run=False):
+    logger = logging.getLogger("test")
+    raw = [{"id": i, "name": f"Bonus {i}", "amount": amount} for i, amount in items]
+    bonuses = processing.process_bonuses(raw, url, "ACME", logger)
+    io_handler.write_bonuses_to_db(bonuses, db_url, logger, day, url if site_run else None)
+
+def test_comparison_report_classifies_new_used_persistent(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    _write_day(db_url, datetime.date(2025, 6, 16), [(1, 5), (2, 6), (3, 7)])
+    _write_day(db_url, datetime.date(2025, 6, 17), [(2, 6), (3, 8), (4, 1)])
+
+    path = analysis.generate_comparison_report(db_url, str(tmp_path), logging.getLogger("test"),
+                                               datetime.date(2025, 6, 17), include_unchanged=True)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = {r["id"]: r for r in csv.DictReader(f)}
+
+    assert path.endswith("comparison_report_2025-06-17.csv")
+    assert rows["4"]["status"] == analysis.NEW
+    assert rows["1"]["status"] == analysis.USED
+    assert rows["2"]["status"] == analysis.UNCHANGED
+    assert rows["3"]["status"] == analysis.CHANGED
+    assert rows["3"]["changed_fields"] == "amount"
+
+def test_changed_rows_cost_no_extra_queries(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    statements = []
+
+    def report(day, changed):
+        _write_day(db_url, day, [(i, 1) for i in range(40)])
+        _write_day(db_url, day + datetime.timedelta(days=1), [(i, 2 if i < changed else 1) for i in range(40)])
+        engine = store.get_engine(db_url)
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            path = analysis.generate_comparison_report(db_url, str(tmp_path), logging.getLogger("test"),
+                                                       day + datetime.timedelta(days=1))
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        with open(path, newline="", encoding="utf-8") as f:
+            return [r for r in csv.DictReader(f) if r["status"] == analysis.CHANGED]
+
+    assert len(report(datetime.date(2025, 6, 1), 1)) == 1
+    one = len(statements)
+    statements.clear()
+    rows = report(datetime.date(2025, 6, 10), 30)
+    assert len(rows) == 30 and {r["changed_fields"] for r in rows} == {"amount"}
+    assert len(statements) == one
+
+def test_only_sites_fetched_on_both_days_are_compared(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    prev, cur = datetime.date(2025, 6, 16), datetime.date(2025, 6, 17)
+    for url in ("https://ok.test", "https://failed.test", "https://emptied.test"):
+        _write_day(db_url, prev, [(1, 5), (2, 6)], url=url, site_run=True)
+    _write_day(db_url, cur, [(2, 7), (3, 1)], url="https://ok.test", site_run=True)
+    _write_day(db_url, cur, [], url="https://emptied.test", site_run=True)  # fetched, nothing listed any more
+    _write_day(db_url, cur, [(9, 1)], url="https://new.test", site_run=True)  # not fetched on prev
+
+    path = analysis.generate_comparison_report(db_url, str(tmp_path), logging.getLogger("test"), cur)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = sorted((r["url"], r["id"], r["status"]) for r in csv.DictReader(f))
+    assert rows == [
+        ("https://emptied.test", "1", analysis.USED), ("https://emptied.test", "2", analysis.USED),
+        ("https://ok.test", "1", analysis.USED), ("https://ok.test", "2", analysis.CHANGED), ("https://ok.test", "3", analysis.NEW),
+    ]
+
+def test_changed_and_new_rows_are_read_off_the_changed_index(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    _write_day(db_url, datetime.date(2025, 6, 16), [(1, 5)])
+    engine = store.get_engine(db_url)
+    with engine.connect() as conn:
+        new, _, changed, _, _ = analysis._queries(conn, "2025-06-17", "2025-06-16")
+        for query in (new, changed):
+            compiled = query.compile(engine, compile_kwargs={"render_postcompile": True})
+            params = {"cur": "2025-06-17", "prev": "2025-06-16"}
+            sql = "EXPLAIN QUERY PLAN " + str(compiled)
+            plan = [row[-1] for row in conn.exec_driver_sql(sql, tuple(params[k] for k in compiled.positiontup))]
+            assert any("ix_bonuses_run_date_changed" in step for step in plan), plan
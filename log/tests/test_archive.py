@@ -0,0 +1,112 @@
+# tests/test_archive.py
+import datetime
+import logging
+import sqlite3
+
+import pytest
+
+import archive
+import io_handler
+from test_io_handler import _bonus
+
+def _day_bonuses(n):
+    bonuses = []
+    for i in range(n):
+        b = _bonus(i, "ACME")
+        b.raw_claim_config = "['DEPOSIT', 'AUTO_CLAIM']"
+        b.transaction_type = "DEPOSIT" if i % 2 else None
+        bonuses.append(b)
+    return bonuses
+
+def test_archive_dictionary_encodes_repeated_strings(tmp_path):
+    logger = logging.getLogger("test")
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    archive_url = f"sqlite:///{tmp_path / 'archive.db'}"
+    day = datetime.date(2025, 6, 17)
+    io_handler.write_bonuses_to_db(_day_bonuses(20), db_url, logger, day)
+
+    assert archive.archive_run(db_url, archive_url, logger, day) == 20
+    assert archive.archive_run(db_url, archive_url, logger, day) == 20  # re-run replaces the day
+
+    conn = sqlite3.connect(tmp_path / "archive.db")
+    assert conn.execute("SELECT COUNT(*) FROM bonus_archive").fetchone() == (20,)
+    assert conn.execute("SELECT COUNT(DISTINCT raw_claim_config_sid) FROM bonus_archive").fetchone() == (1,)
+    # 20 names, one claim config, one transaction type
+    assert conn.execute("SELECT COUNT(*) FROM archive_strings").fetchone() == (22,)
+
+    with archive._archive_engine(archive_url).connect() as c:
+        rows = c.execute(archive.decoded_select().order_by(archive.bonus_archive.c.archive_id)).mappings().all()
+    assert [r["name"] for r in rows[:2]] == ["Bonus 0", "Bonus 1"]
+    assert rows[1]["raw_claim_config"] == "['DEPOSIT', 'AUTO_CLAIM']"
+    assert rows[0]["transaction_type"] is None and rows[1]["transaction_type"] == "DEPOSIT"
+
+# bonus_archive columns as the plain (pre-dictionary) archive wrote them.
+PLAIN_FIELDS = [
+    "url", "merchant_name", "id", "name", "amount", "rollover", "bonus_fixed", "min_withdraw", "max_withdraw",
+    "withdraw_to_bonus_ratio", "min_topup", "max_topup", "transaction_type", "balance", "bonus", "bonus_random",
+    "reset", "refer_link", "is_auto_claim", "is_vip_only", "has_loss_requirement", "has_topup_requirement",
+    "loss_req_percent", "loss_req_amount", "topup_req_amount", "claim_type", "raw_claim_config",
+    "raw_claim_condition", "created_at", "run_date", "content_hash",
+]
+
+def _plain_archive(path):
+    conn = sqlite3.connect(path)
+    columns = ", ".join(PLAIN_FIELDS)
+    conn.execute(f"CREATE TABLE bonus_archive (archive_id INTEGER PRIMARY KEY, {columns})")
+    conn.execute("CREATE INDEX ix_bonus_archive_run_date ON bonus_archive (run_date)")
+    row = dict.fromkeys(PLAIN_FIELDS)
+    row.update(url="https://a.com", id="1", name="Welcome", run_date="2025-06-01", raw_claim_config="[]")
+    conn.execute(f"INSERT INTO bonus_archive ({columns}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+    conn.commit()
+    conn.close()
+
+def test_plain_archive_is_migrated_to_dictionary_layout(tmp_path):
+    path = tmp_path / "archive.db"
+    _plain_archive(path)
+
+    archive._engines.clear()
+    with archive._archive_engine(f"sqlite:///{path}").connect() as c:
+        rows = c.execute(archive.decoded_select()).mappings().all()
+    assert [(r["url"], r["name"], r["raw_claim_config"], r["value_score"]) for r in rows] == [("https://a.com", "Welcome", "[]", None)]
+    tables = {r[0] for r in sqlite3.connect(path).execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert "bonus_archive_plain" not in tables
+
+def test_failed_plain_migration_leaves_archive_untouched(tmp_path, monkeypatch):
+    path = tmp_path / "archive.db"
+    _plain_archive(path)
+
+    def fail(self, rows):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(archive.StringDictionary, "encode", fail)
+    archive._engines.clear()
+    with pytest.raises(RuntimeError):
+        archive._archive_engine(f"sqlite:///{path}")
+    conn = sqlite3.connect(path)
+    assert {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")} == {"bonus_archive"}
+    assert conn.execute("SELECT name FROM bonus_archive").fetchall() == [("Welcome",)]
+
+def test_archive_gains_columns_added_to_bonus(tmp_path):
+    logger = logging.getLogger("test")
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    path = tmp_path / "archive.db"
+    old_day, day = datetime.date(2025, 6, 16), datetime.date(2025, 6, 17)
+    io_handler.write_bonuses_to_db(_day_bonuses(3), db_url, logger, old_day)
+    scored = _day_bonuses(3)
+    for b in scored:
+        b.value_score = 1.5
+    io_handler.write_bonuses_to_db(scored, db_url, logger, day)
+    archive._engines.clear()
+    assert archive.archive_run(db_url, f"sqlite:///{path}", logger, old_day) == 3
+    # An archive created before Bonus had value_score.
+    conn = sqlite3.connect(path)
+    conn.execute("ALTER TABLE bonus_archive DROP COLUMN value_score")
+    conn.commit()
+    conn.close()
+
+    archive._engines.clear()
+    assert archive.archive_run(db_url, f"sqlite:///{path}", logger, day) == 3
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT run_date, value_score FROM bonus_archive ORDER BY archive_id").fetchall()
+    assert [d for d, _ in rows] == [old_day.isoformat()] * 3 + [day.isoformat()] * 3
+    assert [v for _, v in rows] == [None] * 3 + [1.5] * 3
@@ -0,0 +1,35 @@
+# tests/test_conc.py
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "util")))
+
+import conc
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_bundle_streams_files_with_extractable_manifest(tmp_path, compress):
+    root = tmp_path / "root"
+    (root / "logs").mkdir(parents=True)
+    (root / "logs" / "log.log").write_bytes(b"line\n" * 50_000)
+    (root / "logs" / "log.log.1").write_bytes(b"older\n")
+    (root / "data.csv").write_text("a,b\n1,2\n")
+    (root / "skip.tmp").write_text("x")
+    old = root / "logs" / "ancient.log"
+    old.write_text("old")
+    os.utime(old, (1_000_000, 1_000_000))
+    out = root / "bundle.bin"  # inside the tree being bundled: must not include itself
+
+    entries = conc.concatenate_files(str(root), str(out), exclude=["*.tmp"], newer_than=2_000_000, compress=compress)
+
+    assert [e["path"] for e in entries] == ["data.csv", os.path.join("logs", "log.log"), os.path.join("logs", "log.log.1")]
+    manifest = json.loads((tmp_path / "root" / "bundle.bin.manifest.json").read_text())
+    assert manifest["compressed"] is compress
+    bundle = out.read_bytes()
+    plain = gzip.decompress(bundle) if compress else bundle
+    assert plain == b"a,b\n1,2\n" + b"line\n" * 50_000 + b"older\n"
+    for e in entries:
+        assert conc.extract_file(str(out), e["path"]) == (root / e["path"]).read_bytes()
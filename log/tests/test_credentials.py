@@ -0,0 +1,99 @@
+# tests/test_credentials.py
+import asyncio
+import collections
+import json
+import logging
+
+import pytest
+
+import credentials
+import main
+import metrics
+from conftest import FakeSite, write_workspace
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+
+def _pool(names, **kw):
+    return credentials.CredentialPool([credentials.Account(n, f"user-{n}", "pw") for n in names], **kw)
+
+def test_consistent_hashing_spreads_and_moves_few_merchants():
+    merchants = [str(1000 + i) for i in range(2000)]
+    four = _pool("abcd")
+    owners = {m: next(four.candidates(m)).name for m in merchants}
+    assert min(collections.Counter(owners.values()).values()) > 2000 / 4 * 0.6
+    five = _pool("abcde")
+    moved = [m for m in merchants if next(five.candidates(m)).name != owners[m]]
+    assert all(next(five.candidates(m)).name == "e" for m in moved)
+    assert len(moved) < 2000 * 0.3
+    assert sorted(a.name for a in four.candidates("1001")) == list("abcd")
+
+def test_cooldown_after_repeated_account_faults():
+    now = [0.0]
+    pool = credentials.CredentialPool([credentials.Account(n, f"user-{n}", "pw", clock=lambda: now[0]) for n in "ab"],
+                                      failures_before_cooldown=2, cooldown=60, clock=lambda: now[0])
+    owner = next(pool.candidates("1001"))
+    log = logging.getLogger("test")
+    pool.report_login(owner, "timeout", log)  # a site problem: does not count
+    for outcome in ("captcha", "http_429", "status_fail"):  # the exit IP's problem: the proxy pool's to judge
+        pool.report_login(owner, outcome, log)
+    pool.report_login(owner, "invalid_login", log)
+    assert pool.available("1001")[0] is owner
+    pool.report_login(owner, "invalid_login", log)
+    assert [a.name for a in pool.available("1001")] == [a.name for a in pool.candidates("1001")][1:]
+    now[0] += 60
+    assert pool.available("1001")[0] is owner
+
+def test_token_cache_expires_on_the_pool_clock():
+    now = [0.0]
+    pool = credentials.CredentialPool([credentials.Account("a", "u", "p")], token_ttl=10, clock=lambda: now[0])
+    account = pool.accounts["a"]
+    pool.store_token(account, "1001", "token", "proxy-1")
+    assert pool.cached_token(account, "1001", "proxy-1") == "token"
+    assert pool.cached_token(account, "1001", "proxy-2") is None
+    now[0] += 10
+    assert pool.cached_token(account, "1001", "proxy-1") is None
+
+def test_budget_waits_for_refill():
+    now = [0.0]
+    account = credentials.Account("a", "u", "p", requests_per_minute=60, clock=lambda: now[0])
+    account.tokens = 0
+
+    async def run():
+        async def advance():
+            while True:
+                await asyncio.sleep(0)
+                now[0] += 0.25
+        ticker = asyncio.create_task(advance())
+        await account.spend()
+        ticker.cancel()
+
+    asyncio.run(run())
+    assert now[0] >= 1.0
+
+def test_pool_falls_back_and_reuses_tokens(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "secrets.ini").write_text("[account:bad]\nusername = 0411111111\npassword = x\n\n"
+                                         "[account:good]\nusername = 0422222222\npassword = y\n")
+
+    async def run():
+        sites = [await FakeSite(merchant_id=str(1001 + i), rejected_mobiles={"0411111111"}).start() for i in range(4)]
+        try:
+            write_workspace(tmp_path, [s.url for s in sites])
+            config = (tmp_path / "config.ini").read_text().replace(
+                "password = secret\n", "password = secret\naccounts_file = secrets.ini\nfailures_before_cooldown = 1\n")
+            (tmp_path / "config.ini").write_text(config.replace("max_concurrent_requests = 5", "max_concurrent_requests = 1\nautotune_concurrency = false"))
+            await main.main()
+            return sites
+        finally:
+            for s in sites:
+                await s.stop()
+
+    sites = asyncio.run(run())
+
+    assert all("/users/syncData" in s.calls for s in sites)
+    mobiles = [m for s in sites for m in s.login_mobiles]
+    assert mobiles.count("0422222222") == 4
+    assert mobiles.count("0411111111") <= 1  # benched after its first failure
+    assert metrics.registry.stage_summary()["site"]["outcomes"] == {"ok": 4}
@@ -0,0 +1,49 @@
+# tests/test_diagnose.py
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "util")))
+
+import diagnose
+
+def _line(ts, level, event, **details):
+    return f"{ts} - {level} - auth:1 - {event} -- Details: {json.dumps(dict(details, msg=event))}\n"
+
+def test_report_buckets_failures_and_prunes_sites_without_later_success(tmp_path):
+    older = [
+        _line("2025-06-16 10:00:00,000", "WARNING", "auth_api_status_fail", url="https://cap.com/api/v1/index.php",
+              response={"status": "ERROR", "data": {"message": "Invalid Captcha!"}}),
+        _line("2025-06-16 10:00:01,000", "ERROR", "auth_html_fetch_fail", url="https://flaky.com", err=""),
+    ]
+    newer = [
+        "2025-06-17 09:00:00,000 - INFO - main:1 - OK: https://flaky.com - Found 3 bonuses. -- Details: {}\n",
+        _line("2025-06-17 09:00:01,000", "ERROR", "auth_api_request_fail", url="https://html.com/api/v1/index.php",
+              err="0, message='Attempt to decode JSON with unexpected mimetype: text/html'"),
+        _line("2025-06-17 09:00:02,000", "ERROR", "auth_api_request_fail", url="https://ez.com/api/v1/index.php",
+              err="405, message='Method Not Allowed', url=URL('https://ez.com/api/v1/index.php')"),
+        _line("2025-06-17 09:00:03,000", "ERROR", "auth_html_fetch_fail", url="https://dead.com",
+              err="Cannot connect to host dead.com:443 ssl:False [No address associated with hostname]"),
+    ]
+    (tmp_path / "log.log.1").write_text("".join(older))
+    (tmp_path / "log.log").write_text("".join(newer))
+
+    paths = diagnose.log_files(str(tmp_path / "log.log*"))
+    assert [os.path.basename(p) for p in paths] == ["log.log.1", "log.log"]
+    failing, last_ts = diagnose.analyse(paths)
+    assert failing == {
+        "https://cap.com": {"captcha"}, "https://html.com": {"json_decode"},
+        "https://ez.com": {"http_405"}, "https://dead.com": {"connect_error"},
+    }
+
+    md_path, txt_path, json_path = diagnose.write_report(failing, last_ts, str(tmp_path / "reports"))
+    assert os.path.basename(md_path) == "06-17 Diagnostics & URL Analysis.md"
+    report = open(md_path).read()
+    assert "#### Category: API Status Fail - Invalid Captcha\n* **Count:** 1" in report
+    assert "#### Category: Request Fail - 405 Method Not Allowed" in report
+    assert report.index("Recoverable") < report.index("[https://ez.com]") < report.index("Unreachable") < report.index("[https://dead.com]")
+    assert open(txt_path).read().split() == sorted(failing)
+    assert json.load(open(json_path))["sites"]["https://cap.com"] == ["captcha"]
+
+    failing, _ = diagnose.analyse(paths, since="2025-06-17")
+    assert "https://cap.com" not in failing
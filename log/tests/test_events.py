@@ -0,0 +1,85 @@
+# tests/test_events.py
+import asyncio
+import datetime
+import json
+import logging
+
+import pytest
+
+import events
+import main
+import metrics
+import processing
+from conftest import FakeSite, write_workspace
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+
+def _bonuses(*raw):
+    return processing.process_bonuses(list(raw), "http://site.test", "ACME", logging.getLogger("test"))
+
+def test_runs_emit_added_changed_removed_and_resume_by_offset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    changelog = tmp_path / "data" / "events" / "changes.jsonl"
+
+    async def run(*rounds):
+        site = await FakeSite().start()
+        try:
+            write_workspace(tmp_path, [site.url], "\n[events]\nenable_events = true\nsocket_path =\n")
+            for bonuses in rounds:
+                site.bonuses = bonuses
+                await main.main()
+                yield list(events.read_events(str(changelog)))
+        finally:
+            await site.stop()
+
+    async def collect():
+        return [r async for r in run(
+            [{"id": 1, "name": "Welcome", "amount": 10}, {"id": 2, "name": "Daily", "amount": 5}],
+            [{"id": 1, "name": "Welcome", "amount": 20}, {"id": 3, "name": "Weekly", "amount": 7}],
+            [{"id": 1, "name": "Welcome", "amount": 20}, {"id": 3, "name": "Weekly", "amount": 7}],
+        )]
+
+    first, second, third = asyncio.run(collect())
+    assert [json.loads(line)["type"] for _, line in first] == ["added", "added"]
+    # Resuming from the last event seen skips the first run's events.
+    resumed = list(events.read_events(str(changelog), first[-1][0]))
+    assert resumed == second[2:]
+    later = [json.loads(line) for _, line in resumed]
+    by_type = {e["type"]: e for e in later}
+    assert sorted(by_type) == ["added", "changed", "removed"]
+    assert by_type["changed"]["changes"] == {"amount": [10.0, 20.0]}
+    assert by_type["removed"]["id"] == "2" and by_type["added"]["id"] == "3"
+    assert [e["offset"] for e in later] == [offset for offset, _ in resumed]
+    assert third == second  # unchanged site: no events
+    with pytest.raises(ValueError):
+        list(events.read_events(str(changelog), first[-1][0] + 1))
+
+def test_socket_replays_from_cursor_then_streams_live(tmp_path):
+    async def run():
+        feed = events.ChangeFeed(str(tmp_path / "changes.jsonl"), str(tmp_path / "state.json"), logging.getLogger("test"))
+        await feed.serve(str(tmp_path / "changes.sock"))
+        day = datetime.date(2026, 1, 1)
+        feed.publish("http://a.test", _bonuses({"id": 1, "name": "A", "amount": 1}), day)
+
+        replay_reader, replay_writer = await asyncio.open_unix_connection(str(tmp_path / "changes.sock"))
+        replay_writer.write(b'{"since": -1}\n')
+        live_reader, live_writer = await asyncio.open_unix_connection(str(tmp_path / "changes.sock"))
+        live_writer.write(b"{}\n")
+        first = json.loads(await asyncio.wait_for(replay_reader.readline(), 5))
+        await asyncio.sleep(0.05)  # let the live client subscribe
+
+        feed.publish("http://b.test", _bonuses({"id": 9, "name": "B", "amount": 2}), day)
+        second = json.loads(await asyncio.wait_for(replay_reader.readline(), 5))
+        live = json.loads(await asyncio.wait_for(live_reader.readline(), 5))
+        for w in (replay_writer, live_writer):
+            w.close()
+        await feed.close()
+        return first, second, live
+
+    first, second, live = asyncio.run(run())
+    assert (first["url"], first["type"], first["offset"]) == ("http://a.test", "added", 0)
+    assert second["url"] == live["url"] == "http://b.test"
+    assert second["offset"] == live["offset"] > 0
+    assert json.loads((tmp_path / "state.json").read_text())["sites"]["http://b.test"]["9"]["fields"]["amount"] == 2.0
@@ -0,0 +1,140 @@
+# tests/test_io_handler.py
+import datetime
+import logging
+
+import pytest
+
+import io_handler
+from models import Bonus
+
+def _bonus(i: int, merchant: str) -> Bonus:
+    b = Bonus()
+    b.url = "https://example.com"
+    b.merchant_name = merchant
+    b.id = str(i)
+    b.name = f"Bonus {i}"
+    b.amount = float(i)
+    b.is_auto_claim = bool(i % 2)
+    return b
+
+def test_parquet_partitions_by_run_date_and_merchant(tmp_path):
+    pytest.importorskip("pyarrow")
+    logger = logging.getLogger("test")
+    bonuses = [_bonus(1, "ACME"), _bonus(2, "ACME"), _bonus(3, "Other Co")]
+    io_handler.write_bonuses_to_parquet(bonuses, str(tmp_path), logger, datetime.date(2025, 6, 16))
+    io_handler.write_bonuses_to_parquet(bonuses, str(tmp_path), logger, datetime.date(2025, 6, 17))
+
+    assert (tmp_path / "run_date=2025-06-17" / "merchant_name=ACME").is_dir()
+
+    table = io_handler.read_bonuses_from_parquet(
+        str(tmp_path), columns=["id", "amount"],
+        filters=[("run_date", "=", "2025-06-17"), ("merchant_name", "=", "ACME")],
+    )
+    assert table.column_names == ["id", "amount"]
+    assert sorted(table.column("id").to_pylist()) == ["1", "2"]
+
+def test_parquet_sink_writes_one_file_per_partition(tmp_path):
+    pytest.importorskip("pyarrow")
+    sink = io_handler.ParquetSink(str(tmp_path), logging.getLogger("test"))
+    day = datetime.date(2025, 6, 17)
+    for site in range(5):  # one write per site, as main does
+        assert sink.write([_bonus(site * 10 + i, "ACME" if i % 2 else None) for i in range(4)], day)
+    assert sink.write([_bonus(99, "ACME")], datetime.date(2025, 6, 18))
+    assert sink.close()
+
+    files = sorted(str(p.relative_to(tmp_path).parent) for p in tmp_path.rglob("*.parquet"))
+    assert files == ["run_date=2025-06-17/merchant_name=ACME", f"run_date=2025-06-17/merchant_name={io_handler.UNKNOWN_MERCHANT}",
+                     "run_date=2025-06-18/merchant_name=ACME"]
+    table = io_handler.read_bonuses_from_parquet(str(tmp_path), columns=["id"], filters=[("run_date", "=", "2025-06-17")])
+    assert table.num_rows == 20
+
+def test_db_write_is_idempotent_per_run_date(tmp_path):
+    import store
+
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    logger = logging.getLogger("test")
+    day = datetime.date(2025, 6, 17)
+    io_handler.write_bonuses_to_db([_bonus(1, "ACME"), _bonus(2, "ACME")], db_url, logger, day)
+    updated = _bonus(2, "ACME")
+    updated.amount = 99.0
+    io_handler.write_bonuses_to_db([updated, _bonus(3, "Other Co")], db_url, logger, day)
+
+    rows = store.query_bonuses(db_url, run_date=day)
+    assert sorted(r["id"] for r in rows) == ["1", "2", "3"]
+    assert [r["amount"] for r in store.query_bonuses(db_url, merchant="ACME", min_amount=50)] == [99.0]
+
+def test_since_finds_bonuses_changed_later_the_same_day(tmp_path):
+    import processing
+    import store
+
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    logger = logging.getLogger("test")
+    day = datetime.date(2025, 6, 17)
+
+    def scrape(*amounts):
+        raw = [{"id": i, "name": f"Bonus {i}", "amount": a} for i, a in enumerate(amounts)]
+        io_handler.write_bonuses_to_db(processing.process_bonuses(raw, "https://example.com", "ACME", logger), db_url, logger, day)
+
+    scrape(5, 6)
+    first = {r["id"]: r for r in store.query_bonuses(db_url, run_date=day)}
+    since = datetime.datetime.utcnow()
+    scrape(5, 7)  # bonus 0 unchanged, bonus 1 changed
+
+    rows = store.query_bonuses(db_url, since=since)
+    assert [(r["id"], r["amount"]) for r in rows] == [("1", 7.0)]
+    assert rows[0]["created_at"] == first["1"]["created_at"] < rows[0]["updated_at"]
+
+@pytest.mark.parametrize("filters", [
+    {}, {"merchant": "ACME"}, {"merchant": "ACME", "since": datetime.datetime(2025, 6, 1)},
+    {"url": "https://example.com", "run_date": datetime.date(2025, 6, 17)},
+    {"claim_type": "DEPOSIT", "max_amount": 10}, {"run_date": datetime.date(2025, 6, 17)},
+])
+def test_filtered_pages_are_read_in_index_order(tmp_path, filters):
+    from sqlalchemy import event
+
+    import store
+
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    io_handler.write_bonuses_to_db([_bonus(1, "ACME")], db_url, logging.getLogger("test"), datetime.date(2025, 6, 17))
+    engine = store.get_engine(db_url)
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        store.query_bonuses(db_url, **filters)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    (statement, parameters), = statements
+    with engine.connect() as conn:
+        plan = " ".join(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+    assert "USING INDEX" in plan and "TEMP B-TREE" not in plan
+
+def test_partition_versions_are_never_reused(tmp_path):
+    import store
+
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    _, start = store.changed_partitions(db_url, None)
+    for merchant in ("ACME", "Other Co", "Other Co"):  # the third write replaces the newest row
+        io_handler.write_bonuses_to_db([_bonus(1, merchant)], db_url, logging.getLogger("test"), datetime.date(2025, 6, 17))
+        changed, version = store.changed_partitions(db_url, start)
+        assert changed == [(merchant, "2025-06-17")] and version > start
+        start = version
+
+def test_csv_sink_rolls_daily_and_keeps_existing_header(tmp_path):
+    import csv
+
+    days = iter([datetime.date(2025, 6, 16), datetime.date(2025, 6, 16), datetime.date(2025, 6, 17)])
+    sink = io_handler.CsvSink(str(tmp_path / "bonuses.csv"), logging.getLogger("test"), clock=lambda: next(days))
+    (tmp_path / "2025-06-17_bonuses.csv").write_text("id,name,retired_column\n0,Old,x\n")
+
+    assert sink.write([_bonus(1, "ACME")])
+    assert sink.write([_bonus(2, "ACME")])
+    assert sink.write([_bonus(3, "ACME")])
+    sink.close()
+
+    with open(tmp_path / "2025-06-16_bonuses.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["id"] for r in rows] == ["1", "2"]
+    assert rows[0]["merchant_name"] == "ACME" and rows[1]["is_auto_claim"] == "False"
+    with open(tmp_path / "2025-06-17_bonuses.csv", newline="") as f:
+        assert list(csv.reader(f)) == [["id", "name", "retired_column"], ["0", "Old", "x"], ["3", "Bonus 3", ""]]
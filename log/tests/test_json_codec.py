@@ -0,0 +1,60 @@
+# tests/test_json_codec.py
+import asyncio
+import json
+import logging
+
+import pytest
+
+import api_client
+import json_codec
+import metrics
+from conftest import FakeSite
+from models import AuthData
+
+def test_select_decodes_only_requested_keys():
+    doc = {
+        "status": "SUCCESS",
+        "data": {
+            "user": {"tricky": ["}", "]\"{", {"a": [1, 2]}], "n": -1.5e3},
+            "bonus": [{"id": 1, "name": "say \"hi\" {x}"}],
+            "html": "<div>[{</div>", "flag": True, "promotions": [], "none": None,
+        },
+        "tail": [1, 2, 3],
+    }
+    body = json.dumps(doc, indent=1).encode()
+    assert json_codec.select(body, api_client.SYNC_SPEC) == {
+        "status": "SUCCESS", "data": {"bonus": doc["data"]["bonus"], "promotions": []},
+    }
+    assert json_codec.select(b'{"data": 5}', {"data": {"bonus": None}}) == {"data": 5}
+    with pytest.raises(ValueError):
+        json_codec.select(b'{"data": [1, 2', {"tail": None})
+
+@pytest.mark.parametrize("body", [
+    b'{"data": {"bonus": [' + b'"a", 1, {"b": [2]}, ' * 5000,  # truncated mid-array
+    b'{"data": {"user": ["' + b'x\\"y, [1], ' * 5000 + b'], "bonus": []}}',  # string never closed
+    b'{"data": {"bonus": []}, "tail": [[[' + b'1, ' * 5000,
+    b'{"status": "SUCC',
+])
+def test_select_rejects_truncated_bodies_in_linear_time(body):
+    # Used to backtrack exponentially in the number of tokens after an unclosed bracket.
+    with pytest.raises(ValueError):
+        json_codec.select(body, api_client.SYNC_SPEC)
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_get_bonuses_caps_body_size(monkeypatch, incremental):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+    bonuses = [{"id": n, "name": "x" * 200} for n in range(50)]
+
+    async def run(max_bytes):
+        site = await FakeSite(bonuses=bonuses).start()
+        try:
+            import aiohttp
+            auth = AuthData(merchant_id="1001", merchant_name="Test", access_id="42", token="tok", api_url=f"{site.url}/api/v1/index.php")
+            async with aiohttp.ClientSession() as session:
+                return await api_client.get_bonuses(auth, session, logging.getLogger("test"), max_bytes, incremental)
+        finally:
+            await site.stop()
+
+    assert len(asyncio.run(run(1 << 20))) == 50
+    assert asyncio.run(run(4096)) is None
+    assert metrics.registry.stage_summary()["sync_data"]["outcomes"] == {"ok": 1, "too_large": 1}
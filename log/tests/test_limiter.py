@@ -0,0 +1,60 @@
+# tests/test_limiter.py
+import asyncio
+
+import limiter
+import metrics
+
+def _result(stage, outcome, seconds):
+    r = metrics.StageResult(stage, {})
+    r.outcome, r.seconds = outcome, seconds
+    return r
+
+def test_aimd_grows_on_target_and_halves_on_backoff():
+    registry = metrics.Registry()
+
+    async def run():
+        lim = limiter.AIMDLimiter(2, max_limit=4, latency_target=1.0, cooldown=0.05, registry=registry)
+        for _ in range(2 + 3):
+            lim(_result("login", "ok", 0.2), 0, 0)
+        assert lim.current == 4
+        for _ in range(8):
+            lim(_result("sync_data", "ok", 0.2), 0, 0)
+        assert lim.current == 4  # capped at max_limit
+        lim(_result("login", "captcha", 0.2), 0, 0)
+        lim(_result("sync_data", "timeout", 0.2), 0, 0)  # same episode: within the cooldown
+        assert lim.current == 2
+        await asyncio.sleep(0.06)
+        lim(_result("landing_fetch", "http_503", 0.2), 0, 0)
+        assert lim.current == 1
+        for _ in range(3):
+            lim(_result("login", "ok", 3.0), 0, 0)  # over the latency target: hold
+        lim(_result("process", "timeout", 0.0), 0, 0)  # not a request stage
+        return lim
+
+    lim = asyncio.run(run())
+    assert lim.current == 1
+    assert [reason for _, _, reason in lim.history] == ["initial", "increase", "increase", "captcha", "http_503"]
+    assert 'scraper_concurrency_limit 1.0' in registry.render_prometheus()
+
+def test_per_host_cap_lets_other_hosts_pass_in_order():
+    async def run():
+        lim = limiter.AIMDLimiter(3, per_host=1, adaptive=False, registry=metrics.Registry())
+        started = []
+
+        async def site(name, host, hold):
+            async with lim.slot(host):
+                started.append(name)
+                await hold.wait()
+
+        hold = asyncio.Event()
+        tasks = [asyncio.create_task(site(n, h, hold)) for n, h in [("a1", "a"), ("a2", "a"), ("b1", "b"), ("c1", "c"), ("d1", "d")]]
+        await asyncio.sleep(0.01)
+        in_flight = (list(started), lim.in_flight)
+        hold.set()
+        await asyncio.gather(*tasks)
+        return in_flight, started, lim.in_flight
+
+    (first, in_flight), started, after = asyncio.run(run())
+    assert first == ["a1", "b1", "c1"] and in_flight == 3
+    assert started == ["a1", "b1", "c1", "a2", "d1"]
+    assert after == 0
@@ -0,0 +1,246 @@
+# tests/test_main.py
+import asyncio
+import json
+import threading
+
+import pytest
+
+import main
+import metrics
+from conftest import FakeSite, write_workspace
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+
+def test_main_scrapes_sites_and_exports_stage_metrics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        good = await FakeSite().start()
+        captcha = await FakeSite(merchant_id="1002", login_status="ERROR", login_message="Invalid Captcha!").start()
+        try:
+            write_workspace(tmp_path, [good.url, captcha.url], "\n[metrics]\nenable_metrics_export = true\n"
+                            "textfile_path = data/metrics/scraper.prom\njson_path = data/metrics/scraper.json\n")
+            await main.main()
+        finally:
+            await good.stop()
+            await captcha.stop()
+
+    asyncio.run(run())
+
+    summary = metrics.registry.stage_summary()
+    assert summary["login"]["outcomes"] == {"ok": 1, "captcha": 1}
+    assert summary["sync_data"]["count"] == 1
+    assert summary["db_write"]["outcomes"] == {"ok": 1}
+    prom = (tmp_path / "data/metrics/scraper.prom").read_text()
+    assert 'scraper_stage_total{outcome="captcha",stage="login"} 1.0' in prom
+    assert 'scraper_stage_seconds_bucket{outcome="ok",stage="landing_fetch",le="+Inf"} 2' in prom
+    snapshot = json.loads((tmp_path / "data/metrics/scraper.json").read_text())
+    assert "scraper_stage_seconds" in snapshot["metrics"]
+
+def test_stall_detector_captures_blocking_call():
+    import logging
+    import time
+    import loop_monitor
+
+    def blocking_call():
+        time.sleep(0.3)
+
+    async def run():
+        detector = loop_monitor.StallDetector(logging.getLogger("test"), threshold=0.1, registry=metrics.Registry())
+        detector.start()
+        await asyncio.sleep(0.1)
+        blocking_call()
+        await asyncio.sleep(0.1)
+        await detector.stop()
+        return detector.summary()
+
+    summary = asyncio.run(run())
+    assert summary["count"] == 1
+    assert summary["max_seconds"] >= 0.25
+    assert "blocking_call" in summary["worst"][0]["stack"]
+
+def test_profile_mode_writes_spans_trace_and_stacks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        site = await FakeSite().start()
+        try:
+            write_workspace(tmp_path, [site.url])
+            await main.main(main.parse_args(["--profile", "data/profile"]))
+        finally:
+            await site.stop()
+
+    asyncio.run(run())
+
+    out = tmp_path / "data/profile"
+    spans = [json.loads(line) for line in (out / "spans.jsonl").read_text().splitlines()]
+    site_spans = {s["span"] for s in spans if s["site"]}
+    assert {"landing_fetch", "login", "sleep", "sync_data", "process"} <= site_spans
+    trace = json.loads((out / "trace.json").read_text())
+    assert any(e["ph"] == "X" and e["name"] == "login" for e in trace["traceEvents"])
+    assert (out / "stacks.folded").exists()
+    assert metrics.registry.span_sink is None
+
+def test_sampler_roots_stacks_without_the_private_task_map(monkeypatch):
+    import profiler
+
+    async def run():
+        sampler = profiler.SamplingProfiler()
+        sampler._loop, sampler._loop_thread_id = asyncio.get_running_loop(), threading.get_ident()
+        sampler._sample()
+        first = set(sampler.samples)
+        monkeypatch.delattr(asyncio.tasks, "_current_tasks")
+        sampler._sample()
+        return first, set(sampler.samples) - first
+
+    with_map, without = asyncio.run(run())
+    assert all(stack.startswith("task:") for stack in with_map)
+    assert [stack.split(";")[0] for stack in without] == ["(loop)"]
+
+def test_mirror_domains_share_one_login_per_merchant(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        sites = [await FakeSite(merchant_id="1001").start() for _ in range(3)]
+        try:
+            write_workspace(tmp_path, [s.url for s in sites])
+            await main.main()
+            first = [list(s.calls) for s in sites]
+            for s in sites:
+                s.calls.clear()
+            await main.main()
+            return sites, first
+        finally:
+            for s in sites:
+                await s.stop()
+
+    sites, first = asyncio.run(run())
+
+    assert sum(c.count("/users/login") for c in first) == 1
+    assert sum(c.count("/users/syncData") for c in first) == 1
+    assert all(c[0] == "landing" for c in first)
+    # Second run: the persisted map groups the domains without any landing fetch.
+    assert all("landing" not in s.calls for s in sites)
+    assert sum(s.calls.count("/users/login") for s in sites) == 1
+    mirror_map = json.loads((tmp_path / "data/mirror_map.json").read_text())
+    assert {e["merchant_id"] for e in mirror_map["domains"].values()} == {"1001"}
+    import csv, glob
+    with open(glob.glob(str(tmp_path / "data/*_bonuses.csv"))[0], newline="") as f:
+        assert {row["url"] for row in csv.DictReader(f)} == {s.url for s in sites}
+
+def test_time_budget_runs_best_sites_first_and_skips_the_rest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        sites = [await FakeSite(merchant_id=str(1001 + i)).start() for i in range(3)]
+        try:
+            # Known history: only the last site in file order has ever yielded bonuses.
+            (tmp_path / "data").mkdir()
+            (tmp_path / "data/run_metrics_cache.json").write_text(json.dumps({"total_script_runs": 3, "sites": {
+                sites[0].url: {"cumulative_total_bonuses": 0, "cumulative_total_errors": 3, "runs": 3},
+                sites[1].url: {"cumulative_total_bonuses": 0, "cumulative_total_errors": 3, "runs": 3},
+                sites[2].url: {"cumulative_total_bonuses": 30, "cumulative_total_errors": 0, "runs": 3},
+            }}))
+            write_workspace(tmp_path, [s.url for s in sites])
+            config = (tmp_path / "config.ini").read_text()
+            (tmp_path / "config.ini").write_text(config.replace("max_concurrent_requests = 5", "max_concurrent_requests = 1\nautotune_concurrency = false")
+                                                 .replace("min_request_delay = 0", "min_request_delay = 0.3")
+                                                 .replace("max_request_delay = 0", "max_request_delay = 0.3"))
+            await main.main(main.parse_args(["--time-budget", "0.2"]))
+            return sites
+        finally:
+            for s in sites:
+                await s.stop()
+
+    sites = asyncio.run(run())
+
+    assert "/users/syncData" in sites[2].calls
+    assert sites[0].calls == [] and sites[1].calls == []
+    cache = json.loads((tmp_path / "data/run_metrics_cache.json").read_text())
+    assert cache["total_script_runs"] == 4
+    assert cache["sites"][sites[2].url]["runs"] == 4
+    assert cache["sites"][sites[0].url]["runs"] == 3
+
+def test_daemon_rescrapes_on_interval_and_hot_reloads_urls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        first = await FakeSite(merchant_id="1001").start()
+        second = await FakeSite(merchant_id="2002").start()
+        try:
+            write_workspace(tmp_path, [first.url], "\n[daemon]\ninitial_interval = 0.2\nmin_interval = 0.1\nmax_interval = 0.3\n"
+                            "reload_interval = 0.05\ncheckpoint_interval = 0.1\n")
+
+            async def add_url():
+                await asyncio.sleep(0.3)
+                (tmp_path / "urls.txt").write_text(f"{first.url}\n{second.url}\n")
+
+            adder = asyncio.create_task(add_url())
+            await main.main(main.parse_args(["--daemon", "--time-budget", "1.2"]))
+            await adder
+            return first, second
+        finally:
+            await first.stop()
+            await second.stop()
+
+    first, second = asyncio.run(run())
+
+    assert first.calls.count("/users/syncData") >= 3
+    assert second.calls.count("/users/syncData") >= 1  # picked up from the reloaded list
+    cache = json.loads((tmp_path / "data/run_metrics_cache.json").read_text())
+    entry = cache["sites"][first.url]
+    assert entry["runs"] >= 3
+    assert 0.1 <= entry["interval"] <= 0.3
+    assert entry["next_due"] > 0
+
+def test_sample_mode_skips_quiet_sites(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        sites = [await FakeSite(merchant_id=str(1001 + i)).start() for i in range(6)]
+        try:
+            write_workspace(tmp_path, [s.url for s in sites])
+            await main.main()
+            for s in sites:
+                s.calls.clear()
+            await main.main(main.parse_args(["--sample", "2"]))
+            return sites
+        finally:
+            for s in sites:
+                await s.stop()
+
+    sites = asyncio.run(run())
+
+    synced = [s for s in sites if "/users/syncData" in s.calls]
+    # Nothing changed in the sample, so only the sampled merchants were hit.
+    assert len(synced) == 2
+    assert sum(len(s.calls) for s in sites) == 2 * 2  # login + sync; the mirror map skips landing
+
+def test_one_login_serves_bonuses_and_downline_pages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pages = [[{"id": i, "name": f"user{i}", "count": 1, "amount": "2.5", "registerDateTime": "2025-06-01 10:00:00"} for i in range(p * 2, p * 2 + 2)]
+             for p in range(3)]
+
+    async def run():
+        site = await FakeSite(downline_pages=pages).start()
+        try:
+            write_workspace(tmp_path, [site.url], "\n[features]\ndownlines = true\ndownline_page_delay = 0\n")
+            await main.main()
+            await main.main()
+            return site
+        finally:
+            await site.stop()
+
+    site = asyncio.run(run())
+
+    assert site.calls.count("/users/login") == 2
+    assert site.calls.count("/users/syncData") == 2
+    assert site.calls.count("/referrer/getDownline") == 2 * 4  # three pages plus the empty one, per run
+    import csv
+    with open(tmp_path / "data/downlines.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["id"] for r in rows] == [str(i) for i in range(6)]  # the second run added no duplicates
+    cache = json.loads((tmp_path / "data/run_metrics_cache.json").read_text())
+    assert cache["sites"][site.url]["cumulative_total_downlines"] == 12
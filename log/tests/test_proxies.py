@@ -0,0 +1,113 @@
+# tests/test_proxies.py
+import asyncio
+
+import pytest
+
+import main
+import metrics
+import proxies
+from conftest import FakeSite, StandInProxy, write_workspace
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+
+def _healthy_gauge():
+    return {s["labels"]["proxy"]: s["value"] for s in metrics.registry.metrics["scraper_proxy_healthy"].snapshot()}
+
+def test_ejection_moves_sticky_keys_and_cap_holds():
+    async def run():
+        pool = proxies.ProxyPool(["http://10.0.0.1:8080", "http://10.0.0.2:8080"], max_per_proxy=1, failures_before_eject=2)
+        first = pool.route("1001")
+        assert pool.route("1001") is first
+        assert pool.route("1002") is not first  # spread by assigned keys
+
+        order = []
+
+        async def hold(tag):
+            async with pool.session("1001"):
+                order.append(f"{tag}+")
+                await asyncio.sleep(0.01)
+                order.append(f"{tag}-")
+
+        await asyncio.gather(hold("a"), hold("b"))
+        assert order == ["a+", "a-", "b+", "b-"]  # one at a time on the pinned proxy
+
+        pool.report(first, "captcha")
+        pool.report(first, metrics.OK)  # a success resets the streak
+        pool.report(first, "captcha")
+        assert pool.route("1001") is first
+        pool.report(first, "http_429")
+        await asyncio.sleep(0)
+        moved = pool.route("1001")
+        assert moved is not first and pool.summary()[first.name]["healthy"] is False
+
+        pool.report(moved, "timeout")
+        pool.report(moved, "timeout")
+        with pytest.raises(proxies.ProxyUnavailable):
+            async with pool.session("1001"):
+                pass
+
+    asyncio.run(run())
+
+def test_new_keys_spread_over_free_proxies_whatever_their_latency():
+    async def run():
+        pool = proxies.ProxyPool(["http://fast:1", "http://slow:1", "http://slower:1"], max_per_proxy=2)
+        fast, slow, slower = pool.proxies
+        fast.latency, slow.latency, slower.latency = 0.05, 0.3, 0.35
+        assert [pool.route(str(k)).name for k in range(6)] == ["fast:1", "slow:1", "slower:1"] * 2
+
+        # A proxy at its cap is passed over for new keys while another has a slot.
+        async with pool.session("0"), pool.session("3"):
+            assert fast.in_flight == 2
+            assert pool.route("new") is slow
+
+    asyncio.run(run())
+
+def test_ejected_proxy_rejoins_without_probes(monkeypatch):
+    async def run():
+        pool = proxies.ProxyPool(["http://10.0.0.1:8080", "http://10.0.0.2:8080"], failures_before_eject=1, eject_seconds=30)
+        first = pool.route("1001")
+        pool.report(first, "timeout")
+        assert _healthy_gauge()[first.name] == 0
+        later = proxies.time.monotonic() + 31
+        monkeypatch.setattr(proxies.time, "monotonic", lambda: later)
+        pool.route("1002")
+        assert first.ejected is False and pool.summary()[first.name]["healthy"] is True
+        assert _healthy_gauge()[first.name] == 1
+
+    asyncio.run(run())
+
+def test_sites_go_out_through_healthy_proxies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        sites = [await FakeSite(merchant_id=str(1001 + i)).start() for i in range(4)]
+        good = [await StandInProxy().start() for _ in range(2)]
+        dead = await StandInProxy().start()
+        await dead.stop()
+        try:
+            (tmp_path / "proxies.txt").write_text("# pool\n" + "\n".join(p.url for p in good + [dead]) + "\n")
+            write_workspace(tmp_path, [s.url for s in sites],
+                            "\n[proxies]\nenable_proxies = true\nmax_per_proxy = 1\nprobe_interval = 0\n"
+                            f"probe_url = {sites[0].url}/\n")
+            await main.main()
+        finally:
+            for s in sites:
+                await s.stop()
+            for p in good:
+                await p.stop()
+        return sites, good
+
+    sites, good = asyncio.run(run())
+
+    assert all("/users/syncData" in s.calls for s in sites)
+    assert metrics.registry.stage_summary()["site"]["outcomes"] == {"ok": 4}
+    # Both live proxies were probed, and both carried sites: the load was split.
+    assert all(sites[0].url[7:] in p.targets for p in good)
+    probe = (sites[0].url[7:], "/")
+    assert all(set(p.paths) - {probe} for p in good)
+    # Each merchant's login and API calls (one token, one exit IP) went out through exactly one proxy.
+    api = [{netloc for netloc, path in p.paths if path != "/"} for p in good]
+    for site in sites:
+        assert sum(site.url[7:] in netlocs for netlocs in api) == 1
@@ -0,0 +1,117 @@
+# tests/test_read_api.py
+import asyncio
+import datetime
+import json
+import logging
+
+import aiohttp
+
+import io_handler
+import processing
+import read_api
+import store
+
+def _write(db_url, day, *raw, url="http://site.test", merchant="ACME"):
+    bonuses = processing.process_bonuses(list(raw), url, merchant, logging.getLogger("test"))
+    assert io_handler.write_bonuses_to_db(bonuses, db_url, logging.getLogger("test"), day)
+
+def test_pages_filters_cache_and_etags(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    day = datetime.date(2026, 3, 1)
+    _write(db_url, day, *[{"id": i, "name": f"B{i}", "amount": i} for i in range(5)])
+    _write(db_url, day, {"id": 1, "name": "Other", "amount": 50}, url="http://other.test", merchant="Other")
+
+    async def run():
+        api = read_api.ReadApi(db_url, logging.getLogger("test"))
+        await api.start(port=0)
+        base = f"http://127.0.0.1:{api.port}"
+        try:
+            async with aiohttp.ClientSession() as http:
+                async def get(path, **headers):
+                    async with http.get(base + path, headers=headers) as r:
+                        return r.status, r.headers.get("ETag"), (await r.json() if r.status == 200 else None)
+
+                _, _, page1 = await get("/merchants/ACME/bonuses?limit=3")
+                _, _, page2 = await get(f"/merchants/ACME/bonuses?limit=3&offset={page1['next_offset']}")
+                ids = [b["id"] for b in page1["items"] + page2["items"]]
+                assert sorted(ids) == ["0", "1", "2", "3", "4"] and page2["next_offset"] is None
+
+                status, etag, body = await get("/bonuses?min_amount=10&run_date=2026-03-01")
+                assert [b["merchant_name"] for b in body["items"]] == ["Other"]
+                hits = api.cache.hits
+                assert (await get("/bonuses?run_date=2026-03-01&min_amount=10", **{"If-None-Match": etag}))[:2] == (304, etag)
+                assert api.cache.hits == hits + 1  # same query, other parameter order: served from cache
+
+                assert (await get("/bonuses?min_amount=lots"))[0] == 400
+                assert (await get("/bonuses?run_date=2026-02-28"))[2]["items"] == []
+
+                # A write (any connection) to Other on 03-01 drops the cached queries over that partition:
+                # the ETag changes. ACME's pages and the other day stay cached.
+                _write(db_url, day, {"id": 7, "name": "New", "amount": 70}, url="http://other.test", merchant="Other")
+                status, new_etag, body = await get("/bonuses?min_amount=10&run_date=2026-03-01", **{"If-None-Match": etag})
+                assert status == 200 and new_etag != etag and len(body["items"]) == 2
+                assert api.cache.invalidations == 1
+                hits = api.cache.hits
+                assert (await get("/merchants/ACME/bonuses?limit=3"))[2] == page1
+                assert (await get("/bonuses?run_date=2026-02-28"))[0] == 200
+                assert api.cache.hits == hits + 2
+
+                _write(db_url, day, {"id": 2, "name": "B2", "amount": 99})
+                assert (await get("/bonuses?run_date=2026-02-28"))[0] == 200
+                assert api.cache.invalidations == 4  # both ACME pages and the refreshed 03-01 query
+        finally:
+            await api.stop()
+
+    asyncio.run(run())
+
+def test_cache_drops_only_entries_a_write_can_reach():
+    cache = read_api.ResultCache()
+    cache.advance(1, [])
+    scopes = {
+        "acme": ("ACME", None, None), "acme_day": ("ACME", "2026-03-01", None), "other_day": (None, "2026-02-28", None),
+        "full_page": (None, None, "2026-03-01"),  # next row is from 03-01: older days cannot reach this page
+        "last_page": (None, None, None),
+    }
+    for key, scope in scopes.items():
+        cache.put(1, key, scope, ('"etag"', b"{}"))
+
+    def kept():
+        return {key for key in scopes if key in cache._entries}
+
+    cache.advance(2, [("Other", "2026-02-27")])
+    assert kept() == {"acme", "acme_day", "other_day", "full_page"}
+    cache.advance(3, [("ACME", "2026-03-01")])
+    assert kept() == {"other_day"}
+    cache.advance(4, [(store.ALL, store.ALL)])
+    assert kept() == set() and cache.invalidations == 5
+
+def test_events_stream_resumes_from_last_event_id(tmp_path):
+    changelog = tmp_path / "changes.jsonl"
+    lines = [{"type": "added", "id": str(i), "url": "http://site.test"} for i in range(3)]
+    offset = 0
+    with open(changelog, "wb") as f:
+        for event in lines:
+            event["offset"] = offset
+            raw = (json.dumps(event) + "\n").encode()
+            f.write(raw)
+            offset += len(raw)
+
+    async def run():
+        api = read_api.ReadApi(f"sqlite:///{tmp_path / 'bonuses.db'}", logging.getLogger("test"),
+                               changelog_path=str(changelog), event_poll=0.05)
+        await api.start(port=0)
+        try:
+            async with aiohttp.ClientSession() as http:
+                first = lines[0]["offset"]
+                async with http.get(f"http://127.0.0.1:{api.port}/events", headers={"Last-Event-ID": str(first)}) as r:
+                    assert r.headers["Content-Type"] == "text/event-stream"
+                    data = []
+                    while len(data) < 2:
+                        line = (await asyncio.wait_for(r.content.readline(), 5)).decode()
+                        if line.startswith("data: "):
+                            data.append(json.loads(line[6:]))
+                    return data
+        finally:
+            await api.stop()
+
+    assert [e["id"] for e in asyncio.run(run())] == ["1", "2"]
@@ -0,0 +1,73 @@
+# tests/test_sampling.py
+import random
+
+import pytest
+
+import sampling
+
+def _cache(n_static, n_volatile):
+    sites = {f"https://s{i}.test": {"signature": "x", "runs": 10, "changes": 0} for i in range(n_static)}
+    sites.update({f"https://v{i}.test": {"signature": "x", "runs": 10, "changes": 8} for i in range(n_volatile)})
+    return {"sites": sites}
+
+def test_wilson_interval():
+    low, high = sampling.wilson(0.0, 20)
+    assert low == 0.0 and high == pytest.approx(0.1611, abs=1e-4)
+    low, high = sampling.wilson(0.5, 100)
+    assert (low, high) == (pytest.approx(0.4038, abs=1e-4), pytest.approx(0.5962, abs=1e-4))
+
+def test_plan_allocates_per_stratum_and_estimate_drives_decision():
+    cache = _cache(80, 20)
+    urls = list(cache["sites"]) + ["https://new.test", "https://s0.test/ref/123"]
+    plan = sampling.plan_sample(urls, cache, 10, rng=random.Random(7))
+    strata = [sampling.volatility(cache["sites"].get(u)) for u in plan.sample]
+    assert strata.count("static") == 8 and strata.count("volatile") == 2
+    assert "https://new.test" not in plan.sample
+    # s0 and its referral URL are one family: counted and sampled once.
+    assert plan.family_count("static") == 80
+
+    quiet = sampling.estimate(plan, {u: False for u in plan.sample})
+    assert quiet.changed == 0.0 and quiet.high < 0.5
+    assert sampling.decide(quiet, 0.05, 0.3) == "targeted"
+    assert sampling.decide(quiet, 0.6, 0.9) == "skip"
+    assert sampling.targets(plan, quiet) == ["https://new.test"]
+
+    moving = {u: u.startswith("https://v") for u in plan.sample}
+    est = sampling.estimate(plan, moving)
+    assert est.changed == pytest.approx(0.2)
+    assert est.by_stratum == {"volatile": (2, 2), "static": (0, 8)}
+    assert set(sampling.targets(plan, est)) == {f"https://v{i}.test" for i in range(20)} | {"https://new.test"}
+
+    busy = sampling.estimate(plan, {u: True for u in plan.sample})
+    assert sampling.decide(busy, 0.05, 0.3) == "full"
+    assert sampling.decide(sampling.estimate(plan, {}), 0.05, 0.3) == "full"
+
+def test_default_sample_size_can_reach_skip():
+    n = sampling.skip_sample_size(0.05)
+    assert n == 73
+    assert sampling.wilson(0.0, n)[1] < 0.05 <= sampling.wilson(0.0, n - 1)[1]
+
+    cache = _cache(500, 0)
+    plan = sampling.plan_sample(list(cache["sites"]), cache, n, rng=random.Random(1))
+    quiet = sampling.estimate(plan, {u: False for u in plan.sample})
+    assert quiet.observed == 73 and quiet.high < 0.05
+    assert sampling.decide(quiet, 0.05, 0.3) == "skip"
+
+def test_estimate_with_known_counts():
+    cache = _cache(100, 0)
+    plan = sampling.plan_sample(list(cache["sites"]), cache, 20, rng=random.Random(2))
+    changed = {u: i < 5 for i, u in enumerate(plan.sample)}
+    est = sampling.estimate(plan, changed)
+    # p = 5/20; var = (1 - 20/100) * p(1-p) / 19, so n_eff = 19 / 0.8 = 23.75 (under the FPC cap 20 * 99 / 80)
+    low, high = sampling.wilson(0.25, 23.75)
+    assert (est.changed, est.low, est.high) == (0.25, round(low, 4), round(high, 4))
+    assert est.by_stratum == {"static": (5, 20)}
+    assert sampling.decide(est, 0.05, 0.3) == "targeted"
+    assert sampling.decide(est, 0.05, 0.1) == "full"
+
+    # Every family sampled: the share is known exactly, so a quiet small fleet can skip.
+    small = _cache(10, 0)
+    census = sampling.plan_sample(list(small["sites"]), small, 30, rng=random.Random(3))
+    est = sampling.estimate(census, {u: False for u in census.sample})
+    assert (est.changed, est.low, est.high, est.observed) == (0.0, 0.0, 0.0, 10)
+    assert sampling.decide(est, 0.05, 0.3) == "skip"
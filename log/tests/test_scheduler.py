@@ -0,0 +1,42 @@
+# tests/test_scheduler.py
+import datetime
+from types import SimpleNamespace
+
+import scheduler
+
+NOW = datetime.datetime(2025, 6, 10, 12, 0)
+
+def _entry(bonuses, errors, runs, hours_ago, changes=0):
+    return {"cumulative_total_bonuses": bonuses, "cumulative_total_errors": errors, "runs": runs,
+            "changes": changes, "last_processed_ts": (NOW - datetime.timedelta(hours=hours_ago)).isoformat()}
+
+def test_prioritize_orders_by_yield_errors_and_staleness():
+    cache = {"total_script_runs": 10, "sites": {
+        "https://rich.test": _entry(200, 0, 10, 24, changes=5),
+        "https://dead.test": _entry(0, 10, 10, 24),
+        "https://flaky.test": _entry(200, 8, 10, 24),
+        "https://fresh.test": _entry(200, 0, 10, 0.1),
+    }}
+    order = scheduler.prioritize(["https://dead.test", "https://flaky.test", "https://new.test",
+                                  "https://fresh.test", "https://rich.test"], cache, NOW)
+    assert order[0] == "https://rich.test"
+    assert order[-1] == "https://dead.test"
+    assert order.index("https://fresh.test") < order.index("https://flaky.test")
+    # Unknown sites are explored ahead of known-poor ones.
+    assert order.index("https://new.test") < order.index("https://flaky.test")
+
+def test_record_result_tracks_changes_and_legacy_fields():
+    cache = {"total_script_runs": 4, "sites": {"https://a.test": {"cumulative_total_bonuses": 9, "cumulative_total_errors": 1}}}
+    bonuses = [SimpleNamespace(id="1", amount=10.0), SimpleNamespace(id="2", amount=5.0)]
+    scheduler.record_result(cache, "https://a.test", True, 2, scheduler.bonus_signature(bonuses), NOW)
+    scheduler.record_result(cache, "https://a.test", True, 2, scheduler.bonus_signature(bonuses[::-1]), NOW)
+    bonuses[0].amount = 20.0
+    scheduler.record_result(cache, "https://a.test", True, 2, scheduler.bonus_signature(bonuses), NOW)
+    scheduler.record_result(cache, "https://a.test", False, 0, None, NOW)
+    entry = cache["sites"]["https://a.test"]
+    assert entry["runs"] == 3 + 4
+    assert entry["changes"] == 1
+    assert entry["cumulative_total_bonuses"] == 15
+    assert entry["cumulative_total_errors"] == 2
+    assert entry["last_run_new_errors"] == 1
+    assert entry["last_processed_ts"] == NOW.isoformat()
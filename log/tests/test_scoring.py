@@ -0,0 +1,71 @@
+# tests/test_scoring.py
+import datetime
+import logging
+import random
+import sqlite3
+import sys
+
+import pytest
+
+import io_handler
+import processing
+import scoring
+import store
+
+def _columns(rows):
+    return {k: [r.get(k) for r in rows] for k in scoring.SCORE_INPUTS}
+
+def _pure_python(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)  # import numpy raises ImportError
+
+def test_known_values_and_missing_inputs(monkeypatch):
+    rows = [
+        # credit 100 capped to 80; rollover cost 0.05 * 10 * 100; 10% loss on the 20 deposit
+        {"amount": 100, "bonus_fixed": 0, "rollover": 10, "min_withdraw": 50, "max_withdraw": 80,
+         "min_topup": 20, "loss_req_percent": 10},
+        # fixed 10 wins over amount; reaching min_withdraw 50 is a 10/50 chance
+        {"amount": 100, "bonus_fixed": 10, "rollover": 1, "min_withdraw": 50},
+        # the TOPUP_ requirement is the stake when it exceeds min_topup
+        {"amount": 5, "min_topup": 10, "topup_req_amount": 40, "loss_req_percent": 50, "loss_req_amount": 1},
+        {},  # nothing known: scores 0, not NaN or None
+    ]
+    expected = [28.0, 1.5, -16.0, 0.0]
+    assert scoring.score_columns(_columns(rows)) == expected
+    _pure_python(monkeypatch)
+    assert scoring.score_columns(_columns(rows)) == expected
+
+def test_numpy_and_python_paths_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(3)
+    rows = [{k: rng.choice([None, 0, 0.5, 1, 5, 20, 100, 1000]) for k in scoring.SCORE_INPUTS} for _ in range(2000)]
+    with_numpy = scoring.score_columns(_columns(rows), house_edge=0.03)
+    _pure_python(monkeypatch)
+    assert scoring.score_columns(_columns(rows), house_edge=0.03) == pytest.approx(with_numpy, abs=1e-3)
+
+def _write_day(db_url, day, amounts):
+    raw = [{"id": i, "name": f"Bonus {i}", "amount": a} for i, a in enumerate(amounts)]
+    bonuses = processing.process_bonuses(raw, "https://example.com", "ACME", logging.getLogger("test"))
+    io_handler.write_bonuses_to_db(bonuses, db_url, logging.getLogger("test"), day)
+
+def test_rescore_all_backfills_and_top_bonuses_ranks_by_run(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'bonuses.db'}"
+    old, new = datetime.date(2025, 6, 16), datetime.date(2025, 6, 17)
+    _write_day(db_url, old, [500, 400])
+    _write_day(db_url, new, [5, 50, 20, 10])
+    conn = sqlite3.connect(tmp_path / "bonuses.db")
+    conn.execute("UPDATE bonuses SET value_score = NULL WHERE run_date = ?", (new.isoformat(),))
+    conn.execute("UPDATE bonuses SET value_score = -1 WHERE run_date = ? AND id = '0'", (old.isoformat(),))
+    conn.commit()
+
+    # Unscored rows are left out of the ranking until a rescore fills them in.
+    assert scoring.top_bonuses(db_url, 3) == []
+    engine = store.get_engine(db_url)
+    assert scoring.rescore_all(engine, only_missing=True) == 4
+    assert conn.execute("SELECT value_score FROM bonuses WHERE id = '0' AND run_date = ?", (old.isoformat(),)).fetchone() == (-1,)
+
+    top = scoring.top_bonuses(db_url, 3)  # latest run by default
+    assert [(b["run_date"], b["amount"]) for b in top] == [(new.isoformat(), 50), (new.isoformat(), 20), (new.isoformat(), 10)]
+    assert [b["amount"] for b in scoring.top_bonuses(db_url, 5, run_date=old)] == [400, 500]  # 500 still carries -1
+
+    assert scoring.rescore_all(engine) == 6
+    assert [b["amount"] for b in scoring.top_bonuses(db_url, 5, run_date=old)] == [500, 400]
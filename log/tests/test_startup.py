@@ -0,0 +1,35 @@
+# tests/test_startup.py
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+HEAVY = ("aiohttp", "sqlalchemy", "pydantic", "pyarrow", "numpy")
+# Cumulative microseconds for `import main`; the heavy set alone costs several times this.
+STARTUP_BUDGET_US = 400_000
+
+def _importtime(code, cwd):
+    """Runs code under -X importtime; returns {top-level module: cumulative us}."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=cwd, env=env, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    times = {}
+    for m in re.finditer(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", proc.stderr):
+        times.setdefault(m.group(3), int(m.group(1)))
+    return times
+
+def _heavy(times):
+    return sorted(name for name in times if name.split(".")[0] in HEAVY)
+
+def test_import_main_stays_within_startup_budget():
+    times = _importtime("import main", REPO_ROOT)
+    assert _heavy(times) == []
+    assert times["main"] < STARTUP_BUDGET_US, f"import main took {times['main']}us"
+
+def test_empty_url_list_does_not_load_heavy_dependencies(tmp_path):
+    from conftest import write_workspace
+    write_workspace(tmp_path, [])
+    times = _importtime("import asyncio, main; asyncio.run(main.main())", tmp_path)
+    assert _heavy(times) == []
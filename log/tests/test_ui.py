@@ -0,0 +1,48 @@
+# tests/test_ui.py
+import collections
+import io
+
+import metrics
+import ui
+
+class _Tty(io.StringIO):
+    def isatty(self):
+        return True
+
+def test_dashboard_renders_from_counters_without_per_site_output(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+    metrics.registry.observe_stage("login", "captcha", 0.1)
+    metrics.registry.observe_stage("login", "ok", 0.1)
+    stream = _Tty()
+    handler = ui.UIHandler(stream=stream)
+    handler.set_total_urls(4)
+    tracker = collections.deque([handler._started + 0.5] * 6)
+    handler.tracker = tracker  # what start() would install
+    written = stream.tell()
+
+    handler.site_started("https://a.test")
+    handler.site_started("https://b.test")
+    handler.update("https://a.test", True, 3, tracker)
+    assert stream.tell() == written  # updates only touch counters
+
+    frame = handler.render(now=handler._started + 2)
+    assert "1/4 sites" in frame
+    assert "Rate:   3.0 req/s" in frame
+    assert "In flight (1): https://b.test" in frame
+    assert "login:captcha=1" in frame
+    assert "ETA: 00:06" in frame
+
+    handler.redraw()
+    handler.redraw()
+    assert stream.getvalue().count("\x1b[4A\x1b[J") == 1
+
+def test_dashboard_lines_fit_the_terminal_width(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+    monkeypatch.setenv("COLUMNS", "40")
+    handler = ui.UIHandler(stream=_Tty())
+    handler.set_total_urls(400)
+    for n in range(20):
+        handler.site_started(f"https://site-with-a-long-name-{n}.test")
+    frame = handler.render(now=handler._started + 2)
+    assert len(frame.split("\n")) == ui.UIHandler.LINES
+    assert max(len(line) for line in frame.split("\n")) == 39
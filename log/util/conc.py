@@ -1,37 +1,142 @@
+import argparse
+import datetime
+import fnmatch
+import gzip
+import json
 import os
+import shutil
 
-def concatenate_files(root_directory, output_filepath):
-    """Concatenates all files in a directory and its subdirectories into one file."""
+CHUNK_SIZE = 1024 * 1024
+
+def _copy(infile, outfile, size):
+    """Streams infile into outfile: os.sendfile where the platform allows it, fixed-size chunks otherwise."""
+    if hasattr(os, "sendfile"):
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(outfile.fileno(), infile.fileno(), offset, min(CHUNK_SIZE, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+            return offset
+        except OSError:
+            if offset:
+                raise
+    shutil.copyfileobj(infile, outfile, CHUNK_SIZE)
+    return size
+
+def iter_files(root_directory, include=None, exclude=None, newer_than=None, skip=()):
+    """Yields (path, relative path, stat) under root in sorted order, filtered by glob and mtime."""
+    skip = {os.path.realpath(p) for p in skip}
+    for dirpath, dirnames, filenames in os.walk(root_directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(file_path, root_directory)
+            if os.path.realpath(file_path) in skip:
+                continue
+            if include and not any(fnmatch.fnmatch(rel_path, p) for p in include):
+                continue
+            if exclude and any(fnmatch.fnmatch(rel_path, p) for p in exclude):
+                continue
+            try:
+                st = os.stat(file_path)
+            except OSError as e:
+                print(f"Error reading file: {file_path} - {e}")
+                continue
+            if newer_than is not None and st.st_mtime < newer_than:
+                continue
+            yield file_path, rel_path, st
+
+def concatenate_files(root_directory, output_filepath, include=None, exclude=None, newer_than=None, compress=False, manifest=True):
+    """
+    Concatenates all files in a directory and its subdirectories into one file,
+    streaming each file instead of reading it into memory. With compress, each
+    file becomes its own gzip member (the bundle still gunzips to the plain
+    concatenation). Writes <output>.manifest.json with every file's offset and
+    length in the bundle unless manifest is False. Returns the manifest entries.
+    """
     if not root_directory or not output_filepath:
         raise ValueError("Root directory and output file path cannot be empty")
     if not os.path.exists(root_directory):
         raise FileNotFoundError(f"Root directory does not exist: {root_directory}")
-    
+
     output_dir = os.path.dirname(output_filepath)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
-        
+
+    manifest_path = f"{output_filepath}.manifest.json"
+    entries = []
     with open(output_filepath, 'wb') as outfile:
-        for dirpath, _, filenames in os.walk(root_directory):
-            for filename in filenames:
-                file_path = os.path.join(dirpath, filename)
-                try:
-                    with open(file_path, 'rb') as infile:
-                        outfile.write(infile.read())
-                except Exception as e:
-                    print(f"Error reading file: {file_path} - {e}")
+        for file_path, rel_path, st in iter_files(root_directory, include, exclude, newer_than, skip=(output_filepath, manifest_path)):
+            offset = outfile.tell()
+            try:
+                with open(file_path, 'rb') as infile:
+                    if compress:
+                        with gzip.GzipFile(filename=rel_path, mode='wb', fileobj=outfile, mtime=int(st.st_mtime)) as gz:
+                            shutil.copyfileobj(infile, gz, CHUNK_SIZE)
+                    else:
+                        outfile.flush()
+                        _copy(infile, outfile, st.st_size)
+                        outfile.seek(0, os.SEEK_END)
+            except Exception as e:
+                print(f"Error reading file: {file_path} - {e}")
+                outfile.seek(offset)
+                outfile.truncate()
+                continue
+            entries.append({"path": rel_path, "offset": offset, "length": outfile.tell() - offset,
+                            "size": st.st_size, "mtime": st.st_mtime})
+
+    if manifest:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({"root": os.path.abspath(root_directory), "compressed": compress, "files": entries}, f, indent=1)
+    return entries
+
+def extract_file(bundle_path, rel_path, manifest_path=None):
+    """Returns one file's bytes from a bundle by seeking to its manifest offset."""
+    with open(manifest_path or f"{bundle_path}.manifest.json", encoding='utf-8') as f:
+        manifest = json.load(f)
+    entry = next((e for e in manifest["files"] if e["path"] == rel_path), None)
+    if entry is None:
+        raise KeyError(f"{rel_path} is not in the bundle")
+    with open(bundle_path, 'rb') as f:
+        f.seek(entry["offset"])
+        data = f.read(entry["length"])
+    return gzip.decompress(data) if manifest["compressed"] else data
+
+def _since(value):
+    return datetime.datetime.fromisoformat(value).timestamp()
 
 if __name__ == "__main__":
     default_root = "/data/data/com.termux/files/home/storage/shared/py/sim"
     default_output = "/data/data/com.termux/files/home/storage/shared/py/sim/util/conc.txt"
-    
-    print(f"Enter root directory path (default: {default_root}):")
-    root_directory = input().strip() or default_root
-    print(f"Enter output file path (default: {default_output}):")
-    output_filepath = input().strip() or default_output
+
+    parser = argparse.ArgumentParser(description="Bundle a directory tree into one file, with an offset manifest.")
+    parser.add_argument("root", nargs="?", help=f"Root directory (prompted if omitted; default {default_root}).")
+    parser.add_argument("output", nargs="?", help=f"Output file (prompted if omitted; default {default_output}).")
+    parser.add_argument("--include", action="append", help="Only files whose relative path matches this glob (repeatable).")
+    parser.add_argument("--exclude", action="append", help="Skip files whose relative path matches this glob (repeatable).")
+    parser.add_argument("--since", type=_since, help="Only files modified at or after this ISO date/time.")
+    parser.add_argument("--gzip", action="store_true", help="Compress on the fly (one gzip member per file).")
+    parser.add_argument("--no-manifest", action="store_true")
+    parser.add_argument("--extract", metavar="REL_PATH", help="Print one file from the bundle given as 'output' instead of bundling.")
+    args = parser.parse_args()
+
+    if args.extract:
+        os.write(1, extract_file(args.output or args.root, args.extract))
+        raise SystemExit(0)
+
+    root_directory = args.root
+    if not root_directory:
+        print(f"Enter root directory path (default: {default_root}):")
+        root_directory = input().strip() or default_root
+    output_filepath = args.output
+    if not output_filepath:
+        print(f"Enter output file path (default: {default_output}):")
+        output_filepath = input().strip() or default_output
 
     try:
-        concatenate_files(root_directory, output_filepath)
-        print(f"Files concatenated to: {output_filepath}")
+        entries = concatenate_files(root_directory, output_filepath, args.include, args.exclude, args.since, args.gzip, not args.no_manifest)
+        print(f"{len(entries)} files concatenated to: {output_filepath}")
     except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+        print(f"Error: {e}")
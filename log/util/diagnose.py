@@ -0,0 +1,225 @@
+# diagnose.py
+# Builds the "Diagnostics & URL Analysis" report and the pruned-site list from
+# the rotated scraper logs (log/log.log, log.log.1, ...). Each file is
+# memory-mapped and only the lines carrying a failure event or an "OK:" line
+# are located (by substring search) and decoded; everything else is skipped.
+#   python log/util/diagnose.py --logs "log/log.log*" --out log/reports
+import argparse
+import glob
+import json
+import mmap
+import os
+import re
+import sys
+from http import HTTPStatus
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from metrics import status_outcome
+
+DETAILS = b" -- Details: "
+OK_MARK = b" - OK: "
+# Event code -> how its record is classified.
+FAIL_EVENTS = {
+    b"auth_html_empty": "landing", b"auth_merch_id_fail": "landing", b"auth_html_fetch_fail": "landing",
+    b"auth_api_status_fail": "status", b"auth_api_request_fail": "request",
+    b"bonus_api_status_fail": "status", b"bonus_fetch_fail": "request",
+}
+_OK_URL = re.compile(rb" - OK: (\S+) - ")
+_HTTP_ERR = re.compile(r"^(\d{3}), message=")
+_JSON_POS = re.compile(r"line \d+ column \d+")
+
+# reason -> (category title, explanation); order is report order.
+RECOVERABLE = {
+    "captcha": ("API Status Fail - Invalid Captcha", "The login API is active but is protected by a captcha that the scraper could not solve. This is the highest priority issue to address to increase data yield."),
+    "json_decode": ("API Request Fail - JSON Decode Error", "The script made a successful request to the API endpoint but received a response (likely an HTML error page) that could not be parsed as JSON."),
+    "invalid_login": ("API Status Fail - Invalid Login", "The API explicitly rejected the credentials for these specific sites. The account may be locked or require different credentials."),
+    "invalid_merchant": ("API Status Fail - Invalid Merchant", "The API rejected the request because the `MERCHANTID` scraped from the site was invalid."),
+    "status_fail": ("API Status Fail - Other", "The API answered with a non-SUCCESS status and an unrecognised message."),
+    "too_large": ("API Request Fail - Response Too Large", "The API response exceeded `max_response_bytes` and was discarded."),
+}
+UNREACHABLE = {
+    "connect_error": ("Landing Fetch Fail - Connection Error", "The host could not be reached (DNS failure, refused or reset connection). The domain is likely dead or moved."),
+    "timeout": ("Landing Fetch Fail - Timeout", "The landing page did not respond within the request timeout."),
+    "empty_landing": ("Landing Page Empty", "The landing page returned an empty body."),
+    "no_merchant_id": ("Merchant ID Not Found", "The landing page loaded but has no `MERCHANTID`; the site is probably no longer on the platform."),
+}
+HTTP_NOTES = {
+    405: "The server rejected the API request because the HTTP POST method was not allowed for the target endpoint, indicating a server configuration issue.",
+    403: "The server refused the request outright (often geo- or bot-blocking).",
+}
+
+def classify_error(err: str, stage: str) -> str:
+    """Reason code for a logged request exception string."""
+    if err.startswith("Response body exceeds"):
+        return "too_large"
+    if "decode JSON" in err or "mimetype" in err or _JSON_POS.search(err):
+        return "json_decode"
+    m = _HTTP_ERR.match(err)
+    if m:
+        return f"http_{m.group(1)}"
+    if err.startswith("Cannot connect") or "Connection reset" in err or "ServerDisconnected" in err:
+        return "connect_error"
+    if not err or "timeout" in err.lower():
+        return "timeout"
+    return "request_error" if stage == "request" else "connect_error"
+
+def classify(event: bytes, details: dict) -> str:
+    kind = FAIL_EVENTS[event]
+    if event == b"auth_html_empty":
+        return "empty_landing"
+    if event == b"auth_merch_id_fail":
+        return "no_merchant_id"
+    if kind == "status":
+        response = details.get("response")
+        return status_outcome(response) if isinstance(response, dict) else "status_fail"
+    return classify_error(str(details.get("err", "")), kind)
+
+def site_of(url: str) -> Optional[str]:
+    parsed = urlparse(url.strip())
+    return f"{parsed.scheme}://{parsed.netloc}" if parsed.scheme and parsed.netloc else None
+
+def log_files(pattern: str) -> List[str]:
+    """Rotated logs oldest first: log.log.5, ..., log.log.1, log.log."""
+    def age(path: str) -> int:
+        suffix = path.rsplit(".", 1)[-1]
+        return int(suffix) if suffix.isdigit() else 0
+    return sorted(glob.glob(pattern), key=age, reverse=True)
+
+def _line_bounds(mm: mmap.mmap, pos: int) -> Tuple[int, int]:
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    return start, (len(mm) if end == -1 else end)
+
+def scan_file(path: str, since: Optional[bytes] = None) -> Iterator[Tuple[bytes, str, Optional[str]]]:
+    """
+    Yields (timestamp, site, reason) in file order; reason is None for an OK
+    line. Lines are found with mmap.find on the event markers, so the cost is
+    proportional to the number of matching lines, not the file size.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        hits: List[Tuple[int, Optional[bytes]]] = []
+        for event in FAIL_EVENTS:
+            needle = b" - " + event + DETAILS
+            pos = mm.find(needle)
+            while pos != -1:
+                hits.append((pos, event))
+                pos = mm.find(needle, pos + len(needle))
+        pos = mm.find(OK_MARK)
+        while pos != -1:
+            hits.append((pos, None))
+            pos = mm.find(OK_MARK, pos + len(OK_MARK))
+        hits.sort()
+
+        for pos, event in hits:
+            start, end = _line_bounds(mm, pos)
+            ts = mm[start:start + 23]
+            if since and ts[:10] < since:
+                continue
+            if event is None:
+                m = _OK_URL.match(mm, pos)
+                site = site_of(m.group(1).decode()) if m else None
+                if site:
+                    yield ts, site, None
+                continue
+            details_at = mm.find(DETAILS, pos, end)
+            try:
+                details = json.loads(mm[details_at + len(DETAILS):end])
+            except ValueError:
+                continue
+            site = site_of(str(details.get("url", "")))
+            if site:
+                yield ts, site, classify(event, details)
+
+def analyse(paths: List[str], since: Optional[str] = None) -> Tuple[Dict[str, Set[str]], str]:
+    """
+    Reasons per site still failing at the end of the window (failures since
+    its last OK line), plus the newest timestamp seen.
+    """
+    failing: Dict[str, Set[str]] = {}
+    last_ts = b""
+    since_b = since.encode() if since else None
+    for path in paths:
+        for ts, site, reason in scan_file(path, since_b):
+            last_ts = max(last_ts, ts)
+            if reason is None:
+                failing.pop(site, None)
+            else:
+                failing.setdefault(site, set()).add(reason)
+    return failing, last_ts.decode()
+
+def _category(reason: str) -> Tuple[str, str, bool]:
+    """(title, explanation, recoverable) for a reason code."""
+    if reason in RECOVERABLE:
+        return RECOVERABLE[reason] + (True,)
+    if reason in UNREACHABLE:
+        return UNREACHABLE[reason] + (False,)
+    if reason.startswith("http_"):
+        code = int(reason[5:])
+        try:
+            phrase = HTTPStatus(code).phrase
+        except ValueError:
+            phrase = "HTTP Error"
+        return (f"Request Fail - {code} {phrase}", HTTP_NOTES.get(code, f"The server answered with HTTP {code} ({phrase})."),
+                code not in (403, 404, 410))
+    return ("Request Fail - Other", "The request failed with an unclassified error.", False)
+
+def render_markdown(failing: Dict[str, Set[str]]) -> str:
+    by_reason: Dict[str, List[str]] = {}
+    for site, reasons in failing.items():
+        for reason in reasons:
+            by_reason.setdefault(reason, []).append(site)
+    order = list(RECOVERABLE) + list(UNREACHABLE)
+    reasons = sorted(by_reason, key=lambda r: (order.index(r) if r in order else len(order), -len(by_reason[r]), r))
+
+    sections = {True: [], False: []}
+    for reason in reasons:
+        title, explanation, recoverable = _category(reason)
+        sites = sorted(by_reason[reason])
+        sections[recoverable] += [
+            f"#### Category: {title}",
+            f"* **Count:** {len(sites)}",
+            f"* **Explanation:** {explanation}",
+            f"* **Affected Site{'s' if len(sites) != 1 else ''}:**",
+            "```",
+            *[f"[{s}]({s})" for s in sites],
+            "```",
+            "",
+        ]
+    lines = ["### Recoverable Failures Report", ""] + (sections[True] or ["No recoverable failures.", ""])
+    lines += ["### Unreachable Sites Report", ""] + (sections[False] or ["No unreachable sites.", ""])
+    return "\n".join(lines)
+
+def write_report(failing: Dict[str, Set[str]], last_ts: str, out_dir: str) -> Tuple[str, str, str]:
+    """Writes '<MM-DD> Diagnostics & URL Analysis.md', '<MM-DD> Pruned Sites.txt' and pruned_sites.json."""
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = last_ts[5:10] if last_ts else "00-00"
+    md_path = os.path.join(out_dir, f"{prefix} Diagnostics & URL Analysis.md")
+    txt_path = os.path.join(out_dir, f"{prefix} Pruned Sites.txt")
+    json_path = os.path.join(out_dir, "pruned_sites.json")
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(render_markdown(failing))
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write("".join(f"{site}\n" for site in sorted(failing)))
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"generated_from": last_ts, "sites": {s: sorted(r) for s, r in sorted(failing.items())}}, f, indent=2)
+    return md_path, txt_path, json_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Failure diagnostics report from the rotated scraper logs.")
+    parser.add_argument("--logs", default="log/log.log*", help="Glob of log files (rotations included).")
+    parser.add_argument("--since", help="Only lines on or after this date, YYYY-MM-DD.")
+    parser.add_argument("--out", default="log/reports", help="Report directory.")
+    args = parser.parse_args()
+
+    paths = log_files(args.logs)
+    if not paths:
+        sys.exit(f"No log files match {args.logs}")
+    failing, last_ts = analyse(paths, args.since)
+    for path in write_report(failing, last_ts, args.out):
+        print(f"Wrote {path}")
+    print(f"{len(failing)} failing sites across {len(paths)} log files")
@@ -0,0 +1,106 @@
+# loop_monitor.py
+import asyncio
+import heapq
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import List, Optional, Tuple
+
+import metrics
+
+# Seconds. Anything under ~10 ms is normal scheduling noise on a phone.
+STALL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StallDetector:
+    """
+    Measures event-loop lag with a heartbeat task and catches blocking calls.
+
+    The heartbeat sleeps for `interval` and records how late it woke up. A
+    separate watchdog thread checks that the heartbeat keeps beating; when the
+    loop has been silent for longer than `threshold` it grabs the loop thread's
+    current stack, which is the code that is blocking it. The heartbeat pairs
+    that stack with the stall's final duration once the loop recovers.
+    """
+    def __init__(self, logger: logging.Logger, threshold: float = 0.1, interval: float = 0.05,
+                 keep: int = 5, registry: Optional[metrics.Registry] = None):
+        self.logger, self.threshold, self.interval, self.keep = logger, threshold, interval, keep
+        registry = registry or metrics.registry
+        self.lag = registry.histogram("event_loop_lag_seconds", "Heartbeat wake-up delay of the asyncio loop.", STALL_BUCKETS)
+        self.stalls = registry.histogram("event_loop_stall_seconds", "Event-loop stalls longer than the threshold.", STALL_BUCKETS)
+        self.worst: List[Tuple[float, int, str]] = []  # min-heap of (seconds, seq, stack)
+        self.count, self.max_stall = 0, 0.0
+        self._lock = threading.Lock()
+        self._pending_stack: Optional[str] = None
+        self._last_beat = time.perf_counter()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            start = time.perf_counter()
+            self._last_beat = start
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.lag.observe(lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, seconds: float):
+        with self._lock:
+            stack, self._pending_stack = self._pending_stack, None
+        self.count += 1
+        self.max_stall = max(self.max_stall, seconds)
+        self.stalls.observe(seconds)
+        stack = stack or "<stack not captured: stall ended before the watchdog polled>"
+        item = (seconds, self.count, stack)
+        if len(self.worst) < self.keep:
+            heapq.heappush(self.worst, item)
+        else:
+            heapq.heappushpop(self.worst, item)
+        self.logger.warning("event_loop_stall", extra={"seconds": round(seconds, 4), "stack": stack})
+
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stopped.wait(poll):
+            if time.perf_counter() - self._last_beat <= self.threshold + self.interval:
+                continue
+            with self._lock:
+                if self._pending_stack is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._pending_stack = "".join(traceback.format_stack(frame))
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def summary(self) -> dict:
+        """Stall count, worst stall, stall histogram and the stacks of the worst stalls."""
+        histogram = self.stalls.snapshot()
+        return {
+            "threshold": self.threshold,
+            "count": self.count,
+            "max_seconds": round(self.max_stall, 4),
+            "histogram": histogram[0]["buckets"] if histogram else {},
+            "lag_p95": self.lag.quantile(0.95),
+            "worst": [{"seconds": round(s, 4), "stack": stack} for s, _, stack in sorted(self.worst, reverse=True)],
+        }
@@ -1,88 +1,519 @@
+import argparse
 import asyncio
-import aiohttp
+import contextlib
 import logging
 import configparser
 import random
 import time
+import datetime
 import collections
-from typing import List, Deque
+from typing import TYPE_CHECKING, List, Deque
 from urllib.parse import urlparse, urlunparse
 
-import io_handler, ui, processing, auth, models, config, logger_config, api_client
+# Only light, stdlib-backed modules at import time. aiohttp, pydantic and
+# SQLAlchemy come in with the scrape pipeline (auth, api_client, processing)
+# once there is something to scrape; analysis/archive and the optional
+# diagnostics only when enabled. log/tests/test_startup.py holds this line.
+import io_handler, ui, config, logger_config, metrics
 
-async def process_url(url: str, app_config: configparser.ConfigParser, logger: logging.Logger, session: aiohttp.ClientSession, request_tracker: Deque[float]):
+if TYPE_CHECKING:
+    import aiohttp
+    import credentials
+    import mirrors
+    import proxies
+
+async def process_url(url: str, app_config: configparser.ConfigParser, logger: logging.Logger, session: "aiohttp.ClientSession", request_tracker: Deque[float],
+                      mirror_map: "mirrors.MirrorMap" = None, coalescer: "mirrors.Coalescer" = None,
+                      credentials: "credentials.CredentialPool" = None, proxy_pool: "proxies.ProxyPool" = None):
     """
-    Processes a single URL and returns a tuple with all necessary results.
+    Processes a single URL and returns (bonuses, cleaned_url, success,
+    bonus_count, downlines); bonuses is None when syncData was not fetched.
+    One login serves both features: with [features] downlines on,
+    /referrer/getDownline is paged concurrently with syncData under the same
+    token. With a coalescer, login + fetches run once per merchant ID and
+    mirror domains reuse the result; the mirror map skips the landing fetch
+    for known domains. With a credential pool, the merchant's account logs in
+    (or reuses its cached token) and pays for each request from its budget.
+    With a proxy pool, the landing fetch goes out through the site's proxy and
+    login + API calls through the merchant's.
     """
+    import auth, api_client, processing, json_codec
     cleaned_url = urlunparse(urlparse(url)._replace(path="", params="", query="", fragment=""))
-    
-    auth_data = await auth.get_auth(cleaned_url, app_config, logger, session, request_tracker)
-    if not auth_data:
-        return [], cleaned_url, False, 0
+    metrics.current_site.set(cleaned_url)
+
+    route = proxy_pool.session if proxy_pool else (lambda key: contextlib.nullcontext())
+
+    known = mirror_map.get(cleaned_url) if mirror_map else None
+    if known:
+        merchant_id, merchant_name = known
+    else:
+        async with route(cleaned_url) as proxy:
+            landing = await auth.fetch_landing(cleaned_url, logger, session, request_tracker, proxy)
+        if not landing:
+            return [], cleaned_url, False, 0, []
+        merchant_id, merchant_name = landing
+        if mirror_map:
+            mirror_map.record(cleaned_url, merchant_id, merchant_name)
+
+    logged_in = True
+    api_url = f"{cleaned_url}/api/v1/index.php"
+
+    async def login(proxy):
+        """(auth_data, account, reused_token); tries the merchant's account, then one fallback on account faults."""
+        if not credentials:
+            return await auth.login(cleaned_url, merchant_id, merchant_name, app_config, logger, session, proxy=proxy), None, False
+        import credentials as credentials_mod
+        accounts = credentials.available(merchant_id)
+        if not accounts:
+            logger.warning("auth_no_account", extra={"url": cleaned_url, "reason": "all accounts cooling down"})
+        for account in accounts[:2]:
+            cached = credentials.cached_token(account, merchant_id, proxy)
+            if cached:
+                return cached.model_copy(update={"api_url": api_url}), account, True
+            await account.spend()
+            auth_data, outcome = await auth.login_with_outcome(cleaned_url, merchant_id, merchant_name, app_config, logger, session,
+                                                               credentials=account.credentials, proxy=proxy)
+            credentials.report_login(account, outcome, logger)
+            if auth_data:
+                credentials.store_token(account, merchant_id, auth_data, proxy)
+                return auth_data, account, False
+            if outcome not in credentials_mod.ACCOUNT_FAULTS:
+                break  # the site or the exit IP, not the account, failed: another account will not help
+        return None, None, False
+
+    async def fetch_features(auth_data, account, proxy):
+        max_bytes = app_config.getint('scraper', 'max_response_bytes', fallback=json_codec.DEFAULT_MAX_BYTES)
+
+        async def nothing():
+            return None
+
+        async def bonuses():
+            if account:
+                await account.spend()
+            return await api_client.get_bonuses(auth_data, session, logger, max_bytes=max_bytes,
+                                                incremental=app_config.getboolean('scraper', 'incremental_json', fallback=False), proxy=proxy)
+
+        bonuses_json, downlines_json = await asyncio.gather(
+            bonuses() if app_config.getboolean('features', 'bonuses', fallback=True) else nothing(),
+            api_client.get_downlines(auth_data, session, logger, max_bytes=max_bytes,
+                                     page_delay=app_config.getfloat('features', 'downline_page_delay', fallback=0.5),
+                                     throttle=account.spend if account else None, proxy=proxy)
+            if app_config.getboolean('features', 'downlines', fallback=False) else nothing(),
+        )
+        # Nothing fetched: not worth sharing, a mirror should try its own domain.
+        return None if bonuses_json is None and downlines_json is None else (bonuses_json, downlines_json)
 
-    min_delay = app_config.getfloat('scraper', 'min_request_delay', fallback=1.0)
-    max_delay = app_config.getfloat('scraper', 'max_request_delay', fallback=3.0)
-    await asyncio.sleep(random.uniform(min_delay, max_delay))
+    async def fetch():
+        async with route(merchant_id) as proxy:
+            return await fetch_via(proxy)
 
-    bonuses_json = await api_client.get_bonuses(auth_data, session, logger)
-    if bonuses_json is None:
-        return [], cleaned_url, True, 0
+    async def fetch_via(proxy):
+        nonlocal logged_in
+        auth_data, account, reused = await login(proxy)
+        if not auth_data:
+            logged_in = False
+            if known:
+                # Stale mapping (domain moved merchant or died); rediscover it next run.
+                mirror_map.forget(cleaned_url)
+            return None
 
-    processed_bonuses = processing.process_bonuses(bonuses_json, cleaned_url, auth_data.merchant_name, logger)
-    bonus_count = len(processed_bonuses)
-    logger.info(f"OK: {cleaned_url} - Found {bonus_count} bonuses.")
-    return processed_bonuses, cleaned_url, True, bonus_count
+        min_delay = app_config.getfloat('scraper', 'min_request_delay', fallback=1.0)
+        max_delay = app_config.getfloat('scraper', 'max_request_delay', fallback=3.0)
+        with metrics.registry.stage("sleep"):
+            await asyncio.sleep(random.uniform(min_delay, max_delay))
 
-async def main():
+        result = await fetch_features(auth_data, account, proxy)
+        if result is None and reused:
+            # The cached token may have expired server-side: log in afresh once.
+            credentials.drop_token(account, merchant_id, proxy)
+            auth_data, account, _ = await login(proxy)
+            if auth_data:
+                result = await fetch_features(auth_data, account, proxy)
+        return result
+
+    if coalescer:
+        fetched, source = await coalescer.run(merchant_id, cleaned_url, fetch)
+    else:
+        fetched, source = await fetch(), cleaned_url
+    if not logged_in:
+        return [], cleaned_url, False, 0, []
+    if fetched is None:
+        return None, cleaned_url, True, 0, []
+    if source != cleaned_url:
+        metrics.registry.counter("scraper_mirror_shared_total", "Sites served from a mirror domain's sync of the same merchant.").inc()
+    bonuses_json, downlines_json = fetched
+
+    with metrics.registry.stage("process") as stage:
+        processed_bonuses = processing.process_bonuses(bonuses_json or [], cleaned_url, merchant_name, logger)
+        downlines = processing.process_downlines(downlines_json or [], cleaned_url)
+        bonus_count = len(processed_bonuses)
+        if not bonus_count and not downlines:
+            stage.outcome = "empty"
+    note = f" (mirror of {source})" if source != cleaned_url else ""
+    found = f"{bonus_count} bonuses" + (f", {len(downlines)} downlines" if downlines_json is not None else "")
+    logger.info(f"OK: {cleaned_url} - Found {found}.{note}")
+    return processed_bonuses if bonuses_json is not None else None, cleaned_url, True, bonus_count, downlines
+
+def _timed_write(stage_name: str, write, *args):
+    """Runs an io_handler writer as a metrics stage; writers return False on failure."""
+    with metrics.registry.stage(stage_name) as stage:
+        if not write(*args):
+            stage.outcome = metrics.ERROR
+
+async def main(args: argparse.Namespace = None):
     app_config = config.get_config()
     logger = logger_config.setup_logger(app_config)
+    profile_dir = getattr(args, 'profile', None)
+    time_budget = getattr(args, 'time_budget', None)
+    daemon_mode = getattr(args, 'daemon', False)
+    sample_size = getattr(args, 'sample', None)
+    if getattr(args, 'serve', False):
+        await serve_read_api(app_config, logger)
+        return
     
     urls = io_handler.load_urls(app_config.get('scraper', 'url_list_path'), logger)
     
     ui_handler = ui.UIHandler()
-    ui_handler.set_total_urls(len(urls))
+    if not daemon_mode:
+        ui_handler.set_total_urls(len(urls))
     
-    if not urls:
+    if not urls and not daemon_mode:
         return
-        
+
+    import aiohttp, scheduler
+
+    cache_path = app_config.get('scraper', 'run_cache_path', fallback=io_handler.CACHE_FILE_PATH)
+    run_cache = io_handler.load_run_cache(logger, cache_path)
+    run_cache["total_script_runs"] = run_cache.get("total_script_runs", 0) + 1
+    urls = [url.strip() for url in urls]
+    if app_config.getboolean('scraper', 'prioritize_sites', fallback=True):
+        urls = scheduler.prioritize(urls, run_cache)
+
     request_tracker: Deque[float] = collections.deque(maxlen=200)
     total_bonuses_found = 0
     failed_url_count = 0
+    skipped_url_count = 0
     
     # Pre-get output settings
     db_enabled = app_config.getboolean('output', 'enable_db_output')
     csv_enabled = app_config.getboolean('output', 'enable_csv_output')
     db_url = app_config.get('output', 'db_connection_string')
-    csv_path = app_config.get('output', 'csv_output_path')
+    csv_sink = None
+    if csv_enabled:
+        csv_sink = io_handler.CsvSink(
+            app_config.get('output', 'csv_output_path'), logger,
+            roll_daily=app_config.getboolean('output', 'csv_roll_daily', fallback=True),
+        )
+    downline_sink = None
+    if app_config.getboolean('features', 'downlines', fallback=False):
+        downline_sink = io_handler.DownlineSink(app_config.get('output', 'downline_csv_path', fallback='data/downlines.csv'), logger)
+    parquet_sink = None
+    if app_config.getboolean('output', 'enable_parquet_output', fallback=False):
+        parquet_sink = io_handler.ParquetSink(app_config.get('output', 'parquet_output_path', fallback='data/parquet'), logger)
+    run_date = datetime.date.today()
+
+    exporter = None
+    if app_config.getboolean('metrics', 'enable_metrics_export', fallback=False):
+        exporter = metrics.Exporter(
+            metrics.registry,
+            app_config.get('metrics', 'textfile_path', fallback='data/metrics/scraper.prom'),
+            app_config.get('metrics', 'json_path', fallback='data/metrics/scraper.json'),
+            app_config.getfloat('metrics', 'export_interval', fallback=15.0),
+            logger,
+        )
+        exporter.start()
+
+    stall_detector = None
+    if app_config.getboolean('diagnostics', 'enable_stall_detector', fallback=False):
+        import loop_monitor
+        stall_detector = loop_monitor.StallDetector(
+            logger,
+            threshold=app_config.getfloat('diagnostics', 'stall_threshold_ms', fallback=100) / 1000,
+            keep=app_config.getint('diagnostics', 'stall_stacks_kept', fallback=5),
+        )
+        stall_detector.start()
+
+    profile_session = None
+    if profile_dir:
+        import profiler
+        profile_session = profiler.ProfileSession(profile_dir, logger)
+        profile_session.start()
     
-    async with aiohttp.ClientSession() as session:
-        for url in urls:
+    mirror_map = coalescer = None
+    if app_config.getboolean('scraper', 'coalesce_mirrors', fallback=True):
+        import mirrors
+        mirror_map = mirrors.MirrorMap.load(app_config.get('scraper', 'mirror_map_path', fallback='data/mirror_map.json'), logger)
+        # In daemon mode a shared sync is only reused while it is fresh.
+        coalescer = mirrors.Coalescer(app_config.getfloat('daemon', 'coalesce_ttl', fallback=300.0) if daemon_mode else None)
+
+    change_feed = None
+    if app_config.getboolean('events', 'enable_events', fallback=False):
+        import events
+        change_feed = events.ChangeFeed(
+            app_config.get('events', 'changelog_path', fallback='data/events/changes.jsonl'),
+            app_config.get('events', 'state_path', fallback='data/events/state.json'),
+            logger, queue_size=app_config.getint('events', 'subscriber_queue', fallback=1000),
+        )
+
+    api_server = None
+    if app_config.getboolean('read_api', 'enable_read_api', fallback=False) and db_enabled:
+        import read_api
+        api_server = read_api.from_config(app_config, logger)
+        await api_server.start(app_config.get('read_api', 'host', fallback='127.0.0.1'),
+                               app_config.getint('read_api', 'port', fallback=8321))
+
+    import credentials, limiter, proxies
+    credential_pool = credentials.load_pool(app_config, logger)
+    proxy_pool = proxies.load_pool(app_config, logger)
+    if proxy_pool:
+        metrics.registry.stage_listeners.append(proxy_pool)
+
+    # Waiters are admitted in arrival order, so sites start in priority order.
+    site_limiter = limiter.AIMDLimiter(
+        app_config.getint('scraper', 'max_concurrent_requests', fallback=5),
+        min_limit=app_config.getint('scraper', 'min_concurrency', fallback=1),
+        max_limit=app_config.getint('scraper', 'max_concurrency', fallback=20),
+        per_host=app_config.getint('scraper', 'per_host_concurrency', fallback=2),
+        latency_target=app_config.getfloat('scraper', 'latency_target', fallback=5.0),
+        error_target=app_config.getfloat('scraper', 'error_target', fallback=0.1),
+        adaptive=app_config.getboolean('scraper', 'autotune_concurrency', fallback=True),
+    )
+    metrics.registry.stage_listeners.append(site_limiter)
+    deadline = time.monotonic() + time_budget if time_budget else None
+    initial_interval = app_config.getfloat('daemon', 'initial_interval', fallback=3600.0)
+    min_interval = app_config.getfloat('daemon', 'min_interval', fallback=900.0)
+    max_interval = app_config.getfloat('daemon', 'max_interval', fallback=86400.0)
+
+    async def run_site(url: str, session: "aiohttp.ClientSession"):
+        nonlocal total_bonuses_found, failed_url_count, skipped_url_count
+        host = urlparse(url).netloc
+        async with site_limiter.slot(host):
+            if deadline is not None and time.monotonic() >= deadline:
+                # Past the budget nothing new starts; sites already in flight finish.
+                if not skipped_url_count:
+                    logger.warning("time_budget_reached", extra={"budget_seconds": time_budget})
+                skipped_url_count += 1
+                ui_handler.site_skipped()
+                return
+            cleaned_url = urlunparse(urlparse(url)._replace(path="", params="", query="", fragment=""))
+            ui_handler.site_started(cleaned_url)
             try:
-                bonuses_list, cleaned_url, success, bonuses_found = await process_url(url.strip(), app_config, logger, session, request_tracker)
+                with metrics.registry.stage("site") as site_stage:
+                    bonuses_list, cleaned_url, success, bonuses_found, downlines = await process_url(url, app_config, logger, session, request_tracker, mirror_map, coalescer, credential_pool, proxy_pool)
+                    if not success:
+                        site_stage.outcome = "failed"
+                    elif not bonuses_found:
+                        site_stage.outcome = "no_bonuses"
                 
                 if not success:
                     failed_url_count += 1
+                # Only a fetched bonus set can be compared; an empty one means "all gone".
+                bonuses_fetched = success and bonuses_list is not None
+                bonuses_list = bonuses_list or []
+                changed = scheduler.record_result(run_cache, url, success, bonuses_found,
+                                                  scheduler.bonus_signature(bonuses_list) if bonuses_fetched else None,
+                                                  downlines=len(downlines))
+                site_changed = changed if success else None
+                scheduler.update_interval(run_cache["sites"][url], success, changed, initial_interval, min_interval, max_interval)
+                # A daemon outlives the day it started on; rows are dated when written.
+                site_date = datetime.date.today() if daemon_mode else run_date
                 
+                if db_enabled and bonuses_fetched:
+                    # Also records the site as fetched, so an empty list reads as "all gone", not "not scraped".
+                    _timed_write("db_write", io_handler.write_bonuses_to_db, bonuses_list, db_url, logger, site_date, cleaned_url)
                 if bonuses_list:
                     total_bonuses_found += len(bonuses_list)
                     
                     # --- Real-time Output Logic ---
-                    if db_enabled:
-                        io_handler.write_bonuses_to_db(bonuses_list, db_url, logger)
                     if csv_enabled:
-                        io_handler.write_bonuses_to_csv(bonuses_list, csv_path, logger)
+                        _timed_write("csv_write", csv_sink.write, bonuses_list)
+                    if parquet_sink:
+                        _timed_write("parquet_buffer", parquet_sink.write, bonuses_list, site_date)
+                if downlines:
+                    _timed_write("downline_write", downline_sink.write, downlines)
+                if change_feed and bonuses_fetched:
+                    change_feed.publish(cleaned_url, bonuses_list, site_date)
                 
                 ui_handler.update(cleaned_url, success, bonuses_found, request_tracker)
+                return site_changed
 
             except Exception as e:
                 failed_url_count += 1
-                cleaned_url = urlunparse(urlparse(url.strip())._replace(path="", params="", query="", fragment=""))
+                scheduler.record_result(run_cache, url, False, 0, None)
+                scheduler.update_interval(run_cache["sites"][url], False, False, initial_interval, min_interval, max_interval)
                 ui_handler.update(cleaned_url, False, 0, request_tracker)
-                logger.error(f"A task failed for URL {url.strip()}: {e}", extra={"err":str(e)})
+                logger.error(f"A task failed for URL {url}: {e}", extra={"err":str(e)})
+
+    async def run_batch(batch: List[str], session: "aiohttp.ClientSession") -> list:
+        # Tasks are named after their site so profiles and stall stacks attribute time per site.
+        return await asyncio.gather(*[
+            asyncio.create_task(run_site(url, session), name=f"site:{url}") for url in batch
+        ])
+
+    async def run_sample(all_urls: List[str], run) -> List[str]:
+        """Scrapes a stratified sample; returns the sites still to run (all, the moving strata, or none)."""
+        import sampling
+        skip_below = app_config.getfloat('sampling', 'skip_below', fallback=0.05)
+        needed = sampling.skip_sample_size(skip_below)
+        size = sample_size or app_config.getint('sampling', 'sample_size', fallback=0) or needed
+        plan = sampling.plan_sample(all_urls, run_cache, size, mirror_map)
+        if len(plan.sample) < min(needed, sum(plan.family_count(s) for s in sampling.STRATA)):
+            logger.warning("sample_cannot_skip", extra={"sample_size": len(plan.sample), "needed": needed, "skip_below": skip_below})
+        results = await run(plan.sample)
+        est = sampling.estimate(plan, dict(zip(plan.sample, results)))
+        decision = sampling.decide(est, skip_below, app_config.getfloat('sampling', 'full_above', fallback=0.3))
+        sampled = set(plan.sample)
+        keep = set(sampling.targets(plan, est)) if decision == "targeted" else set(all_urls) if decision == "full" else set()
+        rest = [url for url in all_urls if url in keep and url not in sampled]
+        for _ in range(len(all_urls) - len(sampled) - len(rest)):
+            ui_handler.site_skipped()
+        logger.info("sample_estimate", extra={
+            "decision": decision, "changed_share": est.changed, "ci95": [est.low, est.high],
+            "observed": est.observed, "sampled": len(plan.sample), "by_stratum": est.by_stratum, "remaining": len(rest),
+        })
+        return rest
+
+    def checkpoint():
+        io_handler.save_run_cache(run_cache, logger, cache_path)
+        if mirror_map:
+            mirror_map.save(logger)
+        if change_feed:
+            change_feed.save()
+
+    async def day_end(day: datetime.date):
+        checkpoint()
+        if parquet_sink:
+            # One file per partition per day, written before the day's post-run stages.
+            await asyncio.to_thread(_timed_write, "parquet_write", parquet_sink.detach().close)
+        await asyncio.to_thread(run_post_stages, app_config, logger, day)
+
+    connector = aiohttp.TCPConnector(limit=site_limiter.max_limit * 2)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        if proxy_pool:
+            # Dead proxies are out of rotation before the first site is assigned.
+            await proxy_pool.probe(session)
+            proxy_pool.start(session)
+        if change_feed and app_config.get('events', 'socket_path', fallback='').strip():
+            await change_feed.serve(app_config.get('events', 'socket_path').strip())
+        if daemon_mode:
+            import daemon
+            stop = asyncio.Event()
+            daemon.install_signal_handlers(stop, logger)
+            site_daemon = daemon.SiteDaemon(
+                app_config.get('scraper', 'url_list_path'), lambda url: run_site(url, session), run_cache, logger,
+                order=(lambda u: scheduler.prioritize(u, run_cache)) if app_config.getboolean('scraper', 'prioritize_sites', fallback=True) else list,
+                initial_interval=initial_interval,
+                reload_interval=app_config.getfloat('daemon', 'reload_interval', fallback=30.0),
+                checkpoint_interval=app_config.getfloat('daemon', 'checkpoint_interval', fallback=300.0),
+                grace=app_config.getfloat('daemon', 'shutdown_grace', fallback=30.0),
+                on_checkpoint=checkpoint, on_day_end=day_end,
+            )
+            await site_daemon.run(stop, deadline)
+            run_date = datetime.date.today()
+        else:
+            ui_handler.start(request_tracker)
+            if sample_size is not None:
+                urls = await run_sample(urls, lambda batch: run_batch(batch, session))
+            await run_batch(urls, session)
+        if proxy_pool:
+            await proxy_pool.stop()
+        if change_feed:
+            await change_feed.close()
+        if api_server:
+            await api_server.stop()
+    await ui_handler.stop()
+    metrics.registry.stage_listeners.remove(site_limiter)
+    if proxy_pool:
+        metrics.registry.stage_listeners.remove(proxy_pool)
+    checkpoint()
+    if csv_sink:
+        with metrics.registry.stage("csv_close") as stage:
+            try:
+                csv_sink.close()
+            except OSError as e:
+                stage.outcome = metrics.ERROR
+                logger.error(f"CSV close failed: {e}")
+    if parquet_sink:
+        _timed_write("parquet_write", parquet_sink.close)
+    if downline_sink:
+        try:
+            downline_sink.close()
+        except OSError as e:
+            logger.error(f"Downline CSV close failed: {e}")
+
+    run_summary = {"total_bonuses_found": total_bonuses_found, "failed_urls": failed_url_count, "skipped_urls": skipped_url_count,
+                   "stages": metrics.registry.stage_summary(), "concurrency": site_limiter.summary()}
+    if proxy_pool:
+        run_summary["proxies"] = proxy_pool.summary()
+    if profile_session:
+        profile_session.stop()
+    if stall_detector:
+        await stall_detector.stop()
+        run_summary["event_loop_stalls"] = stall_detector.summary()
+    if exporter:
+        await exporter.stop()
 
     # Final summary printout
     ui_handler.final(total_bonuses_found, failed_url_count)
-    logger.info(f"Scraping complete.", extra={"total_bonuses_found": total_bonuses_found, "failed_urls": failed_url_count})
+    logger.info(f"Scraping complete.", extra=run_summary)
+
+    run_post_stages(app_config, logger, run_date)
+
+async def serve_read_api(app_config: configparser.ConfigParser, logger: logging.Logger):
+    """main.py --serve: only the read API, until SIGINT/SIGTERM."""
+    import daemon, read_api
+    api = read_api.from_config(app_config, logger)
+    await api.start(app_config.get('read_api', 'host', fallback='127.0.0.1'), app_config.getint('read_api', 'port', fallback=8321))
+    stop = asyncio.Event()
+    daemon.install_signal_handlers(stop, logger)
+    try:
+        await stop.wait()
+    finally:
+        await api.stop()
+
+def run_post_stages(app_config: configparser.ConfigParser, logger: logging.Logger, run_date: datetime.date):
+    """Analysis stages that run once the scrape has finished writing."""
+    db_enabled = app_config.getboolean('output', 'enable_db_output')
+    if app_config.getboolean('analysis', 'enable_comparison_report', fallback=False):
+        if not db_enabled:
+            logger.warning("comparison_report_skip", extra={"reason": "enable_db_output is false"})
+        else:
+            import analysis
+            analysis.generate_comparison_report(
+                app_config.get('output', 'db_connection_string'),
+                app_config.get('analysis', 'report_dir', fallback='data/reports'),
+                logger, run_date,
+                include_unchanged=app_config.getboolean('analysis', 'include_unchanged', fallback=False),
+            )
+    if app_config.getboolean('archive', 'enable_archive', fallback=False):
+        if not db_enabled:
+            logger.warning("archive_run_skip", extra={"reason": "enable_db_output is false"})
+        else:
+            import archive
+            archive.archive_run(
+                app_config.get('output', 'db_connection_string'),
+                app_config.get('archive', 'archive_connection_string', fallback='sqlite:///data/historical_bonuses.db'),
+                logger, run_date,
+            )
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Slap Red bonus scraper")
+    parser.add_argument('--profile', nargs='?', metavar='DIR',
+                        const=f"data/profile/{datetime.datetime.now():%Y%m%d-%H%M%S}",
+                        help="Write per-site span traces (spans.jsonl, trace.json) and sampled stacks (stacks.folded) to DIR.")
+    parser.add_argument('--time-budget', type=float, metavar='SECONDS',
+                        help="Start no new sites after SECONDS; with site prioritization the skipped ones are the least valuable.")
+    parser.add_argument('--sample', nargs='?', type=int, const=0, metavar='N',
+                        help="Scrape a stratified sample of N merchants first ([sampling] sample_size if N is omitted) and "
+                             "run the rest in full, only the strata that changed, or not at all, depending on the estimate.")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Run continuously, re-scraping each site on an interval adapted to how often it changes ([daemon] in config.ini).")
+    parser.add_argument('--serve', action='store_true',
+                        help="Only serve the read API over the bonuses store ([read_api] in config.ini), without scraping.")
+    args = parser.parse_args(argv)
+    if args.daemon and args.sample is not None:
+        parser.error("--sample applies to single runs, not --daemon")
+    return args
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,250 @@
+# metrics.py
+import asyncio
+import bisect
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds. Spans a fast local write up to a slow login behind a captcha wall.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+OK = "ok"
+ERROR = "error"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Site being processed by the current task; set by main.process_url so stages
+# deep in auth/api_client can be attributed without threading the URL through.
+current_site: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_site", default=None)
+
+def _labels(**labels: str) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = _labels(**labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_fmt_labels(k)} {v}" for k, v in sorted(self.values.items())]
+        return lines
+
+    def snapshot(self) -> List[dict]:
+        return [{"labels": dict(k), "value": v} for k, v in sorted(self.values.items())]
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: str):
+        self.values[_labels(**labels)] = float(value)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(**labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """Upper bucket bound containing the q-th observation (Prometheus-style estimate)."""
+        entry = self.values.get(_labels(**labels))
+        if not entry or not entry[2]:
+            return None
+        target, seen = q * entry[2], 0
+        for bound, n in zip(self.buckets + (float("inf"),), entry[0]):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {count}")
+        return lines
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {"labels": dict(k), "count": count, "sum": round(total, 6),
+             "buckets": dict(zip([repr(b) for b in self.buckets] + ["+Inf"], counts))}
+            for k, (counts, total, count) in sorted(self.values.items())
+        ]
+
+class Registry:
+    """Holds the run's metrics. Everything runs on the event loop, so no locking is needed."""
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        # Optional callable(StageResult, start_ts, end_ts) receiving every finished stage, e.g. a span tracer.
+        self.span_sink: Optional[Callable] = None
+        # Further callables with the same signature, e.g. the concurrency autotuner.
+        self.stage_listeners: List[Callable] = []
+        self.stage_seconds = self.histogram("scraper_stage_seconds", "Time spent per pipeline stage.")
+        self.stage_total = self.counter("scraper_stage_total", "Pipeline stage executions by outcome.")
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.metrics.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def observe_stage(self, stage: str, outcome: str, seconds: float):
+        self.stage_seconds.observe(seconds, stage=stage, outcome=outcome)
+        self.stage_total.inc(stage=stage, outcome=outcome)
+
+    @contextmanager
+    def stage(self, stage: str, **attrs) -> Iterator["StageResult"]:
+        """
+        Times a pipeline stage. The outcome defaults to ok, or error if the
+        block raises; set result.outcome inside the block for anything finer
+        (e.g. "captcha", "empty").
+        """
+        result = StageResult(stage, attrs)
+        wall_start, start = time.time(), time.perf_counter()
+        try:
+            yield result
+        except BaseException:
+            if result.outcome == OK:
+                result.outcome = ERROR
+            raise
+        finally:
+            result.seconds = time.perf_counter() - start
+            self.observe_stage(stage, result.outcome, result.seconds)
+            if self.span_sink is not None:
+                self.span_sink(result, wall_start, wall_start + result.seconds)
+            for listener in self.stage_listeners:
+                listener(result, wall_start, wall_start + result.seconds)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {"ts": time.time(), "metrics": {name: m.snapshot() for name, m in self.metrics.items()}}
+
+    def stage_summary(self) -> Dict[str, dict]:
+        """Per-stage count, mean seconds, p95 estimate and outcome counts."""
+        merged: Dict[str, list] = {}
+        outcomes: Dict[str, Dict[str, int]] = {}
+        for key, (counts, total, count) in self.stage_seconds.values.items():
+            labels = dict(key)
+            entry = merged.setdefault(labels["stage"], [[0] * len(counts), 0.0, 0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+            outcomes.setdefault(labels["stage"], {})[labels["outcome"]] = count
+        scratch = Histogram("scratch", "", self.stage_seconds.buckets)
+        summary = {}
+        for stage, entry in merged.items():
+            scratch.values = {(): entry}
+            summary[stage] = {"count": entry[2], "mean": entry[1] / entry[2], "p95": scratch.quantile(0.95), "outcomes": outcomes[stage]}
+        return summary
+
+def exception_outcome(e: BaseException) -> str:
+    """Short outcome label for a failed request: timeout, json_decode, http_<status> or error."""
+    if getattr(e, "outcome", None):
+        return e.outcome
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(e, ValueError) or type(e).__name__ == "ContentTypeError":
+        return "json_decode"
+    status = getattr(e, "status", None)
+    return f"http_{status}" if isinstance(status, int) else ERROR
+
+def status_outcome(res_json: Dict[str, Any]) -> str:
+    """Maps a non-SUCCESS API response to an outcome label: captcha, invalid_login, invalid_merchant or status_fail."""
+    data = res_json.get("data")
+    message = (data.get("message") if isinstance(data, dict) else None) or res_json.get("message") or ""
+    message = str(message).lower()
+    for needle, outcome in (("captcha", "captcha"), ("invalid login", "invalid_login"), ("invalid merchant", "invalid_merchant")):
+        if needle in message:
+            return outcome
+    return "status_fail"
+
+class StageResult:
+    __slots__ = ("stage", "attrs", "outcome", "seconds")
+
+    def __init__(self, stage: str, attrs: dict):
+        self.stage, self.attrs, self.outcome, self.seconds = stage, attrs, OK, 0.0
+
+def _atomic_write(path: str, data: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class Exporter:
+    """
+    Periodically writes the registry as a Prometheus textfile (for node_exporter's
+    textfile collector) and as JSON. Files are replaced atomically.
+    """
+    def __init__(self, registry: Registry, textfile_path: Optional[str], json_path: Optional[str], interval: float, logger: logging.Logger):
+        self.registry, self.textfile_path, self.json_path = registry, textfile_path, json_path
+        self.interval, self.logger = interval, logger
+        self._task: Optional[asyncio.Task] = None
+
+    def write(self):
+        try:
+            if self.textfile_path:
+                _atomic_write(self.textfile_path, self.registry.render_prometheus())
+            if self.json_path:
+                _atomic_write(self.json_path, json.dumps(self.registry.snapshot()))
+        except OSError as e:
+            self.logger.error("metrics_export_fail", extra={"err": str(e)})
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.write()
+
+registry = Registry()
@@ -0,0 +1,105 @@
+# mirrors.py
+"""
+Mirror-domain coalescing. Many merchants are served from several domains; every
+one of them answers the same login and /users/syncData for the same merchant
+ID. Domains are grouped by the MERCHANTID found on their landing page, and only
+one login + sync runs per merchant, its result fanned out to the other domains.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+MAP_VERSION = 1
+
+class MirrorMap:
+    """
+    Persisted domain -> merchant mapping:
+      {"version": 1, "domains": {url: {"merchant_id", "merchant_name", "seen"}}}
+    With an entry, a domain's landing page need not be fetched to know which
+    merchant (and so which coalescing group) it belongs to.
+    """
+    def __init__(self, path: str, domains: Optional[Dict[str, dict]] = None):
+        self.path = path
+        self.domains: Dict[str, dict] = domains or {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str, logger: logging.Logger) -> "MirrorMap":
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MAP_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            return cls(path, data["domains"])
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("mirror_map_load_fail", extra={"path": path, "err": str(e)})
+            return cls(path)
+
+    def get(self, url: str) -> Optional[Tuple[str, str]]:
+        entry = self.domains.get(url)
+        return (entry["merchant_id"], entry.get("merchant_name", "")) if entry else None
+
+    def record(self, url: str, merchant_id: str, merchant_name: str):
+        entry = self.domains.get(url)
+        if entry and entry["merchant_id"] == merchant_id and entry.get("merchant_name") == merchant_name:
+            return
+        self.domains[url] = {"merchant_id": merchant_id, "merchant_name": merchant_name,
+                             "seen": datetime.date.today().isoformat()}
+        self.dirty = True
+
+    def forget(self, url: str):
+        if self.domains.pop(url, None) is not None:
+            self.dirty = True
+
+    def groups(self) -> Dict[str, List[str]]:
+        """merchant_id -> its known domains."""
+        out: Dict[str, List[str]] = {}
+        for url, entry in sorted(self.domains.items()):
+            out.setdefault(entry["merchant_id"], []).append(url)
+        return out
+
+    def save(self, logger: logging.Logger):
+        if not self.dirty:
+            return
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": MAP_VERSION, "domains": dict(sorted(self.domains.items()))}, f, indent=1)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.error("mirror_map_save_fail", extra={"path": self.path, "err": str(e)})
+
+class Coalescer:
+    """
+    Runs at most one fetch per key at a time and shares its successful result
+    with every later caller for the same key, for ttl seconds (None: for the
+    whole run). A failed fetch (None) is not cached, so the next mirror of
+    that merchant tries with its own domain.
+    """
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._results: Dict[str, Tuple[Any, str, float]] = {}
+
+    async def run(self, key: str, source: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Returns (result, source that fetched it); source differs from the caller's when shared."""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._results.get(key)
+            # A site's own earlier result is never reused: a re-scrape wants fresh data.
+            if cached and cached[1] != source and (self.ttl is None or time.monotonic() - cached[2] < self.ttl):
+                return cached[0], cached[1]
+            result = await fetch()
+            if result is not None:
+                self._results[key] = (result, source, time.monotonic())
+            else:
+                self._results.pop(key, None)
+            return result, source
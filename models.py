@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Index
 from sqlalchemy.orm import declarative_base
 from pydantic import BaseModel
 
@@ -12,8 +12,31 @@ class AuthData(BaseModel):
 
 Base = declarative_base()
 
+# Free-text columns whose values repeat verbatim across sites on the same
+# platform. Interned in memory by processing; dictionary-encoded in the
+# archive (archive_strings lookup table) and in Parquet output.
+REPEATED_STRING_FIELDS = (
+    "name", "transaction_type", "balance", "bonus", "bonus_random", "reset", "refer_link",
+    "claim_type", "raw_claim_config", "raw_claim_condition",
+)
+
 class Bonus(Base):
     __tablename__ = 'bonuses'
+    __table_args__ = (
+        # One row per bonus per run day; run_date leads so a day's rows are a range scan.
+        Index('uq_bonuses_run_date_url_id', 'run_date', 'url', 'id', unique=True),
+        # store.query_bonuses orders by (run_date, created_at, db_id) descending; each
+        # filter's index continues with that key, so a page is read in order, never
+        # sorted. amount trails the claim_type one so the range is checked in the index.
+        Index('ix_bonuses_run_date_created_at', 'run_date', 'created_at', 'db_id'),
+        Index('ix_bonuses_url_run_date', 'url', 'run_date', 'created_at', 'db_id'),
+        Index('ix_bonuses_merchant_run_date', 'merchant_name', 'run_date', 'created_at', 'db_id'),
+        Index('ix_bonuses_claim_type_run_date', 'claim_type', 'run_date', 'created_at', 'db_id', 'amount'),
+        Index('ix_bonuses_updated_at', 'updated_at'),
+        Index('ix_bonuses_run_date_value_score', 'run_date', 'value_score'),
+        # The comparison report reads a day's changed (or new) rows straight off this.
+        Index('ix_bonuses_run_date_changed', 'run_date', 'changed', 'url'),
+    )
     db_id = Column(Integer, primary_key=True, autoincrement=True)
     url = Column(String)
     merchant_name = Column(String)
@@ -43,4 +66,31 @@ class Bonus(Base):
     claim_type = Column(String, nullable=True)
     raw_claim_config = Column(String)
     raw_claim_condition = Column(String)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    run_date = Column(String(10))  # YYYY-MM-DD of the scrape run that produced the row.
+    content_hash = Column(String(40))  # SHA-1 over the bonus content fields, see processing.content_hash.
+    value_score = Column(Float, nullable=True)  # Expected value, see scoring.score_columns.
+    changed = Column(Boolean, nullable=True)  # Content differs from the site's previous run; None: not in it. See store.upsert_bonuses.
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)  # Insert, or the last same-day upsert that changed the content.
+
+class SiteRun(Base):
+    """A site whose bonus list was fetched on run_date, even an empty one; sites missing here failed or were skipped."""
+    __tablename__ = 'site_runs'
+    __table_args__ = (
+        Index('ix_site_runs_url_run_date', 'url', 'run_date'),
+    )
+    run_date = Column(String(10), primary_key=True)
+    url = Column(String, primary_key=True)
+    bonus_count = Column(Integer)
+    fetched_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class BonusPartition(Base):
+    """Change version of each (merchant_name, run_date) slice of bonuses, bumped by every write; see store.mark_changed."""
+    __tablename__ = 'bonus_partitions'
+    __table_args__ = (
+        Index('uq_bonus_partitions_merchant_run_date', 'merchant_name', 'run_date', unique=True),
+        {'sqlite_autoincrement': True},  # versions never reused, even after the newest row is replaced
+    )
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    merchant_name = Column(String, nullable=False)  # "" for bonuses without one; "*" for all merchants.
+    run_date = Column(String(10), nullable=False)  # "*" for all days.
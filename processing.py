@@ -1,8 +1,33 @@
 import json
+import sys
+import hashlib
 import logging
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Mapping
 
-from models import Bonus
+from sqlalchemy import Boolean
+
+import scoring
+from models import Bonus, REPEATED_STRING_FIELDS
+
+# Columns that identify or annotate a row rather than describe the bonus itself.
+_HASH_EXCLUDED = {"db_id", "url", "merchant_name", "created_at", "updated_at", "run_date", "content_hash", "value_score", "changed"}
+CONTENT_FIELDS = [c.name for c in Bonus.__table__.columns if c.name not in _HASH_EXCLUDED]
+_BOOL_FIELDS = {c.name for c in Bonus.__table__.columns if isinstance(c.type, Boolean)}
+
+def content_hash(values: Mapping[str, Any]) -> str:
+    """
+    Stable SHA-1 over the content fields of a bonus, given as a column->value
+    mapping (e.g. vars(bonus) or a DB row mapping). Unset booleans hash as False
+    so in-memory objects match their stored rows.
+    """
+    h = hashlib.sha1()
+    for name in CONTENT_FIELDS:
+        value = values.get(name)
+        if name in _BOOL_FIELDS:
+            value = bool(value)
+        h.update(repr(value).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
 
 def _parse_float(value: Any) -> float:
     if value is None: return 0.0
@@ -33,6 +58,12 @@ def _create_and_map_bonus(data: Dict[str, Any], url: str, merchant_name: str) ->
     b.refer_link = str(data.get("referLink", ""))
     b.raw_claim_config = data.get("claimConfig", "")
     b.raw_claim_condition = data.get("claimCondition", "")
+    # Every bonus would otherwise hold its own copy of strings decoded from the
+    # payload; keep one shared object per distinct value.
+    for name in REPEATED_STRING_FIELDS:
+        value = getattr(b, name)
+        if type(value) is str:
+            setattr(b, name, sys.intern(value))
     return b
 
 def _parse_claim_config(b: Bonus, logger: logging.Logger) -> Bonus:
@@ -60,7 +91,7 @@ def _parse_claim_config(b: Bonus, logger: logging.Logger) -> Bonus:
             if "TOPUP" in iu:
                 b.has_topup_requirement = True
                 parts = item.split('_')
-                if len(parts) > 1: b.topup_req_amount = _parse_float(p[-1])
+                if len(parts) > 1: b.topup_req_amount = _parse_float(parts[-1])
     except Exception as e:
         logger.debug("claim_config_parse_fail", extra={"id": b.id, "err": str(e)})
     return b
@@ -76,5 +107,14 @@ def process_bonuses(bonuses_json: List[Dict[str, Any]], url: str, merchant_name:
             continue
         bonus_obj = _create_and_map_bonus(bonus_data, url, merchant_name)
         fully_processed_bonus = _parse_claim_config(bonus_obj, logger)
+        fully_processed_bonus.content_hash = content_hash(vars(fully_processed_bonus))
         processed_list.append(fully_processed_bonus)
-    return processed_list
\ No newline at end of file
+    return scoring.score_bonuses(processed_list)
+
+def process_downlines(downlines_json: List[Dict[str, Any]], url: str) -> List[Dict[str, Any]]:
+    """Maps raw /referrer/getDownline rows to the legacy downline CSV layout (downline.Downline fields)."""
+    return [{
+        "url": url, "id": str(d.get("id", "")), "name": str(d.get("name", "")),
+        "count": int(_parse_float(d.get("count"))), "amount": _parse_float(d.get("amount")),
+        "register_date_time": str(d.get("registerDateTime", "")),
+    } for d in downlines_json if isinstance(d, dict)]
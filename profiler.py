@@ -0,0 +1,146 @@
+# profiler.py
+import asyncio
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, TextIO
+
+import metrics
+
+class SpanTracer:
+    """
+    Writes one JSON line per finished pipeline stage:
+      {"site", "span", "outcome", "start", "end", "duration", "task"}
+    Timestamps are epoch seconds, so spans from concurrent sites line up on one
+    timeline. Installed as metrics.registry.span_sink.
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file: TextIO = open(path, "w", encoding="utf-8", buffering=1 << 16)
+
+    def __call__(self, result: metrics.StageResult, start: float, end: float):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        record = {
+            "site": metrics.current_site.get(), "span": result.stage, "outcome": result.outcome,
+            "start": round(start, 6), "end": round(end, 6), "duration": round(end - start, 6),
+            "task": task.get_name() if task else None,
+        }
+        self._file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self._file.close()
+
+def spans_to_chrome_trace(spans_path: str, out_path: str):
+    """
+    Converts a spans JSONL file to Chrome trace-event JSON (chrome://tracing,
+    ui.perfetto.dev), one row per site, which renders as a waterfall.
+    """
+    events, rows = [], {}
+    with open(spans_path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            site = span["site"] or "(run)"
+            tid = rows.setdefault(site, len(rows) + 1)
+            events.append({
+                "name": span["span"], "cat": span["outcome"], "ph": "X", "pid": 1, "tid": tid,
+                "ts": int(span["start"] * 1e6), "dur": int(span["duration"] * 1e6),
+                "args": {"outcome": span["outcome"], "site": site},
+            })
+    events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": site}} for site, tid in rows.items()]
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+class SamplingProfiler:
+    """
+    Samples the event-loop thread's Python stack from a background thread and
+    aggregates it in Brendan Gregg's collapsed format ("a;b;c count"), which
+    flamegraph.pl and speedscope read directly. Each stack is rooted at the
+    asyncio task that was running, so time splits per site task, and idle time
+    spent waiting in the selector shows up under "(idle)". The running task is
+    read from asyncio's private per-loop map; on Pythons without it, stacks are
+    rooted at "(loop)" instead.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Dict[str, int] = collections.Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})"
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        names = []
+        while frame is not None:
+            names.append(self._frame_name(frame))
+            frame = frame.f_back
+        names.reverse()
+        current = getattr(asyncio.tasks, "_current_tasks", None)
+        if current is None:
+            root = "(loop)"
+        else:
+            task = current.get(self._loop)
+            root = f"task:{task.get_name()}" if task is not None else "(idle)"
+        self.samples[";".join([root] + names)] += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def write_folded(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+class ProfileSession:
+    """Bundles the span tracer and sampler for `main.py --profile DIR`."""
+    def __init__(self, out_dir: str, logger: logging.Logger, interval: float = 0.005):
+        self.out_dir, self.logger = out_dir, logger
+        os.makedirs(out_dir, exist_ok=True)
+        self.tracer = SpanTracer(os.path.join(out_dir, "spans.jsonl"))
+        self.sampler = SamplingProfiler(interval)
+        self._started = 0.0
+
+    def start(self):
+        self._started = time.time()
+        metrics.registry.span_sink = self.tracer
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+        metrics.registry.span_sink = None
+        self.tracer.close()
+        folded = os.path.join(self.out_dir, "stacks.folded")
+        trace = os.path.join(self.out_dir, "trace.json")
+        self.sampler.write_folded(folded)
+        spans_to_chrome_trace(self.tracer.path, trace)
+        self.logger.info("profile_written", extra={
+            "dir": self.out_dir, "files": ["spans.jsonl", "trace.json", "stacks.folded"], "samples": sum(self.sampler.samples.values()),
+            "seconds": round(time.time() - self._started, 2),
+        })
@@ -0,0 +1,292 @@
+# read_api.py
+"""
+Read-only HTTP/JSON API over the bonuses store, so dashboards and scripts stop
+opening data/bonuses.db themselves while the scraper writes to it.
+
+  GET /bonuses                   filters: merchant, url, claim_type, min_amount,
+                                 max_amount, since (ISO timestamp), run_date;
+                                 paging: limit (<= 500), offset
+  GET /merchants/{name}/bonuses  the same, for one merchant
+  GET /events                    the change feed (events.py) as Server-Sent
+                                 Events; Last-Event-ID or ?since= resumes
+  GET /health                    write generation and cache counters
+
+Responses are cached in an LRU keyed by the normalized query. The first
+request after a write (SQLite's PRAGMA data_version changes on any commit
+from any process) reads which (merchant, run_date) partitions moved since the
+last one (store.changed_partitions) and drops only the entries whose query
+covers one of them. A scrape writing one merchant at a time leaves other
+merchants' and other days' responses cached. Listings without a run_date
+filter are newest run first, so a full page is also kept when the write went
+to a day older than the one its next row comes from; listings the write can
+reach are recomputed. Every response carries a strong ETag over its body,
+and a matching If-None-Match gets 304. Queries run in worker threads, and
+the store is in WAL mode, so reads block neither the event loop nor the
+writer.
+"""
+import asyncio
+import collections
+import datetime
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+
+import events
+import json_codec
+import store
+
+MAX_LIMIT = 500
+DEFAULT_LIMIT = 100
+FILTERS = {
+    "merchant": str, "url": str, "claim_type": str,
+    "min_amount": float, "max_amount": float,
+    "since": datetime.datetime.fromisoformat, "run_date": datetime.date.fromisoformat,
+}
+
+class WriteGeneration:
+    """Changes whenever the bonuses store may have changed."""
+    def __init__(self, db_url: str):
+        engine = store.get_engine(db_url)
+        self._conn = None
+        if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+            # A connection of our own: data_version moves on commits by every other connection.
+            self._conn = sqlite3.connect(engine.url.database, check_same_thread=False)
+
+    def current(self) -> int:
+        if self._conn is not None:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return store.write_generation
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+# What a cached page can see: (merchant, run_date) filters (None: any) and,
+# without a run_date filter, the run_date of the row after a full page (None:
+# the page reaches the end, so rows of any day may join it).
+Scope = Tuple[Optional[str], Optional[str], Optional[str]]
+
+def _covers(scope: Scope, partition: Tuple[str, str]) -> bool:
+    merchant, day = partition
+    scope_merchant, scope_day, oldest = scope
+    if day != store.ALL and (day != scope_day if scope_day is not None else oldest is not None and day < oldest):
+        return False
+    return scope_merchant is None or merchant in (store.ALL, scope_merchant)
+
+class ResultCache:
+    """
+    LRU of encoded responses, each with the partition scope of its query, valid
+    as of one write generation. advance() moves to a newer generation and drops
+    the entries over the partitions written since.
+    """
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.generation: Optional[int] = None
+        self._entries: "collections.OrderedDict[tuple, Tuple[Scope, Tuple[str, bytes]]]" = collections.OrderedDict()
+        self.hits = self.misses = self.invalidations = 0
+
+    def advance(self, generation: int, changed):
+        stale = [key for key, (scope, _) in self._entries.items() if any(_covers(scope, p) for p in changed)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        self.generation = generation
+
+    def get(self, key: tuple) -> Optional[Tuple[str, bytes]]:
+        cached = self._entries.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return cached[1]
+
+    def put(self, generation: int, key: tuple, scope: Scope, entry: Tuple[str, bytes]):
+        if generation != self.generation or self.size <= 0:
+            return
+        self._entries[key] = (scope, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+def _json_error(status: int, message: str) -> web.Response:
+    return web.Response(status=status, body=json_codec.dumps({"error": message}), content_type="application/json")
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+class ReadApi:
+    def __init__(self, db_url: str, logger: logging.Logger, cache_size: int = 1024,
+                 changelog_path: Optional[str] = None, event_poll: float = 1.0):
+        self.db_url, self.logger = db_url, logger
+        self.changelog_path, self.event_poll = changelog_path, event_poll
+        self.generation = WriteGeneration(db_url)
+        self.cache = ResultCache(cache_size)
+        self._partition_version: Optional[int] = None
+        self._sync_lock = asyncio.Lock()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._streams = set()
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/bonuses", self._bonuses)
+        app.router.add_get("/merchants/{merchant}/bonuses", self._bonuses)
+        app.router.add_get("/events", self._events)
+        app.router.add_get("/health", self._health)
+        return app
+
+    def _params(self, request: web.Request) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        for name, parse in FILTERS.items():
+            if name in request.query:
+                try:
+                    params[name] = parse(request.query[name])
+                except ValueError:
+                    raise ValueError(f"bad {name}: {request.query[name]!r}")
+        if "merchant" in request.match_info:
+            params["merchant"] = request.match_info["merchant"]
+        try:
+            params["limit"] = min(max(int(request.query.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+            params["offset"] = max(int(request.query.get("offset", 0)), 0)
+        except ValueError:
+            raise ValueError("limit and offset must be integers")
+        return params
+
+    async def _sync(self) -> int:
+        """Returns the current write generation, first bringing the cache up to it if it moved."""
+        generation = self.generation.current()
+        if generation == self.cache.generation:
+            return generation
+        async with self._sync_lock:
+            generation = self.generation.current()
+            if generation != self.cache.generation:
+                changed, self._partition_version = await asyncio.to_thread(
+                    store.changed_partitions, self.db_url, self._partition_version)
+                self.cache.advance(generation, changed)
+            return generation
+
+    async def _query(self, generation: int, key: tuple, params: Dict[str, Any]) -> Tuple[str, bytes]:
+        """Runs a query once for all concurrent requests with the same key; caches it if no write landed meanwhile."""
+        flight = (generation, key)
+        pending = self._inflight.get(flight)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight] = future
+        try:
+            limit, offset = params["limit"], params["offset"]
+            query = dict(params, limit=limit + 1)  # one extra row says whether there is a next page
+            rows = await asyncio.to_thread(store.query_bonuses, self.db_url, **query)
+            body = json_codec.dumps({"items": rows[:limit], "limit": limit, "offset": offset,
+                                     "next_offset": offset + limit if len(rows) > limit else None})
+            entry = (f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body)
+            if self.generation.current() == generation:
+                run_date = params.get("run_date")
+                oldest = rows[limit]["run_date"] if run_date is None and len(rows) > limit else None
+                scope = (params.get("merchant"), run_date and run_date.isoformat(), oldest)
+                self.cache.put(generation, key, scope, entry)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: the waiters (if any) re-raise it themselves
+            raise
+        finally:
+            del self._inflight[flight]
+
+    async def _bonuses(self, request: web.Request) -> web.Response:
+        try:
+            params = self._params(request)
+        except ValueError as e:
+            return _json_error(400, str(e))
+        key = tuple(sorted((k, str(v)) for k, v in params.items()))
+        try:
+            generation = await self._sync()
+            entry = self.cache.get(key)
+            if entry is None:
+                entry = await self._query(generation, key, params)
+        except Exception as e:
+            self.logger.error("read_api_query_fail", extra={"query": dict(key), "err": str(e)})
+            return _json_error(503, "store unavailable")
+        etag, body = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("If-None-Match", ""), etag):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def _health(self, request: web.Request) -> web.Response:
+        return web.Response(body=json_codec.dumps({"generation": self.generation.current(), "cache": self.cache.stats()}),
+                            content_type="application/json")
+
+    async def _events(self, request: web.Request) -> web.StreamResponse:
+        if not self.changelog_path:
+            return _json_error(404, "change events are not enabled")
+        cursor = request.headers.get("Last-Event-ID", request.query.get("since"))
+        try:
+            if cursor is not None:
+                position = await asyncio.to_thread(events.resume_position, self.changelog_path, int(cursor))
+            else:
+                # No cursor: follow from now on.
+                position = os.path.getsize(self.changelog_path) if os.path.exists(self.changelog_path) else 0
+        except (ValueError, OSError) as e:
+            return _json_error(400, str(e))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        task = asyncio.current_task()
+        self._streams.add(task)
+        idle = 0.0
+        try:
+            while True:
+                batch = []
+                if os.path.exists(self.changelog_path):
+                    batch = await asyncio.to_thread(lambda: list(events.tail(self.changelog_path, position)))
+                for offset, line in batch:
+                    await response.write(b"id: %d\nevent: bonus\ndata: %s\n\n" % (offset, line.rstrip(b"\n")))
+                    position = offset + len(line)
+                idle = 0.0 if batch else idle + self.event_poll
+                if idle >= 15:
+                    await response.write(b": keep-alive\n\n")  # also notices clients that went away
+                    idle = 0.0
+                await asyncio.sleep(self.event_poll)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._streams.discard(task)
+        return response
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8321):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.logger.info("read_api_started", extra={"host": host, "port": self.port})
+
+    async def stop(self):
+        for task in list(self._streams):
+            task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        self.generation.close()
+
+def from_config(app_config, logger: logging.Logger) -> ReadApi:
+    changelog = None
+    if app_config.getboolean('events', 'enable_events', fallback=False):
+        changelog = app_config.get('events', 'changelog_path', fallback='data/events/changes.jsonl')
+    return ReadApi(
+        app_config.get('output', 'db_connection_string'), logger,
+        cache_size=app_config.getint('read_api', 'cache_size', fallback=1024),
+        changelog_path=changelog,
+        event_poll=app_config.getfloat('read_api', 'event_poll', fallback=1.0),
+    )
@@ -0,0 +1,144 @@
+# sampling.py
+"""
+Pre-run sampling (`main.py --sample [N]`): scrape a stratified random subset
+first, estimate the share of sites whose bonus set changed since their last
+run, and use its confidence interval to decide between a full run, a run of
+only the strata that moved, or no run at all.
+
+Units are merchant families rather than domains: mirror domains of one
+merchant (grouped by the mirror map, else by host) always change together, so
+each family is sampled at most once and counted once. Families are
+stratified by historical volatility (the run cache's changes/runs); "new"
+families have no previous bonus set to compare with and are never sampled.
+"""
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+Z95 = 1.959964
+STRATA = ("volatile", "moderate", "static")
+
+def volatility(entry: Optional[dict]) -> str:
+    if not entry or not entry.get("signature"):
+        return "new"
+    rate = entry.get("changes", 0) / max(entry.get("runs", 1), 1)
+    return "volatile" if rate >= 0.5 else "moderate" if rate >= 0.1 else "static"
+
+def family_of(url: str, mirror_map=None) -> str:
+    site = urlunparse(urlparse(url)._replace(path="", params="", query="", fragment=""))
+    known = mirror_map.get(site) if mirror_map else None
+    return f"merchant:{known[0]}" if known else f"host:{urlparse(url).netloc}"
+
+def wilson(p: float, n: float, z: float = Z95) -> Tuple[float, float]:
+    """Wilson score interval for a proportion p observed over n trials."""
+    if n <= 0:
+        return 0.0, 1.0
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def skip_sample_size(skip_below: float, z: float = Z95) -> int:
+    """
+    Smallest sample that can decide "skip": with no change observed, Wilson's
+    upper bound is z^2 / (n + z^2), which drops below skip_below only from
+    this n on (73 families at 0.05).
+    """
+    if skip_below <= 0:
+        raise ValueError("skip_below must be positive")
+    return math.floor(z * z * (1 - skip_below) / skip_below) + 1
+
+@dataclass
+class SamplePlan:
+    # stratum -> family -> urls (file/priority order)
+    strata: Dict[str, Dict[str, List[str]]]
+    sample: List[str]
+
+    def family_count(self, stratum: str) -> int:
+        return len(self.strata.get(stratum, {}))
+
+@dataclass
+class Estimate:
+    changed: float
+    low: float
+    high: float
+    observed: int
+    by_stratum: Dict[str, Tuple[int, int]] = field(default_factory=dict)  # stratum -> (changed, observed)
+
+def plan_sample(urls: List[str], cache: dict, size: int, mirror_map=None, rng: Optional[random.Random] = None) -> SamplePlan:
+    """Proportional allocation over the volatility strata, at least one family per non-empty stratum."""
+    rng = rng or random.Random()
+    sites = cache.get("sites", {})
+    families: Dict[str, List[str]] = {}
+    for url in urls:
+        families.setdefault(family_of(url, mirror_map), []).append(url)
+    strata: Dict[str, Dict[str, List[str]]] = {}
+    for family, members in families.items():
+        # A family is as volatile as its first member with history.
+        stratum = next((v for v in (volatility(sites.get(u)) for u in members) if v != "new"), "new")
+        strata.setdefault(stratum, {})[family] = members
+    total = sum(len(strata.get(s, {})) for s in STRATA)
+    sample = []
+    for stratum in STRATA:
+        names = sorted(strata.get(stratum, {}))
+        if not names:
+            continue
+        n_h = min(len(names), max(1, round(size * len(names) / total)))
+        for family in rng.sample(names, n_h):
+            # Only a member with a previous bonus set can tell whether it changed.
+            known = [u for u in strata[stratum][family] if volatility(sites.get(u)) != "new"]
+            sample.append(rng.choice(known))
+    return SamplePlan(strata, sample)
+
+def estimate(plan: SamplePlan, changed: Dict[str, Optional[bool]]) -> Estimate:
+    """
+    Stratified estimate of the changed share, weighting each stratum by its
+    family count. The interval is Wilson's at the effective sample size implied
+    by the stratified variance, capped at the sample size; both carry the
+    finite-population correction, so sampling every family pins the share
+    exactly. Sites whose scrape failed (None) are left out.
+    """
+    total = sum(plan.family_count(s) for s in STRATA)
+    p, var, observed, by_stratum = 0.0, 0.0, 0, {}
+    for stratum in STRATA:
+        urls = set(u for family in plan.strata.get(stratum, {}).values() for u in family)
+        seen = [changed[u] for u in plan.sample if u in urls and changed.get(u) is not None]
+        if not seen:
+            continue
+        n_h, N_h = len(seen), plan.family_count(stratum)
+        p_h = sum(seen) / n_h
+        w_h = N_h / total
+        p += w_h * p_h
+        if n_h > 1:
+            var += w_h * w_h * (1 - n_h / N_h) * p_h * (1 - p_h) / (n_h - 1)
+        observed += n_h
+        by_stratum[stratum] = (sum(seen), n_h)
+    if not observed:
+        return Estimate(0.0, 0.0, 1.0, 0)
+    # Only the sampled strata carry weight; rescale to them.
+    families = sum(plan.family_count(s) for s in by_stratum)
+    covered = families / total
+    p, var = p / covered, var / (covered * covered)
+    if observed >= families:
+        return Estimate(round(p, 4), round(p, 4), round(p, 4), observed, by_stratum)  # a census, not a sample
+    n_fpc = observed * (families - 1) / (families - observed)
+    n_eff = min(p * (1 - p) / var, n_fpc) if var > 0 else n_fpc
+    low, high = wilson(p, n_eff)
+    return Estimate(round(p, 4), round(low, 4), round(high, 4), observed, by_stratum)
+
+def decide(est: Estimate, skip_below: float, full_above: float) -> str:
+    """skip when even the upper bound is quiet, full when even the lower bound is busy, targeted otherwise."""
+    if not est.observed:
+        return "full"
+    if est.high < skip_below:
+        return "skip"
+    if est.low > full_above:
+        return "full"
+    return "targeted"
+
+def targets(plan: SamplePlan, est: Estimate) -> List[str]:
+    """Sites for a targeted run: every stratum where the sample saw a change, plus new sites."""
+    keep = {s for s, (hits, _) in est.by_stratum.items() if hits} | {"new"}
+    return [u for s in keep for family in plan.strata.get(s, {}).values() for u in family]
@@ -0,0 +1,107 @@
+# scheduler.py
+"""
+Orders a run's URLs by expected value using the per-site history in the run
+cache (data/run_metrics_cache.json, the layout bonus.py introduced), so the
+productive sites finish in the first minutes and a --time-budget cut-off
+drops the least valuable ones.
+
+    score = yield * p_ok * (1 + change_rate) * staleness
+
+  yield        bonuses per run, shrunk toward the fleet mean for short histories
+  p_ok         share of runs without an error (Laplace-smoothed)
+  change_rate  share of runs whose bonus set differed from the previous run
+  staleness    1 + hours since the site last ran / STALE_HOURS, capped
+
+A site with no history scores as an average site that is maximally stale,
+so new URLs are tried early instead of starving behind the known ones.
+"""
+import datetime
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+PRIOR_RUNS = 2.0
+STALE_HOURS = 24.0
+MAX_STALENESS = 3.0
+
+def _age_hours(entry: dict, now: datetime.datetime) -> Optional[float]:
+    ts = entry.get("last_processed_ts")
+    if not ts:
+        return None
+    try:
+        return max((now - datetime.datetime.fromisoformat(ts)).total_seconds() / 3600, 0.0)
+    except ValueError:
+        return None
+
+def _runs(entry: dict, total_runs: int) -> int:
+    # Legacy entries predate "runs"; their sites ran in every recorded run.
+    return max(int(entry.get("runs", total_runs)), 1)
+
+def mean_yield(cache: dict) -> float:
+    total_runs = cache.get("total_script_runs", 0)
+    rates = [e.get("cumulative_total_bonuses", 0) / _runs(e, total_runs) for e in cache.get("sites", {}).values()]
+    return sum(rates) / len(rates) if rates else 1.0
+
+def site_score(entry: Optional[dict], now: datetime.datetime, prior_yield: float, total_runs: int = 0) -> float:
+    if not entry:
+        return prior_yield * 0.5 * 1.5 * MAX_STALENESS
+    runs = _runs(entry, total_runs)
+    errors = min(entry.get("cumulative_total_errors", 0), runs)
+    yield_ = (entry.get("cumulative_total_bonuses", 0) + PRIOR_RUNS * prior_yield) / (runs + PRIOR_RUNS)
+    p_ok = (runs - errors + 1) / (runs + 2)
+    change_rate = (entry.get("changes", 0) + 1) / (runs + 2)
+    age = _age_hours(entry, now)
+    staleness = MAX_STALENESS if age is None else min(1 + age / STALE_HOURS, MAX_STALENESS)
+    return yield_ * p_ok * (1 + change_rate) * staleness
+
+def prioritize(urls: Iterable[str], cache: dict, now: Optional[datetime.datetime] = None) -> List[str]:
+    """URLs sorted by descending score; ties keep file order."""
+    now = now or datetime.datetime.now()
+    sites: Dict[str, dict] = cache.get("sites", {})
+    prior, total_runs = mean_yield(cache), cache.get("total_script_runs", 0)
+    urls = list(urls)
+    scores = {url: site_score(sites.get(url), now, prior, total_runs) for url in urls}
+    return sorted(urls, key=lambda url: -scores[url])
+
+def bonus_signature(bonuses) -> str:
+    """Order-independent fingerprint of a site's bonus set (ids and amounts)."""
+    items = sorted(f"{b.id}:{b.amount}" for b in bonuses)
+    return f"{zlib.crc32(chr(31).join(items).encode()):08x}"
+
+def record_result(cache: dict, url: str, success: bool, count: int, signature: Optional[str],
+                  now: Optional[datetime.datetime] = None, downlines: int = 0) -> bool:
+    """
+    Folds one site's outcome into the cache, keeping the legacy bonus.py
+    fields current. Returns True when the bonus set changed since the last
+    successful run.
+    """
+    total_runs = cache.get("total_script_runs", 0)
+    entry = cache.setdefault("sites", {}).setdefault(url, {
+        "last_run_new_bonuses": 0, "cumulative_total_bonuses": 0,
+        "last_run_new_downlines": 0, "cumulative_total_downlines": 0,
+        "last_run_new_errors": 0, "cumulative_total_errors": 0, "runs": 0,
+    })
+    entry["runs"] = entry.get("runs", max(total_runs - 1, 0)) + 1
+    entry["last_run_new_bonuses"] = count
+    entry["cumulative_total_bonuses"] = entry.get("cumulative_total_bonuses", 0) + count
+    entry["last_run_new_downlines"] = downlines
+    entry["cumulative_total_downlines"] = entry.get("cumulative_total_downlines", 0) + downlines
+    entry["last_run_new_errors"] = 0 if success else 1
+    entry["cumulative_total_errors"] = entry.get("cumulative_total_errors", 0) + (0 if success else 1)
+    changed = False
+    if success and signature is not None:
+        changed = entry.get("signature") not in (None, signature)
+        if changed:
+            entry["changes"] = entry.get("changes", 0) + 1
+        entry["signature"] = signature
+    entry["last_processed_ts"] = (now or datetime.datetime.now()).isoformat()
+    return changed
+
+def update_interval(entry: dict, success: bool, changed: bool, initial: float, lo: float, hi: float) -> float:
+    """
+    Refresh interval for daemon mode, adapted to how often the site actually
+    changes: halved when its bonus set changed, grown by half when it did not,
+    doubled after a failure (back off dead or blocking sites). Kept in [lo, hi].
+    """
+    factor = 2.0 if not success else 0.5 if changed else 1.5
+    entry["interval"] = round(min(max(entry.get("interval", initial) * factor, lo), hi), 1)
+    return entry["interval"]
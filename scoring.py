@@ -0,0 +1,120 @@
+# scoring.py
+import argparse
+import datetime
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import select, func, bindparam
+from sqlalchemy.engine import Engine
+
+from models import Bonus
+
+# Assumed average house edge of the games the rollover is played through.
+HOUSE_EDGE = 0.05
+CHUNK_SIZE = 20000
+
+SCORE_INPUTS = [
+    "amount", "bonus_fixed", "rollover", "min_withdraw", "max_withdraw", "min_topup",
+    "topup_req_amount", "loss_req_amount", "loss_req_percent",
+]
+
+def _expected_value(c: Dict[str, Any], minimum: Callable, where: Callable, house_edge: float):
+    """
+    Expected value of claiming a bonus, written once for both scalars and numpy arrays:
+      credit   = bonus_fixed, or amount when no fixed bonus is given
+      stake    = deposit needed (min_topup or the TOPUP_ requirement)
+      cashout  = credit, capped by max_withdraw when one is set
+      reach    = 1 if credit covers min_withdraw, else credit / min_withdraw
+      cost     = house_edge * rollover * credit + loss requirement (absolute or % of stake)
+      ev       = cashout * reach - cost
+    """
+    credit = where(c["bonus_fixed"] > 0, c["bonus_fixed"], c["amount"])
+    stake = where(c["topup_req_amount"] > c["min_topup"], c["topup_req_amount"], c["min_topup"])
+    cashout = where(c["max_withdraw"] > 0, minimum(credit, c["max_withdraw"]), credit)
+    reach = where(c["min_withdraw"] > credit, credit / where(c["min_withdraw"] > 0, c["min_withdraw"], 1.0), 1.0)
+    loss = c["loss_req_amount"] + c["loss_req_percent"] / 100.0 * stake
+    return cashout * reach - house_edge * c["rollover"] * credit - loss
+
+def score_columns(columns: Dict[str, Sequence[Optional[float]]], house_edge: float = HOUSE_EDGE) -> List[float]:
+    """Scores whole columns at once; uses numpy when installed, plain Python otherwise."""
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is not None:
+        arrays = {k: np.nan_to_num(np.asarray(columns[k], dtype=float)) for k in SCORE_INPUTS}
+        return np.round(_expected_value(arrays, np.minimum, np.where, house_edge), 4).tolist()
+
+    def where(cond, a, b): return a if cond else b
+    rows = zip(*[columns[k] for k in SCORE_INPUTS])
+    return [
+        round(_expected_value({k: v or 0.0 for k, v in zip(SCORE_INPUTS, values)}, min, where, house_edge), 4)
+        for values in rows
+    ]
+
+def score_bonuses(bonuses: List[Bonus], house_edge: float = HOUSE_EDGE) -> List[Bonus]:
+    """Sets value_score on a batch of freshly processed bonuses."""
+    if not bonuses:
+        return bonuses
+    columns = {k: [getattr(b, k) for b in bonuses] for k in SCORE_INPUTS}
+    for b, score in zip(bonuses, score_columns(columns, house_edge)):
+        b.value_score = score
+    return bonuses
+
+def rescore_all(engine: Engine, house_edge: float = HOUSE_EDGE, only_missing: bool = False) -> int:
+    """Recomputes value_score for stored rows in column-wise chunks. Returns rows updated."""
+    import store
+
+    table = Bonus.__table__
+    updated, last_id = 0, 0
+    while True:
+        query = select(table.c.db_id, *[table.c[k] for k in SCORE_INPUTS]).where(table.c.db_id > last_id)
+        if only_missing:
+            query = query.where(table.c.value_score.is_(None))
+        with engine.begin() as conn:
+            rows = conn.execute(query.order_by(table.c.db_id).limit(CHUNK_SIZE)).all()
+            if not rows:
+                return updated
+            columns = dict(zip(["db_id", *SCORE_INPUTS], zip(*rows)))
+            scores = score_columns(columns, house_edge)
+            conn.execute(
+                table.update().where(table.c.db_id == bindparam("b_db_id")).values(value_score=bindparam("b_score")),
+                [{"b_db_id": i, "b_score": s} for i, s in zip(columns["db_id"], scores)],
+            )
+            store.mark_changed(conn, [(store.ALL, store.ALL)])
+        updated += len(rows)
+        last_id = rows[-1][0]
+
+def top_bonuses(db_url: str, k: int = 50, run_date: Optional[datetime.date] = None) -> List[Dict[str, Any]]:
+    """
+    Best k bonuses of a run (the latest stored run by default), read straight
+    off ix_bonuses_run_date_value_score: a k-row index range, not a table scan.
+    """
+    import store
+
+    table = Bonus.__table__
+    with store.get_engine(db_url).connect() as conn:
+        day = run_date.isoformat() if run_date else conn.execute(select(func.max(table.c.run_date))).scalar()
+        query = (
+            select(table).where(table.c.run_date == day, table.c.value_score.is_not(None))
+            .order_by(table.c.value_score.desc()).limit(k)
+        )
+        return [dict(r) for r in conn.execute(query).mappings()]
+
+if __name__ == "__main__":
+    import config
+    import store
+
+    parser = argparse.ArgumentParser(description="Rank stored bonuses by expected value.")
+    parser.add_argument("--top", type=int, default=50, help="Number of bonuses to show.")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="Run date, YYYY-MM-DD (default: latest).")
+    parser.add_argument("--rescore", action="store_true", help="Recompute every stored score first.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    db_url = config.get_config().get("output", "db_connection_string")
+    if args.rescore:
+        print(f"Rescored {rescore_all(store.get_engine(db_url))} rows")
+    for rank, b in enumerate(top_bonuses(db_url, args.top, args.date), 1):
+        print(f"{rank:>3}. {b['value_score']:>10.2f}  {b['url']:<35} {(b['name'] or '')[:50]}")
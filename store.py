@@ -0,0 +1,225 @@
+# store.py
+import datetime
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+from sqlalchemy import case, create_engine, inspect, text, select, bindparam, delete, func, tuple_
+from sqlalchemy.engine import Engine, Connection
+
+from models import Base, Bonus, BonusPartition, SiteRun
+
+_KEY = ("run_date", "url", "id")
+# Wildcard in a bonus_partitions key: every merchant and/or every day.
+ALL = "*"
+
+_engines: Dict[str, Engine] = {}
+# Upserts through this process; the read API's write generation where the
+# database has no cheaper change counter (SQLite uses PRAGMA data_version).
+write_generation = 0
+
+def get_engine(db_url: str) -> Engine:
+    """Returns a cached engine for db_url, creating and migrating the schema on first use."""
+    engine = _engines.get(db_url)
+    if engine is None:
+        engine = create_engine(db_url)
+        if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+            os.makedirs(os.path.dirname(os.path.abspath(engine.url.database)), exist_ok=True)
+            # WAL: readers (read API, dashboards) no longer block the writer or each other.
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        Base.metadata.create_all(engine)
+        migrate(engine)
+        _engines[db_url] = engine
+    return engine
+
+def migrate(engine: Engine, logger: logging.Logger = None):
+    """
+    Brings an existing bonuses table up to the current model: adds missing
+    columns, backfills run_date/updated_at/content_hash/changed for old rows, collapses duplicate
+    (run_date, url, id) rows to the newest one and creates indexes.
+    """
+    logger = logger or logging.getLogger("slapdotred_scraper")
+    table = Bonus.__table__
+    inspector = inspect(engine)
+    existing = {c["name"] for c in inspector.get_columns(table.name)}
+    existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+    missing = [c for c in table.columns if c.name not in existing]
+
+    removed = 0
+    with engine.begin() as conn:
+        for column in missing:
+            col_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+            logger.info("db_migrate_add_column", extra={"column": column.name})
+        if "run_date" in (c.name for c in missing):
+            conn.execute(text(f"UPDATE {table.name} SET run_date = substr(created_at, 1, 10) WHERE run_date IS NULL"))
+        if "updated_at" in (c.name for c in missing):
+            conn.execute(text(f"UPDATE {table.name} SET updated_at = created_at WHERE updated_at IS NULL"))
+        if "uq_bonuses_run_date_url_id" not in existing_indexes:
+            removed = conn.execute(text(
+                f"DELETE FROM {table.name} WHERE db_id NOT IN "
+                f"(SELECT MAX(db_id) FROM {table.name} GROUP BY run_date, url, id)"
+            )).rowcount
+            if removed:
+                logger.info("db_migrate_dedupe", extra={"rows_removed": removed})
+        if missing or removed:
+            mark_changed(conn, [(ALL, ALL)])
+
+    if "content_hash" in (c.name for c in missing):
+        _backfill_content_hash(engine)
+    if "changed" in (c.name for c in missing):
+        # Old rows against the same bonus on the last earlier day their site had rows.
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"UPDATE {table.name} SET changed = ("
+                f"SELECT p.content_hash <> {table.name}.content_hash FROM {table.name} p "
+                f"WHERE p.url = {table.name}.url AND p.id = {table.name}.id AND p.run_date = ("
+                f"SELECT MAX(q.run_date) FROM {table.name} q WHERE q.url = {table.name}.url AND q.run_date < {table.name}.run_date))"
+            ))
+    if "value_score" in (c.name for c in missing):
+        import scoring
+        scoring.rescore_all(engine, only_missing=True)
+
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
+
+def _backfill_content_hash(engine: Engine, chunk_size: int = 5000):
+    from processing import content_hash
+
+    table = Bonus.__table__
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table).where(table.c.db_id > last_id, table.c.content_hash.is_(None))
+                .order_by(table.c.db_id).limit(chunk_size)
+            ).mappings().all()
+            if not rows:
+                return
+            conn.execute(
+                table.update().where(table.c.db_id == bindparam("b_db_id")).values(content_hash=bindparam("b_hash")),
+                [{"b_db_id": r["db_id"], "b_hash": content_hash(r)} for r in rows],
+            )
+            mark_changed(conn, [(ALL, ALL)])
+            last_id = rows[-1]["db_id"]
+
+def bonus_row(bonus: Bonus, now: datetime.datetime) -> Dict[str, Any]:
+    """Column values for an insert, with model defaults applied to unset fields."""
+    row = {}
+    for c in Bonus.__table__.columns:
+        if c.name == "db_id":
+            continue
+        value = getattr(bonus, c.name)
+        if value is None and c.default is not None:
+            value = now if c.name in ("created_at", "updated_at") else c.default.arg
+        row[c.name] = value
+    return row
+
+def upsert_bonuses(conn: Connection, rows: List[Dict[str, Any]]):
+    """
+    Inserts rows, replacing the content of any existing row with the same
+    (run_date, url, id). created_at keeps the first time the bonus was seen that
+    day; updated_at moves only when the content hash changes. changed compares
+    each row with the same bonus in its site's previous run.
+    """
+    global write_generation
+    write_generation += 1
+    table = Bonus.__table__
+    _compare_with_previous_run(conn, rows)
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        updates = {c.name: stmt.excluded[c.name] for c in table.columns if c.name not in ("db_id", "created_at", *_KEY)}
+        updates["updated_at"] = case((table.c.content_hash == stmt.excluded.content_hash, table.c.updated_at),
+                                     else_=stmt.excluded.updated_at)
+        conn.execute(stmt.on_conflict_do_update(index_elements=list(_KEY), set_=updates), rows)
+    else:
+        keys = [tuple(r[k] for k in _KEY) for r in rows]
+        conn.execute(delete(table).where(tuple_(*[table.c[k] for k in _KEY]).in_(keys)))
+        conn.execute(table.insert(), rows)
+    mark_changed(conn, {(r["merchant_name"], r["run_date"]) for r in rows})
+
+def _compare_with_previous_run(conn: Connection, rows: List[Dict[str, Any]]):
+    """
+    Sets changed on rows: whether the content hash differs from the same bonus
+    in the site's previous run (the last earlier site_runs day, or for sites
+    from before site runs were recorded, the last earlier day with rows), None
+    if the bonus was not in it. Two index reads per site written.
+    """
+    bonuses, runs = Bonus.__table__, SiteRun.__table__
+    by_site: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_site.setdefault((row["url"], row["run_date"]), []).append(row)
+    for (url, day), site_rows in by_site.items():
+        previous = conn.execute(select(func.max(runs.c.run_date)).where(runs.c.url == url, runs.c.run_date < day)
+                                .union_all(select(func.max(bonuses.c.run_date)).where(bonuses.c.url == url, bonuses.c.run_date < day))
+                                ).scalars().all()
+        previous = max((d for d in previous if d is not None), default=None)
+        hashes = {}
+        if previous is not None:
+            hashes = dict(conn.execute(select(bonuses.c.id, bonuses.c.content_hash)
+                                       .where(bonuses.c.run_date == previous, bonuses.c.url == url)).all())
+        for row in site_rows:
+            row["changed"] = hashes[row["id"]] != row["content_hash"] if row["id"] in hashes else None
+
+def record_site_run(conn: Connection, url: str, run_date: str, bonus_count: int, now: datetime.datetime):
+    """Notes that url's bonus list was fetched for run_date (bonus_count may be 0); see models.SiteRun."""
+    table = SiteRun.__table__
+    conn.execute(delete(table).where(table.c.run_date == run_date, table.c.url == url))
+    conn.execute(table.insert(), [{"run_date": run_date, "url": url, "bonus_count": bonus_count, "fetched_at": now}])
+
+def mark_changed(conn: Connection, partitions: Iterable[Tuple[Optional[str], Optional[str]]]):
+    """
+    Bumps the version of the (merchant_name, run_date) partitions a write
+    touched, inside the writer's transaction, so readers can tell which slices
+    of bonuses moved (the read API drops only cache entries over those).
+    Everything that writes to bonuses calls it; ALL stands for every merchant or day.
+    """
+    table = BonusPartition.__table__
+    keys = {(merchant or "", day or ALL) for merchant, day in partitions}
+    if not keys:
+        return
+    # Replacing the rows draws fresh versions from the autoincrement key, so
+    # concurrent writers never hand out the same one.
+    conn.execute(delete(table).where(tuple_(table.c.merchant_name, table.c.run_date).in_(list(keys))))
+    conn.execute(table.insert(), [{"merchant_name": m, "run_date": d} for m, d in sorted(keys)])
+
+def changed_partitions(db_url: str, after: Optional[int]) -> Tuple[List[Tuple[str, str]], int]:
+    """Partitions written since version after, and the latest version (after=None: only the latter)."""
+    table = BonusPartition.__table__
+    with get_engine(db_url).connect() as conn:
+        if after is None:
+            return [], conn.execute(select(func.coalesce(func.max(table.c.version), 0))).scalar()
+        rows = conn.execute(select(table.c.merchant_name, table.c.run_date, table.c.version).where(table.c.version > after)).all()
+    return [(m, d) for m, d, _ in rows], max((v for _, _, v in rows), default=after)
+
+def query_bonuses(db_url: str, merchant: Optional[str] = None, url: Optional[str] = None, claim_type: Optional[str] = None,
+                  min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+                  since: Optional[datetime.datetime] = None, run_date: Optional[datetime.date] = None,
+                  limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Returns stored bonuses as dicts, newest first: latest run_date, then
+    created_at within the run (db_id breaks ties, so limit/offset pages are
+    stable). merchant, url, claim_type and run_date each lead an index that
+    ends in that order, so a page is an index walk with the remaining filters
+    (amount range, since: rows inserted or changed since then) checked on the
+    way; since alone uses updated_at.
+    """
+    table = Bonus.__table__
+    conditions = []
+    if merchant is not None: conditions.append(table.c.merchant_name == merchant)
+    if url is not None: conditions.append(table.c.url == url)
+    if claim_type is not None: conditions.append(table.c.claim_type == claim_type)
+    if min_amount is not None: conditions.append(table.c.amount >= min_amount)
+    if max_amount is not None: conditions.append(table.c.amount <= max_amount)
+    if since is not None: conditions.append(table.c.updated_at >= since)
+    if run_date is not None: conditions.append(table.c.run_date == run_date.isoformat())
+
+    query = select(table).where(*conditions).order_by(table.c.run_date.desc(), table.c.created_at.desc(), table.c.db_id.desc()).limit(limit).offset(offset)
+    with get_engine(db_url).connect() as conn:
+        return [dict(r) for r in conn.execute(query).mappings()]
@@ -1,36 +1,148 @@
+import asyncio
+import math
+import shutil
 import sys
 import time
-from typing import Deque
+from typing import Deque, Dict, Optional, Set, TextIO
+
+import metrics
+
+def progress_bar(value: float, length: int = 30) -> str:
+    """Text progress bar with eighth-block resolution; value is 0..1."""
+    blocks = ["", "▏", "▎", "▍", "▌", "▋", "▊", "▉"]
+    v = min(max(value, 0.0), 1.0) * length
+    fill = "█" * math.floor(v) + blocks[int((v - math.floor(v)) * 8)]
+    return f"|{fill:<{length}}| {value * 100:5.1f}%"
+
+def _fmt_duration(seconds: Optional[float]) -> str:
+    if seconds is None or seconds == float("inf"):
+        return "--:--"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
 
 class UIHandler:
-    def __init__(self):
+    """
+    Live dashboard redrawn at a fixed rate from shared counters. update() and
+    site_started() only bump counters, so their cost does not depend on how
+    many sites are running; the redraw task does the (single) stdout write.
+    Nothing is drawn when stdout is not a terminal.
+    """
+    LINES = 4
+
+    def __init__(self, refresh_hz: float = 4.0, stream: TextIO = None, rate_window: float = 10.0):
         self.total = 0
         self.processed = 0
         self.errors = 0
         self.bonuses = 0
+        self.in_flight: Set[str] = set()
+        self.refresh_interval = 1.0 / refresh_hz if refresh_hz > 0 else 0.25
+        self.rate_window = rate_window
+        self.stream = stream or sys.stdout
+        self.tracker: Optional[Deque[float]] = None
+        self._started = time.time()
+        self._drawn = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def live(self) -> bool:
+        return self.stream.isatty() and self.total > 0
 
     def set_total_urls(self, total: int):
         self.total = total
         if total > 0:
-            print(f"Starting scrape of {total} URLs...")
+            print(f"Starting scrape of {total} URLs...", file=self.stream)
+
+    def start(self, tracker: Optional[Deque[float]] = None):
+        self.tracker = tracker
+        self._started = time.time()
+        if self.live:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="ui-refresh")
 
-    def update(self, url: str, success: bool, count: int, tracker: Deque[float]):
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self.redraw()
+
+    async def _run(self):
+        while True:
+            self.redraw()
+            await asyncio.sleep(self.refresh_interval)
+
+    def site_started(self, url: str):
+        self.in_flight.add(url)
+
+    def site_skipped(self):
+        """A site that will not run this time (time budget, sampling decision); it leaves the total."""
+        self.total = max(self.total - 1, self.processed)
+
+    def update(self, url: str, success: bool, count: int, tracker: Optional[Deque[float]] = None):
+        self.in_flight.discard(url)
         self.processed += 1
         self.bonuses += count
         if not success:
             self.errors += 1
+        if tracker is not None:
+            self.tracker = tracker
+
+    def request_rate(self, now: float) -> float:
+        """Requests per second over the last rate_window seconds, from the request tracker."""
+        if not self.tracker:
+            return 0.0
+        cutoff, recent = now - self.rate_window, 0
+        for ts in reversed(self.tracker):
+            if ts < cutoff:
+                break
+            recent += 1
+        return recent / min(self.rate_window, max(now - self._started, 1e-3))
+
+    def eta(self, now: float) -> Optional[float]:
+        elapsed = now - self._started
+        if not self.processed or elapsed <= 0:
+            return None
+        return (self.total - self.processed) / (self.processed / elapsed)
 
-        if not sys.stdout.isatty() or self.total == 0:
-            return
+    @staticmethod
+    def error_breakdown(limit: int = 4) -> Dict[str, int]:
+        """Top non-ok request outcomes ("login:captcha", ...) from the metrics registry."""
+        counts: Dict[str, int] = {}
+        for key, value in metrics.registry.stage_total.values.items():
+            labels = dict(key)
+            if labels["outcome"] != metrics.OK and labels["stage"] != "site":
+                counts[f"{labels['stage']}:{labels['outcome']}"] = int(value)
+        return dict(sorted(counts.items(), key=lambda kv: -kv[1])[:limit])
 
-        # Print a simple, single line for each update
-        status = "SUCCESS" if success else "FAIL"
-        progress = f"[{self.processed}/{self.total}]"
-        print(f"{progress:<12} {status:<8} | Bonuses: {count:<4} | URL: {url}")
+    def render(self, now: Optional[float] = None) -> str:
+        now = now or time.time()
+        done = self.processed / self.total if self.total else 0.0
+        in_flight = sorted(self.in_flight)
+        sample = ", ".join(in_flight[:3]) + (f" +{len(in_flight) - 3}" if len(in_flight) > 3 else "")
+        errors = "  ".join(f"{k}={v}" for k, v in self.error_breakdown().items()) or "-"
+        lines = [
+            f"{progress_bar(done)}  {self.processed}/{self.total} sites",
+            f"Bonuses: {self.bonuses:<6} Failed: {self.errors:<5} Rate: {self.request_rate(now):5.1f} req/s  "
+            f"Elapsed: {_fmt_duration(now - self._started)}  ETA: {_fmt_duration(self.eta(now))}",
+            f"In flight ({len(in_flight)}): {sample or '-'}",
+            f"Errors: {errors}",
+        ]
+        # redraw moves up exactly LINES rows, so no line may wrap on a narrow terminal;
+        # the last column stays free because some terminals wrap once it is written.
+        width = max(shutil.get_terminal_size((160, 24)).columns - 1, 1)
+        return "\n".join(line[:width] for line in lines)
 
+    def redraw(self):
+        frame = self.render()
+        prefix = f"\x1b[{self.LINES}A\x1b[J" if self._drawn else ""
+        self.stream.write(prefix + frame + "\n")
+        self.stream.flush()
+        self._drawn = True
 
     def final(self, found: int, failed: int):
-        print(f"\n{'='*40}\nScraping Complete")
-        print(f"Total Bonuses Found: {found}")
-        print(f"Failed URLs: {failed}")
-        print("="*40)
\ No newline at end of file
+        print(f"\n{'='*40}\nScraping Complete", file=self.stream)
+        print(f"Total Bonuses Found: {found}", file=self.stream)
+        print(f"Failed URLs: {failed}", file=self.stream)
+        print("="*40, file=self.stream)